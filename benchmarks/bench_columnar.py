@@ -0,0 +1,97 @@
+"""
+Benchmark loading the food_items export from CSV (csv.DictReader plus
+`_normalize_row`, what upload_supabase.py does) against the Parquet copy
+written by clean_data.py --parquet (memory-mapped, column-projected reads).
+
+Reports file sizes and load times for all columns and for a projection of
+three columns.
+
+    python benchmarks/bench_columnar.py [--rows 500000] [--output results.json]
+"""
+import argparse
+import csv
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BASE_DIR / "src"))
+sys.path.insert(0, str(BASE_DIR / "benchmarks"))
+
+from bench_upload_supabase import write_fixture  # noqa: E402
+from upload_supabase import (  # noqa: E402
+    DEFAULT_BATCH_SIZE,
+    FOOD_ITEM_FLOAT_FIELDS,
+    FOOD_ITEM_INT_FIELDS,
+    _stream_csv_batches,
+    _stream_parquet_batches,
+)
+from utils.columnar import FOOD_ITEM_EXPORT_SCHEMA, ParquetTableWriter  # noqa: E402
+
+PROJECTION = {"id", "price", "restaurant_id"}
+
+
+def csv_to_parquet(csv_path: Path, parquet_path: Path) -> None:
+    with csv_path.open(newline="", encoding="utf-8") as handle, \
+            ParquetTableWriter(parquet_path, FOOD_ITEM_EXPORT_SCHEMA) as writer:
+        for row in csv.DictReader(handle):
+            row["id"] = int(row["id"])
+            row["restaurant_id"] = int(row["restaurant_id"])
+            writer.write(row)
+
+
+def load(batches) -> int:
+    return sum(len(batch) for batch in batches)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="CSV vs Parquet load of the food_items export.")
+    parser.add_argument("--rows", type=int, default=500_000)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--output", type=Path, default=None, help="Write results as JSON to this path.")
+    args = parser.parse_args()
+
+    results = {"rows": args.rows, "batch_size": args.batch_size}
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = Path(tmp) / "food_items.csv"
+        parquet_path = Path(tmp) / "food_items.parquet"
+        write_fixture(csv_path, args.rows)
+        csv_to_parquet(csv_path, parquet_path)
+        results["csv_bytes"] = csv_path.stat().st_size
+        results["parquet_bytes"] = parquet_path.stat().st_size
+        print(f"csv {results['csv_bytes'] / 1e6:8.1f} MB   parquet {results['parquet_bytes'] / 1e6:8.1f} MB")
+
+        runs = {
+            "csv_all": lambda: _stream_csv_batches(
+                csv_path,
+                int_fields=FOOD_ITEM_INT_FIELDS,
+                float_fields=FOOD_ITEM_FLOAT_FIELDS,
+                batch_size=args.batch_size,
+            ),
+            "parquet_all": lambda: _stream_parquet_batches(parquet_path, batch_size=args.batch_size),
+            "csv_projected": lambda: _stream_csv_batches(
+                csv_path,
+                int_fields=FOOD_ITEM_INT_FIELDS,
+                float_fields=FOOD_ITEM_FLOAT_FIELDS,
+                batch_size=args.batch_size,
+                allowed_fields=PROJECTION,
+            ),
+            "parquet_projected": lambda: _stream_parquet_batches(
+                parquet_path, batch_size=args.batch_size, allowed_fields=PROJECTION
+            ),
+        }
+        for label, batches in runs.items():
+            started = time.perf_counter()
+            loaded = load(batches())
+            elapsed = time.perf_counter() - started
+            results[label] = {"rows": loaded, "seconds": round(elapsed, 3), "rows_per_s": round(loaded / elapsed)}
+            print(f"{label:<18} {loaded:>9} rows in {elapsed:7.2f}s  ({loaded / elapsed:,.0f} rows/s)")
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
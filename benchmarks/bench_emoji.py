@@ -0,0 +1,132 @@
+"""
+Benchmark the emoji tagging of the cleaning notebook (cell 4: per-category
+token loop, `.map` over the items and a `groupby(...).agg(lambda s: s.mode())`
+per restaurant) against utils.emoji_classifier.apply_emoji_images, on
+synthetic exports. Both must produce the same image columns.
+
+    python benchmarks/bench_emoji.py [--rows 1000000] [--categories 20000] [--output results.json]
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import time
+import unicodedata
+from pathlib import Path
+from typing import List
+
+import pandas as pd
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BASE_DIR / "src"))
+
+from clean_data import sanitize_text  # noqa: E402
+from utils.emoji_classifier import (  # noqa: E402
+    DEFAULT_EMOJI,
+    KEYWORD_TO_EMOJI,
+    EmojiClassifier,
+    apply_emoji_images,
+)
+
+FILLER = ["Clásicos", "Especiales", "de la casa", "Menú", "Promo", "2x1", "Favoritos", "para compartir", "Niños", "Café"]
+TOKEN_PATTERN = re.compile(r"[\w']+")
+
+
+def make_exports(rows: int, categories: int, items_per_restaurant: int, seed: int):
+    rng = random.Random(seed)
+    words = list(KEYWORD_TO_EMOJI) + [word.title() + "s" for word in KEYWORD_TO_EMOJI] + FILLER * 8
+    pool = [" ".join(rng.choices(words, k=rng.randint(1, 4))) for _ in range(categories)]
+    restaurants = max(1, rows // items_per_restaurant)
+    restaurant_ids = [str(rng.randrange(1, restaurants + 1)) for _ in range(rows)]
+    food_items_df = pd.DataFrame({
+        "id": [str(i) for i in range(1, rows + 1)],
+        "restaurant_id": restaurant_ids,
+        "category": [rng.choice(pool) if rng.random() > 0.02 else "" for _ in range(rows)],
+    })
+    restaurants_df = pd.DataFrame({"id": [str(i) for i in range(1, restaurants + 1)]})
+    return restaurants_df, food_items_df
+
+
+def ascii_tokens(text: str) -> List[str]:
+    sanitized = sanitize_text(text)
+    normalized = unicodedata.normalize("NFKD", sanitized)
+    ascii_text = "".join(ch for ch in normalized if not unicodedata.combining(ch))
+    return [token.lower() for token in TOKEN_PATTERN.findall(ascii_text)]
+
+
+def notebook_emoji_images(restaurants_df, food_items_df):
+    """The notebook's cell 4, unchanged apart from working on copies."""
+    restaurants_df = restaurants_df.copy()
+    food_items_df = food_items_df.copy()
+    emoji_mapping = {}
+    for category in sorted({cat for cat in food_items_df["category"] if cat}):
+        chosen = DEFAULT_EMOJI
+        for token in ascii_tokens(category):
+            if token in KEYWORD_TO_EMOJI:
+                chosen = KEYWORD_TO_EMOJI[token]
+                break
+            if token.endswith("s") and token[:-1] in KEYWORD_TO_EMOJI:
+                chosen = KEYWORD_TO_EMOJI[token[:-1]]
+                break
+        emoji_mapping[category] = chosen
+
+    food_items_df["image"] = food_items_df["category"].map(lambda cat: emoji_mapping.get(cat, DEFAULT_EMOJI))
+    restaurant_emoji = (
+        food_items_df.groupby("restaurant_id")["image"].agg(
+            lambda series: series.mode().iat[0] if not series.mode().empty else DEFAULT_EMOJI
+        )
+    ).to_dict()
+    restaurants_df["image"] = restaurants_df["id"].map(restaurant_emoji).fillna(DEFAULT_EMOJI)
+    restaurant_image_map = restaurants_df.set_index("id")["image"].to_dict()
+
+    default_mask = food_items_df["image"] == DEFAULT_EMOJI
+    if default_mask.any():
+        fallback = food_items_df.loc[default_mask, "restaurant_id"].map(restaurant_image_map)
+        fallback = fallback.mask(fallback == DEFAULT_EMOJI)
+        food_items_df.loc[default_mask, "image"] = fallback.fillna(DEFAULT_EMOJI)
+    return restaurants_df, food_items_df
+
+
+def timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - started, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Notebook emoji tagging vs utils.emoji_classifier.")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--categories", type=int, default=20_000, help="Distinct category strings.")
+    parser.add_argument("--items-per-restaurant", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=Path, default=None, help="Write results as JSON to this path.")
+    args = parser.parse_args()
+
+    restaurants_df, food_items_df = make_exports(args.rows, args.categories, args.items_per_restaurant, args.seed)
+    print(f"{len(food_items_df):,} food items, {len(restaurants_df):,} restaurants, "
+          f"{food_items_df['category'].nunique():,} categories")
+
+    notebook_seconds, expected = timed(notebook_emoji_images, restaurants_df, food_items_df)
+    classifier_seconds, actual = timed(apply_emoji_images, restaurants_df, food_items_df, EmojiClassifier())
+    for (name, expected_df), actual_df in zip((("restaurants", expected[0]), ("food_items", expected[1])), actual):
+        if not expected_df["image"].equals(actual_df["image"]):
+            raise SystemExit(f"{name}.image differs between the notebook and the classifier")
+
+    results = {
+        "rows": args.rows,
+        "restaurants": len(restaurants_df),
+        "categories": args.categories,
+        "notebook_seconds": round(notebook_seconds, 3),
+        "classifier_seconds": round(classifier_seconds, 3),
+        "speedup": round(notebook_seconds / classifier_seconds, 1),
+        "rows_per_second": round(args.rows / classifier_seconds),
+    }
+    print(f"notebook   {notebook_seconds:8.2f}s")
+    print(f"classifier {classifier_seconds:8.2f}s  ({results['speedup']}x, {results['rows_per_second']:,} rows/s)")
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Micro-benchmark for utils.html_utils.parse_html against the BeautifulSoup parse
+it replaces in 04_extraer_comida_restaurante.py.
+
+Uses checkpoint.html (a real Uber Eats page) as the fixture. The page has no
+JSON-LD block of its own, so a synthetic menu is injected right before
+</body>, which is the worst case for the scanner.
+
+    python benchmarks/bench_parse_html.py [--repeat 20]
+"""
+import argparse
+import json
+import sys
+import timeit
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BASE_DIR / "src"))
+
+from utils.html_utils import parse_html  # noqa: E402
+
+FIXTURE = BASE_DIR / "checkpoint.html"
+
+
+def synthetic_menu(sections: int = 20, items_per_section: int = 15) -> dict:
+    return {
+        "@context": "https://schema.org",
+        "@type": "Restaurant",
+        "name": "Benchmark Restaurant",
+        "hasMenu": {
+            "@type": "Menu",
+            "hasMenuSection": [
+                {
+                    "@type": "MenuSection",
+                    "name": f"Section {s}",
+                    "hasMenuItem": [
+                        {
+                            "@type": "MenuItem",
+                            "name": f"Item {s}-{i}",
+                            "description": "Descripción de prueba con acentos y ñ " * 3,
+                            "offers": {"@type": "Offer", "price": str(1000 + i * 100), "priceCurrency": "CLP"},
+                        }
+                        for i in range(items_per_section)
+                    ],
+                }
+                for s in range(sections)
+            ],
+        },
+    }
+
+
+def build_fixture() -> str:
+    html = FIXTURE.read_text(encoding="utf-8")
+    block = '<script type="application/ld+json">' + json.dumps(synthetic_menu(), ensure_ascii=False) + "</script>"
+    index = html.rfind("</body>")
+    if index == -1:
+        return html + block
+    return html[:index] + block + html[index:]
+
+
+def soup_extract(html: str):
+    soup = BeautifulSoup(html, "html.parser")
+    tag = soup.find("script", type="application/ld+json")
+    return tag.string if tag else None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with_block = build_fixture()
+    without_block = FIXTURE.read_text(encoding="utf-8")
+
+    assert json.loads(parse_html(with_block)) == json.loads(soup_extract(with_block))
+    assert parse_html(without_block) is None
+
+    print(f"Fixture: {FIXTURE.name} ({len(with_block) / 1024:.0f} KiB with JSON-LD)")
+    cases = [
+        ("parse_html (JSON-LD present)", lambda: parse_html(with_block)),
+        ("parse_html (no JSON-LD)", lambda: parse_html(without_block)),
+        ("BeautifulSoup html.parser", lambda: soup_extract(with_block)),
+    ]
+    timings = {}
+    for label, func in cases:
+        best = min(timeit.repeat(func, number=1, repeat=args.repeat))
+        timings[label] = best
+        print(f"  {label:<32} {best * 1000:9.2f} ms")
+    speedup = timings["BeautifulSoup html.parser"] / timings["parse_html (JSON-LD present)"]
+    print(f"  speedup vs BeautifulSoup: {speedup:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
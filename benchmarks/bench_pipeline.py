@@ -0,0 +1,313 @@
+"""
+End-to-end offline benchmark suite for the menu pipeline.
+
+Starts the local stand-in server (benchmarks/standin_server.py) and runs each
+scenario in a fresh process, so CPU time and peak RSS are per scenario:
+
+    scrape_menu        04's scrape_menu_restaurante, one request at a time
+    fetch_async        utils.async_fetch.fetch_all + extraer_json_ld (--async path)
+    flatten_scraper    04's aplanar_productos over synthetic menus
+    flatten_cleaning   clean_data's parse_payload + write_exports (the notebook's mapping)
+    stream_csv         upload_supabase._stream_csv_batches over a food_items.csv
+
+Results go to benchmarks/results/pipeline-<timestamp>.json (or --output);
+--compare prints the change in throughput against an earlier results file.
+
+    python benchmarks/bench_pipeline.py [--requests 200] [--latency 0.02] [--rate-429 0.02]
+    python benchmarks/bench_pipeline.py --compare benchmarks/results/pipeline-20251108-120000.json
+"""
+import argparse
+import asyncio
+import contextlib
+import importlib.util
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, Optional
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BASE_DIR / "src"))
+sys.path.insert(0, str(BASE_DIR / "benchmarks"))
+
+from standin_server import StandInConfig, StandInServer, synthetic_menu  # noqa: E402
+
+RESULTS_DIR = BASE_DIR / "benchmarks" / "results"
+MENU_SCRAPER = BASE_DIR / "uber" / "scraper" / "04_extraer_comida_restaurante.py"
+# Throughput figures compared by --compare (higher is better).
+RATE_KEYS = ("requests_per_s", "items_per_s", "rows_per_s")
+
+
+def load_menu_scraper():
+    spec = importlib.util.spec_from_file_location("menu_scraper", MENU_SCRAPER)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@contextlib.contextmanager
+def measured(result: Dict[str, Any]) -> Iterator[None]:
+    """Record wall and CPU seconds of the block into `result`."""
+    wall, cpu = time.perf_counter(), time.process_time()
+    yield
+    result["wall_seconds"] = round(time.perf_counter() - wall, 4)
+    result["cpu_seconds"] = round(time.process_time() - cpu, 4)
+
+
+def _rate(result: Dict[str, Any], key: str, count: int) -> None:
+    result[key] = round(count / result["wall_seconds"], 1) if result["wall_seconds"] else 0.0
+
+
+def _menu_items(data: Optional[Dict[str, Any]]) -> int:
+    if not data:
+        return 0
+    return sum(len(section.get("hasMenuItem", [])) for section in data.get("hasMenu", {}).get("hasMenuSection", []))
+
+
+def _synthetic_menus(count: int, params: Dict[str, Any]) -> list:
+    rng = random.Random(params["seed"])
+    return [
+        synthetic_menu(rng, rng.randint(params["min_items"], params["max_items"]), url=f"/cl/store/r/{n}")
+        for n in range(count)
+    ]
+
+
+# ==============================================================================
+# Scenarios (each runs in its own process)
+# ==============================================================================
+
+def scenario_scrape_menu(params: Dict[str, Any], base_url: str) -> Dict[str, Any]:
+    scraper = load_menu_scraper()
+    urls = [f"{base_url}/cl/store/restaurante-{n}/{n}" for n in range(params["requests"])]
+    result: Dict[str, Any] = {"requests": len(urls), "menus": 0, "items": 0, "blocks": 0, "errors": 0}
+    with measured(result):
+        for url in urls:
+            try:
+                data = scraper.scrape_menu_restaurante(url, scraper.construir_headers())
+            except ConnectionRefusedError:
+                result["blocks"] += 1
+                continue
+            if data:
+                result["menus"] += 1
+                result["items"] += _menu_items(data)
+            else:
+                result["errors"] += 1
+    _rate(result, "requests_per_s", result["requests"])
+    _rate(result, "items_per_s", result["items"])
+    return result
+
+
+def scenario_fetch_async(params: Dict[str, Any], base_url: str) -> Dict[str, Any]:
+    scraper = load_menu_scraper()
+    from utils.async_fetch import fetch_all
+
+    urls = [f"{base_url}/cl/store/restaurante-{n}/{n}" for n in range(params["requests"])]
+    result: Dict[str, Any] = {
+        "requests": len(urls), "menus": 0, "items": 0, "blocks": 0, "errors": 0, "concurrency": params["concurrency"],
+    }
+
+    async def run() -> None:
+        async for fetched in fetch_all(urls, headers_factory=scraper.construir_headers, concurrency=params["concurrency"]):
+            if fetched.blocked:
+                result["blocks"] += 1
+            elif not fetched.ok:
+                result["errors"] += 1
+            else:
+                data = scraper.extraer_json_ld(fetched.text, fetched.url)
+                result["menus"] += 1 if data else 0
+                result["items"] += _menu_items(data)
+
+    with measured(result):
+        asyncio.run(run())
+    _rate(result, "requests_per_s", result["requests"])
+    _rate(result, "items_per_s", result["items"])
+    return result
+
+
+def scenario_flatten_scraper(params: Dict[str, Any], base_url: str) -> Dict[str, Any]:
+    scraper = load_menu_scraper()
+    menus = _synthetic_menus(params["menus"], params)
+    result: Dict[str, Any] = {"menus": len(menus)}
+    with measured(result):
+        rows = scraper.aplanar_productos(menus)
+    result["items"] = len(rows)
+    _rate(result, "items_per_s", result["items"])
+    return result
+
+
+def scenario_flatten_cleaning(params: Dict[str, Any], base_url: str) -> Dict[str, Any]:
+    from clean_data import CleaningStats, parse_payload, write_exports
+
+    menus = _synthetic_menus(params["menus"], params)
+    stats = CleaningStats()
+    result: Dict[str, Any] = {"menus": len(menus)}
+    with tempfile.TemporaryDirectory() as tmp, measured(result):
+        payloads = (parsed for parsed in map(parse_payload, menus) if parsed is not None)
+        write_exports(
+            payloads,
+            Path(tmp) / "restaurants.csv",
+            Path(tmp) / "food_items.csv",
+            timestamp="2025-11-08T00:00:00+00:00",
+            stats=stats,
+        )
+    result["items"] = stats.food_item_rows
+    result["restaurant_rows"] = stats.restaurant_rows
+    _rate(result, "items_per_s", result["items"])
+    return result
+
+
+def scenario_stream_csv(params: Dict[str, Any], base_url: str) -> Dict[str, Any]:
+    from bench_upload_supabase import write_fixture
+    from upload_supabase import DEFAULT_BATCH_SIZE, FOOD_ITEM_FLOAT_FIELDS, FOOD_ITEM_INT_FIELDS, _stream_csv_batches
+
+    result: Dict[str, Any] = {"rows": 0}
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = Path(tmp) / "food_items.csv"
+        write_fixture(csv_path, params["csv_rows"])
+        result["csv_bytes"] = csv_path.stat().st_size
+        with measured(result):
+            for batch in _stream_csv_batches(
+                csv_path,
+                int_fields=FOOD_ITEM_INT_FIELDS,
+                float_fields=FOOD_ITEM_FLOAT_FIELDS,
+                batch_size=DEFAULT_BATCH_SIZE,
+            ):
+                result["rows"] += len(batch)
+    _rate(result, "rows_per_s", result["rows"])
+    return result
+
+
+SCENARIOS: Dict[str, Callable[[Dict[str, Any], str], Dict[str, Any]]] = {
+    "scrape_menu": scenario_scrape_menu,
+    "fetch_async": scenario_fetch_async,
+    "flatten_scraper": scenario_flatten_scraper,
+    "flatten_cleaning": scenario_flatten_cleaning,
+    "stream_csv": scenario_stream_csv,
+}
+
+
+def run_scenario(name: str, params: Dict[str, Any], base_url: str) -> Dict[str, Any]:
+    """Child-process entry point: run one scenario quietly and add its peak RSS."""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+        result = SCENARIOS[name](params, base_url)
+    # ru_maxrss is in KiB on Linux
+    result["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return result
+
+
+# ==============================================================================
+# Reporting
+# ==============================================================================
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_result(name: str, result: Dict[str, Any]) -> None:
+    rates = ", ".join(f"{key.replace('_per_s', '')}/s={result[key]:,.0f}" for key in RATE_KEYS if key in result)
+    extra = ""
+    if "blocks" in result:
+        extra = f"  blocks={result['blocks']} errors={result['errors']}"
+    print(
+        f"{name:<18} wall={result['wall_seconds']:8.2f}s  cpu={result['cpu_seconds']:8.2f}s  "
+        f"rss={result['peak_rss_mb']:7.1f}MB  {rates}{extra}"
+    )
+
+
+def compare(current: Dict[str, Any], previous: Dict[str, Any]) -> None:
+    print(f"\nvs {previous.get('git_commit') or '?'} ({previous.get('timestamp', '?')}):")
+    for name, result in current["scenarios"].items():
+        before = previous.get("scenarios", {}).get(name)
+        if not before:
+            continue
+        for key in RATE_KEYS + ("cpu_seconds", "peak_rss_mb"):
+            if key in result and before.get(key):
+                change = result[key] / before[key] - 1
+                print(f"  {name:<18} {key:<15} {before[key]:>12,.1f} -> {result[key]:>12,.1f}  ({change:+.1%})")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline benchmark suite against a local stand-in server.")
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=200, help="Store pages per HTTP scenario.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight for fetch_async.")
+    parser.add_argument("--menus", type=int, default=2000, help="Synthetic menus for the flatten scenarios.")
+    parser.add_argument("--csv-rows", type=int, default=200_000, help="Rows in the stream_csv fixture.")
+    parser.add_argument("--latency", type=float, default=0.02, help="Server latency per response (s).")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random latency, up to this (s).")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Fraction of store requests answered 429.")
+    parser.add_argument("--rate-403", type=float, default=0.0, help="Fraction of store requests answered 403.")
+    parser.add_argument("--min-items", type=int, default=10, help="Smallest synthetic menu.")
+    parser.add_argument("--max-items", type=int, default=300, help="Largest synthetic menu.")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", type=Path, default=None,
+                        help="Results file (default: benchmarks/results/pipeline-<timestamp>.json).")
+    parser.add_argument("--compare", type=Path, default=None, help="Earlier results file to compare against.")
+    args = parser.parse_args()
+
+    config = StandInConfig(
+        latency=args.latency,
+        jitter=args.jitter,
+        rate_429=args.rate_429,
+        rate_403=args.rate_403,
+        min_items=args.min_items,
+        max_items=args.max_items,
+        seed=args.seed,
+    )
+    params = {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "menus": args.menus,
+        "csv_rows": args.csv_rows,
+        "min_items": args.min_items,
+        "max_items": args.max_items,
+        "seed": args.seed,
+    }
+    started = datetime.now(timezone.utc)
+    results: Dict[str, Any] = {
+        "suite": "pipeline",
+        "timestamp": started.replace(microsecond=0).isoformat(),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "server": asdict(config),
+        "params": params,
+        "scenarios": {},
+    }
+
+    spawn = multiprocessing.get_context("spawn")
+    with StandInServer(config) as server:
+        for name in args.scenarios:
+            with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as executor:
+                result = executor.submit(run_scenario, name, params, server.base_url).result()
+            results["scenarios"][name] = result
+            print_result(name, result)
+        results["server_status_counts"] = {str(status): count for status, count in sorted(server.status_counts.items())}
+
+    output = args.output or RESULTS_DIR / f"pipeline-{started.strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    print(f"Results written to {output}")
+
+    if args.compare:
+        compare(results, json.loads(args.compare.read_text()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Benchmark the price handling of the cleaning step on synthetic food items:
+
+- normalization: clean_data's old per-character normalize_price mapped over
+  raw JSON-LD prices vs utils.prices.normalize_prices;
+- adjustment: the notebook's cell 5 (`random.sample` plus one `.at` write per
+  row) vs utils.prices.adjust_prices with the same seed.
+
+Both pairs must produce identical columns. The food items use object
+columns (what read_csv(dtype=str) gave before pandas 3): with Arrow-backed
+strings every `.at` write copies the column and the old cell at 1M rows
+takes too long to be worth timing.
+
+    python benchmarks/bench_prices.py [--rows 1000000] [--output results.json]
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+import pandas as pd
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BASE_DIR / "src"))
+
+from clean_data import sanitize_text  # noqa: E402
+from utils.prices import (  # noqa: E402
+    ADJUSTABLE_SERVICES,
+    ALLOWED_DELTAS,
+    ADJUSTMENT_SEED,
+    SAMPLE_FRACTION,
+    adjust_prices,
+    normalize_prices,
+)
+
+SERVICES = ["Uber Eats", "Rappi", "PedidosYa"]
+RAW_PRICE_FORMATS = ["{}", "{}.0", "$ {}", "CLP {}", "{},00", "0{}", ""]
+
+
+def make_raw_prices(rows: int, seed: int) -> pd.Series:
+    rng = random.Random(seed)
+    return pd.Series(
+        [rng.choice(RAW_PRICE_FORMATS).format(rng.randrange(500, 40_000, 10)) for _ in range(rows)],
+        dtype=object,
+    )
+
+
+def make_food_items(rows: int, seed: int) -> pd.DataFrame:
+    rng = random.Random(seed)
+    return pd.DataFrame({
+        "id": [str(i) for i in range(1, rows + 1)],
+        "service": [SERVICES[i % 3] for i in range(rows)],
+        "price": [str(rng.randrange(500, 40_000, 10)) if rng.random() > 0.03 else "" for _ in range(rows)],
+    }, dtype=object)
+
+
+def old_normalize_price(value: Any) -> str:
+    """clean_data.normalize_price before utils.prices."""
+    text = sanitize_text(value)
+    if "." in text:
+        text = text.split(".", 1)[0]
+    digits = "".join(ch for ch in text if ch.isdigit())
+    if not digits:
+        return ""
+    return str(int(digits))
+
+
+def notebook_adjust_prices(food_items_df: pd.DataFrame) -> pd.DataFrame:
+    """The notebook's cell 5, unchanged apart from working on a copy."""
+    food_items_df = food_items_df.copy()
+
+    def parse_price(value: str) -> Optional[int]:
+        if not value:
+            return None
+        digits = ''.join(ch for ch in value if ch.isdigit())
+        if not digits:
+            return None
+        return int(digits)
+
+    def format_price(amount: Optional[int]) -> str:
+        if amount is None:
+            return ""
+        return str(amount)
+
+    mask_services = food_items_df["service"].isin(ADJUSTABLE_SERVICES)
+    mask_has_price = food_items_df["price"].apply(parse_price).notna()
+    eligible_mask = mask_services & mask_has_price
+    eligible_indices = food_items_df.index[eligible_mask]
+
+    random.seed(ADJUSTMENT_SEED)
+    selected_count = int(len(eligible_indices) * SAMPLE_FRACTION)
+    selected_indices = random.sample(list(eligible_indices), k=selected_count) if selected_count else []
+
+    for idx in selected_indices:
+        current_price = parse_price(food_items_df.at[idx, "price"])
+        if current_price is None:
+            continue
+        delta = random.choice(ALLOWED_DELTAS)
+        sign = random.choice([-1, 1])
+        new_price = max(current_price + sign * delta, ALLOWED_DELTAS[0])
+        food_items_df.at[idx, "price"] = format_price(new_price)
+    return food_items_df
+
+
+def timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - started, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Per-row price handling vs utils.prices.")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", type=Path, default=None, help="Write results as JSON to this path.")
+    args = parser.parse_args()
+
+    raw_prices = make_raw_prices(args.rows, args.seed)
+    old_normalize_seconds, expected = timed(lambda values: values.map(old_normalize_price), raw_prices)
+    new_normalize_seconds, actual = timed(normalize_prices, raw_prices)
+    if expected.tolist() != actual.tolist():
+        raise SystemExit("normalize_prices differs from normalize_price")
+
+    food_items_df = make_food_items(args.rows, args.seed)
+    notebook_seconds, expected_df = timed(notebook_adjust_prices, food_items_df)
+    vectorized_seconds, (actual_df, adjusted) = timed(adjust_prices, food_items_df)
+    if expected_df["price"].tolist() != actual_df["price"].tolist():
+        raise SystemExit("adjust_prices differs from the notebook cell")
+
+    results = {
+        "rows": args.rows,
+        "adjusted": adjusted,
+        "normalize_per_row_seconds": round(old_normalize_seconds, 3),
+        "normalize_vectorized_seconds": round(new_normalize_seconds, 3),
+        "adjust_notebook_seconds": round(notebook_seconds, 3),
+        "adjust_vectorized_seconds": round(vectorized_seconds, 3),
+    }
+    print(f"{args.rows:,} food items, {adjusted:,} prices adjusted")
+    print(f"normalize  per row    {old_normalize_seconds:8.2f}s")
+    print(f"normalize  vectorized {new_normalize_seconds:8.2f}s  ({old_normalize_seconds / new_normalize_seconds:.1f}x)")
+    print(f"adjust     notebook   {notebook_seconds:8.2f}s")
+    print(f"adjust     vectorized {vectorized_seconds:8.2f}s  ({notebook_seconds / vectorized_seconds:.1f}x)")
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""
+Benchmark utils.search_index on synthetic exports: index build time and size,
+query latency in process and through search_food.py's HTTP endpoint, an
+incremental update that re-scrapes 1% of the restaurants, and a pandas
+full scan (what answering the same query without an index costs).
+
+    python benchmarks/bench_search.py [--rows 1000000] [--output results.json]
+"""
+import argparse
+import csv
+import json
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List
+from urllib.parse import urlencode
+from urllib.request import urlopen
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BASE_DIR / "src"))
+
+from search_food import SearchHandler, iter_export_documents  # noqa: E402
+from utils.emoji_classifier import fold_text  # noqa: E402
+from utils.metrics import percentile  # noqa: E402
+from utils.search_index import SearchIndex  # noqa: E402
+
+DISHES = ["Pizza", "Empanada", "Churrasco", "Completo", "Hamburguesa", "Sushi Roll", "Ensalada", "Lasaña",
+          "Ñoquis", "Pastel de Choclo", "Cazuela", "Ceviche", "Sándwich", "Tacos", "Burrito", "Ramen",
+          "Pollo Asado", "Salmón", "Camarón", "Café", "Jugo", "Helado", "Torta", "Kuchen", "Brownie"]
+STYLES = ["Napolitana", "de Pino", "Italiano", "Vegana", "Clásica", "Especial", "de Queso", "Picante",
+          "de la Casa", "Acevichado", "Tempura", "Mediana", "Familiar", "Premium", "Light", "Doble"]
+WORDS = ["tomate", "palta", "queso", "mayonesa", "cebolla", "champiñón", "pimentón", "albahaca", "aceitunas",
+         "jamón", "salsa", "papas", "arroz", "limón", "cilantro", "crema", "chocolate", "frutilla", "nuez"]
+CATEGORIES = ["Promociones", "Principales", "Bebidas", "Postres", "Entradas", "Para compartir", "Menú niños"]
+ZONES = ["Providencia", "Ñuñoa", "Las Condes", "Santiago Centro", "Vitacura", "La Florida", "Maipú", "Puente Alto"]
+SERVICES = ["Uber Eats", "Rappi", "PedidosYa"]
+
+QUERIES = [
+    {"q": "pizza"},
+    {"q": "empanada pino"},
+    {"q": "ñoquis"},
+    {"q": "noquis"},
+    {"q": "pastel de choclo"},
+    {"q": "sushi acevichado"},
+    {"q": "ham", "prefix": "1"},
+    {"q": "chocolate", "zone": "Providencia"},
+    {"q": "churrasco palta", "service": "Rappi", "max_price": "9000"},
+    {"q": "cafe", "min_price": "2000", "max_price": "4000"},
+    {"q": "salmon tempura", "zone": "nunoa"},
+    {"q": "tacos picante", "all": "0"},
+]
+
+
+def make_exports(directory: Path, rows: int, items_per_restaurant: int, seed: int):
+    rng = random.Random(seed)
+    restaurants_path = directory / "restaurants.csv"
+    food_items_path = directory / "food_items.csv"
+    restaurant_count = max(1, rows // items_per_restaurant)
+    with restaurants_path.open("w", newline="", encoding="utf-8") as handle:
+        writer = csv.writer(handle)
+        writer.writerow(["id", "name", "service", "zone", "address"])
+        for restaurant_id in range(1, restaurant_count + 1):
+            writer.writerow([restaurant_id, f"Restaurante {restaurant_id // 3}", SERVICES[restaurant_id % 3],
+                             rng.choice(ZONES), f"Calle {restaurant_id // 3} {rng.randint(1, 9999)}"])
+    with food_items_path.open("w", newline="", encoding="utf-8") as handle:
+        writer = csv.writer(handle)
+        writer.writerow(["id", "restaurant", "food", "price", "service", "restaurant_id", "category", "description"])
+        for item_id in range(1, rows + 1):
+            restaurant_id = (item_id - 1) // items_per_restaurant + 1
+            writer.writerow([
+                item_id,
+                f"Restaurante {restaurant_id // 3}",
+                f"{rng.choice(DISHES)} {rng.choice(STYLES)}",
+                str(rng.randrange(1000, 30000, 100)),
+                SERVICES[restaurant_id % 3],
+                restaurant_id,
+                rng.choice(CATEGORIES),
+                " ".join(rng.choices(WORDS, k=rng.randint(0, 12))),
+            ])
+    return food_items_path, restaurants_path
+
+
+def rescrape(documents: List[Dict[str, str]], fraction: float, seed: int) -> List[Dict[str, str]]:
+    """Documents of a random `fraction` of restaurants, with one item dropped, one added and prices moved."""
+    rng = random.Random(seed)
+    by_restaurant: Dict[tuple, List[Dict[str, str]]] = {}
+    for document in documents:
+        by_restaurant.setdefault((document["service"], document["restaurant"], document["address"]), []).append(document)
+    chosen = rng.sample(sorted(by_restaurant), k=max(1, int(len(by_restaurant) * fraction)))
+    refreshed: List[Dict[str, str]] = []
+    for key in chosen:
+        items = [dict(item) for item in by_restaurant[key][1:]]
+        for item in items[::5]:
+            item["price"] = str(int(item["price"]) + 500)
+        added = dict(items[0])
+        added["food"] = "Pizza Novedad Trufada"
+        refreshed.extend(items + [added])
+    return refreshed
+
+
+def scan_baseline(documents: List[Dict[str, str]], query: str) -> int:
+    """Full scan with pandas: fold every document's text and match each word on the fly."""
+    import pandas as pd
+
+    frame = pd.DataFrame(documents, columns=["food", "category", "restaurant", "description"])
+    text = (frame["food"] + " " + frame["category"] + " " + frame["restaurant"] + " " + frame["description"])
+    folded = text.map(fold_text)
+    mask = pd.Series(True, index=frame.index)
+    for word in fold_text(query).split():
+        mask &= folded.str.contains(rf"\b{re.escape(word)}\b", regex=True)
+    return int(mask.sum())
+
+
+def timed(function, *args, **kwargs):
+    started = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build, query and update a search index over synthetic food items.")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--items-per-restaurant", type=int, default=40)
+    parser.add_argument("--repeat", type=int, default=20, help="Runs of each query for the latency percentiles.")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", type=Path, default=None, help="Write results as JSON to this path.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_path = Path(tmp)
+        food_items_path, restaurants_path = make_exports(tmp_path, args.rows, args.items_per_restaurant, args.seed)
+        documents = list(iter_export_documents(food_items_path, restaurants_path))
+        csv_bytes = food_items_path.stat().st_size + restaurants_path.stat().st_size
+
+        index = SearchIndex(tmp_path / "index")
+        build_seconds, build = timed(index.update, iter(documents), replace_all=True)
+        stats = index.stats()
+        print(f"{len(documents):,} documents indexed in {build_seconds:.1f}s ({len(documents) / build_seconds:,.0f}/s), "
+              f"{stats['segments']} segments, {stats['bytes'] / 1e6:.0f} MB on disk (CSV {csv_bytes / 1e6:.0f} MB)")
+
+        latencies: Dict[str, List[float]] = {}
+        for query in QUERIES:
+            params = {key: value for key, value in query.items() if key != "q"}
+            kwargs = {
+                "service": params.get("service"),
+                "zone": params.get("zone"),
+                "min_price": int(params["min_price"]) if "min_price" in params else None,
+                "max_price": int(params["max_price"]) if "max_price" in params else None,
+                "prefix_last": params.get("prefix") == "1",
+                "match_all": params.get("all") != "0",
+            }
+            samples = sorted(index.search(query["q"], **kwargs).seconds for _ in range(args.repeat))
+            latencies[json.dumps(query, ensure_ascii=False)] = samples
+        all_samples = sorted(sample for samples in latencies.values() for sample in samples)
+        for name, samples in latencies.items():
+            print(f"  {name:70s} p50 {percentile(samples, 0.5) * 1000:7.2f} ms")
+        print(f"in process   p50 {percentile(all_samples, 0.5) * 1000:.2f} ms, p95 {percentile(all_samples, 0.95) * 1000:.2f} ms")
+
+        handler = type("BenchSearchHandler", (SearchHandler,), {"index": index})
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        http_samples: List[float] = []
+        for _ in range(args.repeat):
+            for query in QUERIES:
+                url = f"http://127.0.0.1:{server.server_port}/search?{urlencode(query)}"
+                started = time.perf_counter()
+                with urlopen(url) as response:
+                    json.loads(response.read())
+                http_samples.append(time.perf_counter() - started)
+        server.shutdown()
+        server.server_close()
+        http_samples.sort()
+        print(f"over HTTP    p50 {percentile(http_samples, 0.5) * 1000:.2f} ms, p95 {percentile(http_samples, 0.95) * 1000:.2f} ms")
+
+        scan_seconds, scan_total = timed(scan_baseline, documents, "empanada pino")
+        index_total = index.search("empanada pino").total
+        print(f"full scan    {scan_seconds * 1000:.0f} ms for one query ({scan_total:,} matches; index {index_total:,})")
+
+        refreshed = rescrape(documents, 0.01, args.seed)
+        update_seconds, update = timed(index.update, iter(refreshed))
+        novelty = index.search("novedad trufada").total
+        print(f"update of 1% of restaurants: {update_seconds:.2f}s, +{update.added} -{update.deleted} "
+              f"={update.unchanged}, {novelty} new items found")
+        index.close()
+
+    results = {
+        "rows": len(documents),
+        "build_seconds": round(build_seconds, 2),
+        "index_bytes": stats["bytes"],
+        "csv_bytes": csv_bytes,
+        "segments": stats["segments"],
+        "query_p50_ms": round(percentile(all_samples, 0.5) * 1000, 3),
+        "query_p95_ms": round(percentile(all_samples, 0.95) * 1000, 3),
+        "http_p50_ms": round(percentile(http_samples, 0.5) * 1000, 3),
+        "http_p95_ms": round(percentile(http_samples, 0.95) * 1000, 3),
+        "full_scan_ms": round(scan_seconds * 1000, 1),
+        "update_seconds": round(update_seconds, 3),
+        "update_added": update.added,
+        "update_deleted": update.deleted,
+        "build_added": build.added,
+    }
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
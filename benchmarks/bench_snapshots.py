@@ -0,0 +1,193 @@
+"""
+Benchmark utils.menu_snapshots on a synthetic year of daily crawls.
+
+Every day a few prices move and a few items come and go; each crawl is
+recorded as a snapshot. Reports the store's size against one full copy of a
+crawl's JSON-LD (and against appending every crawl to the JSONL, what the
+scraper does today), the time to record a crawl, point-in-time menu and
+price-history query latencies, and checks that the menus rebuilt for a few
+past days match those crawls exactly.
+
+    python benchmarks/bench_snapshots.py [--restaurants 1000] [--days 365] [--output results.json]
+"""
+import argparse
+import json
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BASE_DIR / "src"))
+
+from clean_data import parse_payload  # noqa: E402
+from utils.menu_snapshots import MenuSnapshotStore, restaurant_key  # noqa: E402
+from utils.metrics import percentile  # noqa: E402
+
+DISHES = ["Pizza", "Empanada", "Churrasco", "Completo", "Hamburguesa", "Sushi Roll", "Ensalada", "Lasaña",
+          "Ñoquis", "Pastel de Choclo", "Cazuela", "Ceviche", "Sándwich", "Tacos", "Burrito", "Ramen"]
+STYLES = ["Napolitana", "de Pino", "Italiano", "Vegana", "Clásica", "Especial", "de Queso", "Picante", "Familiar"]
+WORDS = ["tomate", "palta", "queso", "mayonesa", "cebolla", "champiñón", "pimentón", "albahaca", "jamón", "salsa"]
+CATEGORIES = ["Promociones", "Principales", "Bebidas", "Postres", "Entradas", "Para compartir"]
+ZONES = ["Providencia", "Ñuñoa", "Las Condes", "Santiago Centro", "Vitacura", "La Florida"]
+
+
+def make_item(rng: random.Random) -> Dict[str, Any]:
+    return {
+        "@type": "MenuItem",
+        "name": f"{rng.choice(DISHES)} {rng.choice(STYLES)} {rng.randint(1, 99)}",
+        "description": " ".join(rng.choices(WORDS, k=rng.randint(0, 10))),
+        "offers": {"@type": "Offer", "price": f"{rng.randrange(1000, 30000, 10)}.00", "priceCurrency": "CLP"},
+    }
+
+
+def make_crawl(restaurants: int, items_per_restaurant: int, seed: int) -> List[Dict[str, Any]]:
+    """JSON-LD restaurants shaped like the menu scraper's output."""
+    rng = random.Random(seed)
+    crawl = []
+    for number in range(restaurants):
+        sections: Dict[str, List[Dict[str, Any]]] = {}
+        for _ in range(items_per_restaurant):
+            sections.setdefault(rng.choice(CATEGORIES), []).append(make_item(rng))
+        crawl.append({
+            "@context": "https://schema.org",
+            "@type": "Restaurant",
+            "name": f"Restaurante {number}",
+            "restaurant_url": f"https://www.ubereats.com/cl/store/restaurante-{number}/{number:08x}",
+            "address": {"@type": "PostalAddress", "streetAddress": f"Calle {number} {rng.randint(1, 9999)}",
+                        "addressLocality": rng.choice(ZONES), "addressCountry": "CL"},
+            "geo": {"@type": "GeoCoordinates", "latitude": -33.4 + rng.random() / 10, "longitude": -70.6 + rng.random() / 10},
+            "hasMenu": {"@type": "Menu", "hasMenuSection": [
+                {"@type": "MenuSection", "name": name, "hasMenuItem": items} for name, items in sections.items()
+            ]},
+        })
+    return crawl
+
+
+def evolve(crawl: List[Dict[str, Any]], rng: random.Random, price_churn: float, item_churn: float) -> int:
+    """Move some prices and replace some items in place; returns how many items were touched."""
+    touched = 0
+    for restaurant in crawl:
+        for section in restaurant["hasMenu"]["hasMenuSection"]:
+            items = section["hasMenuItem"]
+            for position, item in enumerate(items):
+                roll = rng.random()
+                if roll < price_churn:
+                    price = int(float(item["offers"]["price"])) + rng.choice((-1, 1)) * rng.randrange(100, 2000, 100)
+                    item["offers"]["price"] = f"{max(price, 500)}.00"
+                    touched += 1
+                elif roll < price_churn + item_churn:
+                    items[position] = make_item(rng)
+                    touched += 1
+    return touched
+
+
+def expected_menus(parsed: List[Dict[str, Any]]) -> Dict[str, Counter]:
+    return {
+        restaurant_key(payload): Counter(
+            (section["category"], item["food"], int(item["price"]) if item["price"] else None, item["description"])
+            for section in payload["sections"] for item in section["items"]
+        )
+        for payload in parsed
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="A year of daily menu snapshots: size and query latency.")
+    parser.add_argument("--restaurants", type=int, default=1000)
+    parser.add_argument("--items-per-restaurant", type=int, default=40)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--price-churn", type=float, default=0.01, help="Share of items whose price moves per day.")
+    parser.add_argument("--item-churn", type=float, default=0.002, help="Share of items replaced per day.")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", type=Path, default=None, help="Write results as JSON to this path.")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    crawl = make_crawl(args.restaurants, args.items_per_restaurant, args.seed)
+    full_copy_bytes = sum(len(json.dumps(restaurant, ensure_ascii=False).encode("utf-8")) + 1 for restaurant in crawl)
+    start = datetime(2025, 10, 1, 6, 0)
+    check_days = sorted({0, args.days // 3, args.days // 2, args.days - 1})
+    checks: Dict[int, Dict[str, Counter]] = {}
+    record_seconds: List[float] = []
+    appended_bytes = 0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        with MenuSnapshotStore(Path(tmp) / "snapshots.sqlite3") as store:
+            for day in range(args.days):
+                if day:
+                    evolve(crawl, rng, args.price_churn, args.item_churn)
+                appended_bytes += full_copy_bytes
+                # What iter_restaurants would yield for this crawl's JSONL.
+                parsed = [parse_payload(json.loads(json.dumps(restaurant))) for restaurant in crawl]
+                if day in check_days:
+                    checks[day] = expected_menus(parsed)
+                taken_at = (start + timedelta(days=day)).timestamp()
+                started = time.perf_counter()
+                store.record(parsed, taken_at=taken_at, full=True)
+                record_seconds.append(time.perf_counter() - started)
+            stats = store.stats()
+            snapshots = store.snapshots()
+
+            for day, expected in checks.items():
+                at = (start + timedelta(days=day, hours=12)).timestamp()
+                rebuilt = {
+                    key: Counter((item.category, item.food, item.price, item.description) for item in items)
+                    for key, items in store.iter_menus(at=at)
+                }
+                if rebuilt != expected:
+                    raise SystemExit(f"Menus rebuilt for day {day} differ from that day's crawl")
+
+            keys = [restaurant["restaurant_url"] for restaurant in crawl]
+            menu_samples: List[float] = []
+            history_samples: List[float] = []
+            history_points = 0
+            for _ in range(args.queries):
+                key = rng.choice(keys)
+                at = (start + timedelta(days=rng.randrange(args.days), hours=12)).timestamp()
+                started = time.perf_counter()
+                items = store.menu(key, at=at)
+                menu_samples.append(time.perf_counter() - started)
+                item = rng.choice(items)
+                started = time.perf_counter()
+                history_points += len(store.price_history(key, item.food, category=item.category))
+                history_samples.append(time.perf_counter() - started)
+            menu_samples.sort()
+            history_samples.sort()
+
+    record_seconds.sort()
+    changed = sum(snapshot.added + snapshot.changed + snapshot.removed for snapshot in snapshots[1:])
+    results = {
+        "restaurants": args.restaurants,
+        "items": args.restaurants * args.items_per_restaurant,
+        "days": args.days,
+        "changed_items": changed,
+        "store_bytes": stats["bytes"],
+        "full_copy_bytes": full_copy_bytes,
+        "appended_jsonl_bytes": appended_bytes,
+        "store_full_copies": round(stats["bytes"] / full_copy_bytes, 2),
+        "record_p50_seconds": round(percentile(record_seconds, 0.5), 3),
+        "menu_at_p50_ms": round(percentile(menu_samples, 0.5) * 1000, 3),
+        "menu_at_p95_ms": round(percentile(menu_samples, 0.95) * 1000, 3),
+        "history_p50_ms": round(percentile(history_samples, 0.5) * 1000, 3),
+        "history_p95_ms": round(percentile(history_samples, 0.95) * 1000, 3),
+    }
+    print(f"{args.days} daily crawls of {results['items']:,} items, {changed:,} item changes after the first")
+    print(f"store          {stats['bytes'] / 1e6:8.1f} MB  ({results['store_full_copies']} full copies of "
+          f"{full_copy_bytes / 1e6:.1f} MB; appending every crawl: {appended_bytes / 1e6:,.0f} MB)")
+    print(f"record         p50 {results['record_p50_seconds']:.3f}s per crawl")
+    print(f"menu as of day p50 {results['menu_at_p50_ms']:.2f} ms, p95 {results['menu_at_p95_ms']:.2f} ms")
+    print(f"price history  p50 {results['history_p50_ms']:.2f} ms, p95 {results['history_p95_ms']:.2f} ms "
+          f"({history_points / args.queries:.1f} points on average)")
+    print(f"menus rebuilt for days {check_days} match their crawls")
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
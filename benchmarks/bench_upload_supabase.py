@@ -0,0 +1,164 @@
+"""
+Benchmark the COPY load path of upload_supabase.py against the PostgREST-style
+insert batches, on a local Postgres.
+
+The REST path is emulated without HTTP: each batch is JSON-encoded and
+inserted with `json_populate_recordset` in its own transaction, which is what
+PostgREST does server-side for `table(...).insert(batch)`. The real REST path
+is therefore slower than the numbers reported here.
+
+    BENCH_DATABASE_URL=postgresql://localhost/bench python benchmarks/bench_upload_supabase.py --rows 200000
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import psycopg2
+from psycopg2 import sql
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BASE_DIR / "src"))
+
+from upload_supabase import (  # noqa: E402
+    DEFAULT_BATCH_SIZE,
+    FOOD_ITEM_FLOAT_FIELDS,
+    FOOD_ITEM_INT_FIELDS,
+    _db_schema,
+    _stream_csv_batches,
+    copy_csv_into_table,
+)
+
+FOOD_ITEMS_DDL = """
+CREATE TABLE {} (
+    id bigint PRIMARY KEY,
+    restaurant text,
+    food text,
+    price text,
+    service text,
+    service_link text,
+    restaurant_id bigint,
+    category text,
+    description text,
+    created_at timestamptz
+)
+"""
+FOOD_ITEM_COLUMNS = [
+    "id", "restaurant", "food", "price", "service", "service_link",
+    "restaurant_id", "category", "description", "created_at",
+]
+
+
+def write_fixture(path: Path, rows: int, seed: int = 7) -> None:
+    rng = random.Random(seed)
+    words = ["pollo", "queso", "palta", "tomate", "salsa", "papas", "arroz", "sushi", "pizza", "pan"]
+    with path.open("w", newline="", encoding="utf-8") as handle:
+        writer = csv.writer(handle)
+        writer.writerow(FOOD_ITEM_COLUMNS)
+        for index in range(1, rows + 1):
+            description = " ".join(rng.choices(words, k=rng.randint(0, 30)))
+            writer.writerow([
+                index,
+                f"Restaurante {index // 40}",
+                " ".join(rng.choices(words, k=3)).title(),
+                str(rng.randrange(1000, 30000, 100)),
+                rng.choice(["Uber Eats", "Rappi", "PedidosYa"]),
+                f"https://www.ubereats.com/cl/store/{index // 40}",
+                index // 40 + 1,
+                rng.choice(["Promos", "Principales", "Bebidas", "Postres"]),
+                description,
+                "2025-11-08T00:00:00+00:00",
+            ])
+
+
+def reset_table(conn, table: str) -> None:
+    identifier = sql.Identifier(_db_schema(), table)
+    with conn.cursor() as cursor:
+        cursor.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(identifier))
+        cursor.execute(sql.SQL(FOOD_ITEMS_DDL).format(identifier))
+    conn.commit()
+
+
+def drop_table(conn, table: str) -> None:
+    with conn.cursor() as cursor:
+        cursor.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(_db_schema(), table)))
+    conn.commit()
+
+
+def run_rest_emulation(conn, table: str, csv_path: Path, batch_size: int) -> int:
+    identifier = sql.Identifier(_db_schema(), table)
+    query = sql.SQL("INSERT INTO {} SELECT * FROM json_populate_recordset(NULL::{}, %s)").format(
+        identifier, identifier
+    )
+    total = 0
+    for batch in _stream_csv_batches(
+        csv_path,
+        int_fields=FOOD_ITEM_INT_FIELDS,
+        float_fields=FOOD_ITEM_FLOAT_FIELDS,
+        batch_size=batch_size,
+    ):
+        with conn.cursor() as cursor:
+            cursor.execute(query, (json.dumps(batch),))
+        conn.commit()
+        total += len(batch)
+    return total
+
+
+def run_copy(conn, table: str, csv_path: Path, batch_size: int) -> int:
+    rows = copy_csv_into_table(
+        conn,
+        table,
+        csv_path,
+        int_fields=FOOD_ITEM_INT_FIELDS,
+        float_fields=FOOD_ITEM_FLOAT_FIELDS,
+        batch_size=batch_size,
+    )
+    conn.commit()
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="COPY vs REST-style batch inserts on a local Postgres.")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--output", type=Path, default=None, help="Write results as JSON to this path.")
+    args = parser.parse_args()
+
+    dsn = os.getenv("BENCH_DATABASE_URL")
+    if not dsn:
+        raise SystemExit("Set BENCH_DATABASE_URL to a scratch Postgres database.")
+
+    table = f"bench_food_items_{os.getpid()}"
+    results = {"rows": args.rows, "batch_size": args.batch_size}
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = Path(tmp) / "food_items.csv"
+        write_fixture(csv_path, args.rows)
+        results["csv_bytes"] = csv_path.stat().st_size
+
+        conn = psycopg2.connect(dsn)
+        try:
+            for label, runner in (("rest_emulated", run_rest_emulation), ("copy", run_copy)):
+                reset_table(conn, table)
+                started = time.perf_counter()
+                loaded = runner(conn, table, csv_path, args.batch_size)
+                elapsed = time.perf_counter() - started
+                results[label] = {"rows": loaded, "seconds": round(elapsed, 3), "rows_per_s": round(loaded / elapsed)}
+                print(f"{label:<14} {loaded:>9} rows in {elapsed:7.2f}s  ({loaded / elapsed:,.0f} rows/s)")
+        finally:
+            drop_table(conn, table)
+            conn.close()
+
+    speedup = results["copy"]["rows_per_s"] / results["rest_emulated"]["rows_per_s"]
+    results["speedup"] = round(speedup, 2)
+    print(f"COPY speedup: {speedup:.1f}x")
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
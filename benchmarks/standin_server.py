@@ -0,0 +1,231 @@
+"""
+Local stand-in for the Uber Eats store pages, for offline benchmarks.
+
+    GET /cl/store/<slug>/<n>   checkpoint.html with a synthetic JSON-LD menu
+                               injected before </body>; the menu size is
+                               fixed per path, between --min-items and
+                               --max-items
+    GET /checkpoint            the recorded page as-is (no JSON-LD)
+
+Every response waits `latency` seconds (plus up to `jitter`), and a seeded
+fraction of the store requests answers 429 (with Retry-After) or 403. Use
+it from a benchmark:
+
+    with StandInServer(StandInConfig(latency=0.05, rate_429=0.02)) as server:
+        requests.get(server.store_url(1))
+
+or run it on its own to point a scraper at it:
+
+    python benchmarks/standin_server.py --port 8765 --latency 0.2 --rate-429 0.05
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+FIXTURE = BASE_DIR / "checkpoint.html"
+
+WORDS = [
+    "pollo", "queso", "palta", "tomate", "salsa", "papas", "arroz", "sushi", "pizza", "pan",
+    "cerdo", "camarón", "ensalada", "postre", "bebida", "café", "empanada", "churrasco",
+]
+SECTIONS = ["Promociones", "Principales", "Acompañamientos", "Bebidas", "Postres", "Combos", "Para compartir"]
+ZONES = ["Providencia", "Ñuñoa", "Santiago", "Las Condes", "La Reina", "Vitacura", "Macul"]
+
+
+@dataclass
+class StandInConfig:
+    latency: float = 0.02
+    jitter: float = 0.0
+    rate_429: float = 0.0
+    rate_403: float = 0.0
+    retry_after: int = 1
+    min_items: int = 10
+    max_items: int = 300
+    seed: int = 7
+
+
+def synthetic_menu(rng: random.Random, items: int, url: str = "") -> Dict[str, Any]:
+    """A Restaurant JSON-LD payload shaped like the real pages, with `items` menu items."""
+    sections = []
+    remaining = items
+    while remaining > 0:
+        size = min(remaining, rng.randint(3, 25))
+        remaining -= size
+        sections.append({
+            "@type": "MenuSection",
+            "name": rng.choice(SECTIONS),
+            "hasMenuItem": [
+                {
+                    "@type": "MenuItem",
+                    "name": " ".join(rng.choices(WORDS, k=rng.randint(1, 4))).title(),
+                    "description": " ".join(rng.choices(WORDS, k=rng.randint(0, 25))),
+                    "offers": {"@type": "Offer", "price": str(rng.randrange(990, 25000, 10)), "priceCurrency": "CLP"},
+                }
+                for _ in range(size)
+            ],
+        })
+    zone = rng.choice(ZONES)
+    return {
+        "@context": "https://schema.org",
+        "@type": "Restaurant",
+        "@id": url,
+        "name": f"Restaurante {rng.randrange(10**6)}",
+        "geo": {"@type": "GeoCoordinates", "latitude": -33.45 + rng.uniform(-0.1, 0.1),
+                "longitude": -70.65 + rng.uniform(-0.1, 0.1)},
+        "address": {"@type": "PostalAddress", "streetAddress": f"Av. {rng.choice(WORDS).title()} {rng.randrange(1, 9999)}",
+                    "addressLocality": zone, "addressRegion": "Región Metropolitana"},
+        "hasMenu": {"@type": "Menu", "hasMenuSection": sections},
+    }
+
+
+@lru_cache(maxsize=1)
+def _fixture() -> str:
+    return FIXTURE.read_text(encoding="utf-8")
+
+
+@lru_cache(maxsize=1)
+def _fixture_parts() -> Tuple[bytes, bytes]:
+    """The recorded page split (as bytes) where the JSON-LD block goes."""
+    html = _fixture()
+    index = html.rfind("</body>")
+    if index == -1:
+        return html.encode("utf-8"), b""
+    return html[:index].encode("utf-8"), html[index:].encode("utf-8")
+
+
+def render_store_page(path: str, config: StandInConfig) -> bytes:
+    """The page for `path`; the same path always gets the same menu."""
+    seed = int.from_bytes(hashlib.blake2b(f"{config.seed}:{path}".encode("utf-8"), digest_size=8).digest(), "big")
+    rng = random.Random(seed)
+    menu = synthetic_menu(rng, rng.randint(config.min_items, config.max_items), url=path)
+    head, tail = _fixture_parts()
+    block = '<script type="application/ld+json">' + json.dumps(menu, ensure_ascii=False) + "</script>"
+    return b"".join((head, block.encode("utf-8"), tail))
+
+
+class StandInServer:
+    """Threaded HTTP server on 127.0.0.1 (ephemeral port by default), run in a daemon thread."""
+
+    def __init__(self, config: Optional[StandInConfig] = None, *, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or StandInConfig()
+        self._rng = random.Random(self.config.seed)
+        self._lock = threading.Lock()
+        self.status_counts: Dict[int, int] = {}
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def store_url(self, n: int) -> str:
+        return f"{self.base_url}/cl/store/restaurante-{n}/{n}"
+
+    def _record(self, status: int) -> None:
+        with self._lock:
+            self.status_counts[status] = self.status_counts.get(status, 0) + 1
+
+    def _pick_failure(self) -> Optional[int]:
+        with self._lock:
+            draw = self._rng.random()
+        if draw < self.config.rate_429:
+            return 429
+        if draw < self.config.rate_429 + self.config.rate_403:
+            return 403
+        return None
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args) -> None:  # keep benchmark output clean
+                pass
+
+            def _send(self, status: int, body: bytes, headers: Optional[Dict[str, str]] = None) -> None:
+                self.send_response(status)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+                server._record(status)
+
+            def do_GET(self) -> None:
+                config = server.config
+                delay = config.latency + (random.uniform(0.0, config.jitter) if config.jitter else 0.0)
+                if delay > 0:
+                    time.sleep(delay)
+                path = self.path.split("?", 1)[0]
+                if path == "/checkpoint":
+                    self._send(200, _fixture().encode("utf-8"))
+                    return
+                if "/store/" not in path:
+                    self._send(404, b"not found")
+                    return
+                failure = server._pick_failure()
+                if failure == 429:
+                    self._send(429, b"too many requests", {"Retry-After": str(config.retry_after)})
+                    return
+                if failure == 403:
+                    self._send(403, b"forbidden")
+                    return
+                self._send(200, render_store_page(path, config))
+
+        return Handler
+
+    def serve_forever(self) -> None:
+        """Serve on the calling thread (standalone mode)."""
+        try:
+            self._httpd.serve_forever()
+        finally:
+            self._httpd.server_close()
+
+    def start(self) -> "StandInServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="standin-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> "StandInServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local stand-in for the Uber Eats store pages.")
+    parser.add_argument("--port", type=int, default=8765)
+    for field_name, value in asdict(StandInConfig()).items():
+        parser.add_argument(f"--{field_name.replace('_', '-')}", type=type(value), default=value)
+    args = parser.parse_args()
+    config = StandInConfig(**{name: getattr(args, name) for name in asdict(StandInConfig())})
+    server = StandInServer(config, port=args.port)
+    print(f"Serving {server.store_url(1)} (and /checkpoint) with {config}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
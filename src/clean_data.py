@@ -0,0 +1,501 @@
+"""
+Streaming cleaner that turns the scraped JSON-LD menus (raw_data.jsonl) into
+the restaurants.csv / food_items.csv files loaded by upload_supabase.py.
+
+The input is read in chunks of lines that are parsed in a process pool, with
+at most a few chunks in flight. Restaurants are sampled with a seeded
+reservoir, each one is expanded into one row per service, and duplicate food
+items are dropped by row hash as they are written, so memory stays flat no
+matter how large the crawl is.
+
+    python src/clean_data.py [--input uber/data/raw_data.jsonl] [--sample 1000]
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import random
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from utils import metrics
+from utils.prices import normalize_price
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+RAW_DATA_PATH = BASE_DIR / "uber" / "data" / "raw_data.jsonl"
+OUTPUT_DIR = BASE_DIR / "supabase_update"
+OUTPUT_RESTAURANTS = OUTPUT_DIR / "restaurants.csv"
+OUTPUT_FOOD_ITEMS = OUTPUT_DIR / "food_items.csv"
+METRICS_DIR = BASE_DIR / "uber" / "data" / "metrics"
+
+SERVICE_LINKS = {
+    "Uber Eats": lambda link: link or "",
+    "Rappi": lambda _link: "https://www.rappi.cl/restaurantes",
+    "PedidosYa": lambda _link: (
+        "https://www.pedidosya.cl/restaurantes?bt=RESTAURANT&origin=home"
+        "&lat=-33.44889&lng=-70.669266&areaId=16977&areaName=Santiago%20Centro&address=Santiago"
+    ),
+}
+
+RESTAURANT_COLUMNS = ["id", "name", "service", "latitude", "longitude", "address", "zone", "service_link", "created_at"]
+FOOD_ITEM_COLUMNS = [
+    "id",
+    "restaurant",
+    "food",
+    "price",
+    "service",
+    "service_link",
+    "restaurant_id",
+    "category",
+    "description",
+    "created_at",
+]
+# Food items that only differ by these columns are duplicates.
+DEDUPE_IGNORED_COLUMNS = {"id", "category"}
+
+UNUSUAL_TERMINATORS = ("\u2028", "\u2029", "\r", "\n")
+SAMPLE_RESTAURANT_COUNT = 1000
+SAMPLE_RANDOM_SEED = 12345
+DEFAULT_CHUNK_SIZE = 200
+
+
+def ensure_list(value: Any) -> List[Any]:
+    if isinstance(value, list):
+        return value
+    if value is None:
+        return []
+    return [value]
+
+
+def safe_float(value: Any) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def sanitize_text(value: Any) -> str:
+    if value is None:
+        return ""
+    text = str(value)
+    for token in UNUSUAL_TERMINATORS:
+        text = text.replace(token, " ")
+    return " ".join(text.split())
+
+
+def has_unusual_terminator(line: str) -> bool:
+    if not line:
+        return False
+    return line.endswith("\r") and not line.endswith("\r\n")
+
+
+def parse_payload(payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Reduce one JSON-LD restaurant to the fields exported to Supabase."""
+    name = sanitize_text(payload.get("name"))
+    if not name:
+        return None
+
+    geo = payload.get("geo") or {}
+    address_data = payload.get("address") or {}
+
+    menu = payload.get("hasMenu") or {}
+    sections = ensure_list(menu.get("hasMenuSection") or [])
+
+    processed_sections: List[Dict[str, Any]] = []
+    for section in sections:
+        if not isinstance(section, dict):
+            continue
+        processed_items: List[Dict[str, str]] = []
+        for item in ensure_list(section.get("hasMenuItem")):
+            if not isinstance(item, dict):
+                continue
+            offers = item.get("offers") or {}
+            if isinstance(offers, list):
+                offers = offers[0] if offers else {}
+
+            price_value = offers.get("price") if isinstance(offers, dict) else ""
+            processed_items.append({
+                "food": sanitize_text(item.get("name")),
+                "price": normalize_price(price_value),
+                "description": sanitize_text(item.get("description")),
+            })
+
+        processed_sections.append({
+            "category": sanitize_text(section.get("name")),
+            "items": processed_items,
+        })
+
+    return {
+        "name": name,
+        "latitude": safe_float(geo.get("latitude")),
+        "longitude": safe_float(geo.get("longitude")),
+        "address": sanitize_text(address_data.get("streetAddress")),
+        "zone": sanitize_text(address_data.get("addressLocality") or address_data.get("addressRegion")),
+        "service_link": sanitize_text(payload.get("restaurant_url") or payload.get("@id") or ""),
+        "sections": processed_sections,
+    }
+
+
+def parse_chunk(lines: List[Tuple[int, str]]) -> Tuple[List[Dict[str, Any]], int]:
+    """Parse a chunk of (line number, raw line). Returns the payloads and the skipped-line count."""
+    payloads: List[Dict[str, Any]] = []
+    skipped_terminator = 0
+    for line_no, raw_line in lines:
+        if has_unusual_terminator(raw_line):
+            skipped_terminator += 1
+            continue
+        stripped = raw_line.strip()
+        if not stripped:
+            continue
+        try:
+            payload = json.loads(stripped)
+        except json.JSONDecodeError as exc:
+            raise ValueError(f"Invalid JSON on line {line_no}: {exc}") from exc
+        parsed = parse_payload(payload)
+        if parsed is not None:
+            payloads.append(parsed)
+    return payloads, skipped_terminator
+
+
+def _read_chunks(path: Path, chunk_size: int) -> Iterator[List[Tuple[int, str]]]:
+    with path.open("r", encoding="utf-8", newline="") as handle:
+        chunk: List[Tuple[int, str]] = []
+        for line_no, raw_line in enumerate(handle, start=1):
+            chunk.append((line_no, raw_line))
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+def _ordered_bounded_map(
+    executor: ProcessPoolExecutor,
+    chunks: Iterable[List[Tuple[int, str]]],
+    max_in_flight: int,
+) -> Iterator[Tuple[List[Dict[str, Any]], int]]:
+    """Like executor.map, but never reads more than `max_in_flight` chunks ahead."""
+    window: Deque[Future] = deque()
+    for chunk in chunks:
+        window.append(executor.submit(parse_chunk, chunk))
+        if len(window) >= max_in_flight:
+            yield window.popleft().result()
+    while window:
+        yield window.popleft().result()
+
+
+def iter_restaurants(
+    path: Path,
+    *,
+    workers: Optional[int] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    stats: Optional["CleaningStats"] = None,
+) -> Iterator[Dict[str, Any]]:
+    """Yield parsed restaurants from a JSONL file in input order."""
+    if not path.exists():
+        raise FileNotFoundError(f"Source file not found: {path}")
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        results: Iterator[Tuple[List[Dict[str, Any]], int]] = map(parse_chunk, _read_chunks(path, chunk_size))
+        for payloads, skipped in metrics.timed_iter("parse", results):
+            if stats is not None:
+                stats.skipped_terminator += skipped
+            yield from payloads
+        return
+
+    # With a pool, the "parse" time is how long the consumer waits for the next chunk.
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        chunks = _ordered_bounded_map(executor, _read_chunks(path, chunk_size), workers * 2)
+        for payloads, skipped in metrics.timed_iter("parse", chunks):
+            if stats is not None:
+                stats.skipped_terminator += skipped
+            yield from payloads
+
+
+def _parquet_text(value: Any) -> str:
+    # aplanar_productos in 04 writes "N/A" where the JSON-LD had no value.
+    return "" if value == "N/A" else sanitize_text(value)
+
+
+def iter_restaurants_parquet(root: Path) -> Iterator[Dict[str, Any]]:
+    """
+    Yield parsed restaurants from the Parquet datasets written by 04 with
+    --parquet (`root/menus` and `root/productos`), one partition at a time.
+    Only the columns the export needs are read, through memory maps.
+    """
+    from utils.columnar import partitions, read_table
+
+    menus_root = root / "menus"
+    products_root = root / "productos"
+    if not menus_root.exists():
+        raise FileNotFoundError(f"Parquet menus dataset not found: {menus_root}")
+
+    for _values, menus_dir in partitions(menus_root):
+        products_dir = products_root / menus_dir.relative_to(menus_root)
+        sections_by_url: Dict[str, Dict[str, List[Dict[str, str]]]] = {}
+        if products_dir.exists():
+            with metrics.stage("read"):
+                products = read_table(
+                    products_dir, columns=["restaurante_url", "category_name", "name", "price", "description"]
+                ).to_pydict()
+            for url, category, food, price, description in zip(
+                products["restaurante_url"],
+                products["category_name"],
+                products["name"],
+                products["price"],
+                products["description"],
+            ):
+                sections = sections_by_url.setdefault(url, {})
+                sections.setdefault(_parquet_text(category), []).append({
+                    "food": _parquet_text(food),
+                    "price": normalize_price(_parquet_text(price)),
+                    "description": sanitize_text(description),
+                })
+
+        with metrics.stage("read"):
+            menus = read_table(
+                menus_dir,
+                columns=["store_name", "restaurante_url", "latitude", "longitude", "street_address", "locality", "region"],
+            ).to_pylist()
+        seen_urls: Set[str] = set()
+        for menu in menus:
+            url = menu["restaurante_url"]
+            name = sanitize_text(menu["store_name"])
+            if not name or url in seen_urls:
+                continue
+            seen_urls.add(url)
+            yield {
+                "name": name,
+                "latitude": safe_float(menu["latitude"]),
+                "longitude": safe_float(menu["longitude"]),
+                "address": sanitize_text(menu["street_address"]),
+                "zone": sanitize_text(menu["locality"] or menu["region"]),
+                "service_link": sanitize_text(url or ""),
+                "sections": [
+                    {"category": category, "items": items}
+                    for category, items in sections_by_url.get(url, {}).items()
+                ],
+            }
+
+
+def reservoir_sample(items: Iterable[Any], k: int, seed: int) -> Tuple[List[Any], int]:
+    """
+    Seeded uniform sample of `k` items from a stream (algorithm R), returned
+    in stream order, plus the total number of items seen.
+    """
+    rng = random.Random(seed)
+    reservoir: List[Tuple[int, Any]] = []
+    total = 0
+    for index, item in enumerate(items):
+        total += 1
+        if index < k:
+            reservoir.append((index, item))
+            continue
+        slot = rng.randint(0, index)
+        if slot < k:
+            reservoir[slot] = (index, item)
+    reservoir.sort(key=lambda pair: pair[0])
+    return [item for _, item in reservoir], total
+
+
+def _row_hash(row: Dict[str, Any]) -> bytes:
+    digest = hashlib.blake2b(digest_size=16)
+    for column in FOOD_ITEM_COLUMNS:
+        if column in DEDUPE_IGNORED_COLUMNS:
+            continue
+        digest.update(str(row[column]).encode("utf-8"))
+        digest.update(b"\x1f")
+    return digest.digest()
+
+
+@dataclass
+class CleaningStats:
+    candidates: int = 0
+    restaurants: int = 0
+    restaurant_rows: int = 0
+    food_item_rows: int = 0
+    duplicates_removed: int = 0
+    skipped_terminator: int = 0
+
+
+def write_exports(
+    payloads: Iterable[Dict[str, Any]],
+    restaurants_path: Path,
+    food_items_path: Path,
+    *,
+    timestamp: str,
+    stats: CleaningStats,
+    parquet: bool = False,
+) -> None:
+    """
+    Expand each restaurant into one row per service and stream both CSVs to
+    disk. With `parquet`, the same rows also go to .parquet files next to them.
+    """
+    restaurants_path.parent.mkdir(parents=True, exist_ok=True)
+    food_items_path.parent.mkdir(parents=True, exist_ok=True)
+
+    restaurants_parquet = food_items_parquet = None
+    if parquet:
+        from utils.columnar import FOOD_ITEM_EXPORT_SCHEMA, RESTAURANT_EXPORT_SCHEMA, ParquetTableWriter
+
+        restaurants_parquet = ParquetTableWriter(restaurants_path.with_suffix(".parquet"), RESTAURANT_EXPORT_SCHEMA)
+        food_items_parquet = ParquetTableWriter(food_items_path.with_suffix(".parquet"), FOOD_ITEM_EXPORT_SCHEMA)
+
+    restaurant_id = 1
+    food_item_id = 1
+    # The Parquet files are closed after the CSVs, so they are never older
+    # than them (upload_supabase.py --parquet refuses stale exports).
+    try:
+        with restaurants_path.open("w", newline="", encoding="utf-8") as restaurants_handle, \
+                food_items_path.open("w", newline="", encoding="utf-8") as food_handle:
+            restaurants_writer = csv.DictWriter(restaurants_handle, fieldnames=RESTAURANT_COLUMNS)
+            food_writer = csv.DictWriter(food_handle, fieldnames=FOOD_ITEM_COLUMNS)
+            restaurants_writer.writeheader()
+            food_writer.writeheader()
+
+            for payload in payloads:
+                write_started = time.perf_counter()
+                stats.restaurants += 1
+                for service, link_builder in SERVICE_LINKS.items():
+                    service_link = sanitize_text(link_builder(payload["service_link"]))
+                    restaurant_row = {
+                        "id": restaurant_id,
+                        "name": payload["name"],
+                        "service": service,
+                        "latitude": payload["latitude"],
+                        "longitude": payload["longitude"],
+                        "address": payload["address"],
+                        "zone": payload["zone"],
+                        "service_link": service_link,
+                        "created_at": timestamp,
+                    }
+                    restaurants_writer.writerow(restaurant_row)
+                    if restaurants_parquet is not None:
+                        restaurants_parquet.write(restaurant_row)
+                    stats.restaurant_rows += 1
+
+                    # restaurant_id is part of the dedupe key, so duplicates can
+                    # only occur within one restaurant row.
+                    seen: Set[bytes] = set()
+                    for section in payload["sections"]:
+                        for item in section["items"]:
+                            row = {
+                                "id": food_item_id,
+                                "restaurant": payload["name"],
+                                "food": item["food"],
+                                "price": item["price"],
+                                "service": service,
+                                "service_link": service_link,
+                                "restaurant_id": restaurant_id,
+                                "category": section["category"],
+                                "description": item["description"],
+                                "created_at": timestamp,
+                            }
+                            row_hash = _row_hash(row)
+                            if row_hash in seen:
+                                stats.duplicates_removed += 1
+                                continue
+                            seen.add(row_hash)
+                            food_writer.writerow(row)
+                            if food_items_parquet is not None:
+                                food_items_parquet.write(row)
+                            food_item_id += 1
+                            stats.food_item_rows += 1
+
+                    restaurant_id += 1
+                metrics.observe("write", time.perf_counter() - write_started)
+    finally:
+        for writer in (restaurants_parquet, food_items_parquet):
+            if writer is not None:
+                writer.close()
+
+
+def run_cleaning(
+    input_path: Path = RAW_DATA_PATH,
+    output_dir: Path = OUTPUT_DIR,
+    *,
+    sample_count: Optional[int] = SAMPLE_RESTAURANT_COUNT,
+    seed: int = SAMPLE_RANDOM_SEED,
+    workers: Optional[int] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    parquet: bool = False,
+) -> CleaningStats:
+    """
+    Clean `input_path` into restaurants.csv and food_items.csv in `output_dir`
+    (plus .parquet copies with `parquet`). `input_path` is either a JSONL file
+    or the Parquet directory written by 04 --parquet. A falsy `sample_count`
+    exports every restaurant without sampling.
+    """
+    stats = CleaningStats()
+    timestamp = datetime.now(timezone.utc).replace(microsecond=0).isoformat()
+    if input_path.is_dir():
+        restaurants = iter_restaurants_parquet(input_path)
+    else:
+        restaurants = iter_restaurants(input_path, workers=workers, chunk_size=chunk_size, stats=stats)
+
+    if sample_count:
+        sampled, stats.candidates = reservoir_sample(restaurants, sample_count, seed)
+        payloads: Iterable[Dict[str, Any]] = sampled
+    else:
+        payloads = restaurants
+
+    write_exports(
+        payloads,
+        output_dir / OUTPUT_RESTAURANTS.name,
+        output_dir / OUTPUT_FOOD_ITEMS.name,
+        timestamp=timestamp,
+        stats=stats,
+        parquet=parquet,
+    )
+    if not sample_count:
+        stats.candidates = stats.restaurants
+    metrics.count("restaurants", stats.restaurants)
+    metrics.count("restaurant_rows", stats.restaurant_rows)
+    metrics.count("items", stats.food_item_rows)
+    metrics.count("items_duplicate", stats.duplicates_removed)
+    metrics.count("lines_skipped", stats.skipped_terminator)
+    metrics.event("cleaning", input=str(input_path), **asdict(stats))
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Clean raw_data.jsonl into the Supabase CSV exports.")
+    parser.add_argument("--input", type=Path, default=RAW_DATA_PATH,
+                        help="raw_data.jsonl, or the Parquet directory written by the menu scraper with --parquet.")
+    parser.add_argument("--output-dir", type=Path, default=OUTPUT_DIR)
+    parser.add_argument("--sample", type=int, default=SAMPLE_RESTAURANT_COUNT,
+                        help="Restaurants to sample (0 exports all of them).")
+    parser.add_argument("--seed", type=int, default=SAMPLE_RANDOM_SEED)
+    parser.add_argument("--workers", type=int, default=None, help="Parser processes (default: CPU count).")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="JSONL lines per parse task.")
+    parser.add_argument("--parquet", action="store_true", help="Also write restaurants.parquet and food_items.parquet.")
+    args = parser.parse_args()
+
+    metrics.configure("clean_data", METRICS_DIR)
+    stats = run_cleaning(
+        args.input,
+        args.output_dir,
+        sample_count=args.sample,
+        seed=args.seed,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        parquet=args.parquet,
+    )
+    print(f"Sampled {stats.restaurants} restaurants from {stats.candidates} candidates.")
+    if stats.duplicates_removed:
+        print(f"Removed {stats.duplicates_removed} duplicate food items.")
+    print(f"Exported {stats.restaurant_rows} restaurant rows to {(args.output_dir / OUTPUT_RESTAURANTS.name).resolve()}")
+    print(f"Exported {stats.food_item_rows} food item rows to {(args.output_dir / OUTPUT_FOOD_ITEMS.name).resolve()}")
+    if stats.skipped_terminator:
+        print(f"Skipped {stats.skipped_terminator} lines due to unusual line terminators.")
+    print(metrics.summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Record each menu crawl as a snapshot (utils.menu_snapshots) and query menus
+as of any date and the price history of an item.
+
+    # After a crawl, or per day from the archived pages:
+    #   python uber/scraper/04_extraer_comida_restaurante.py --replay --replay-date 2026-10-16
+    python src/menu_snapshots.py record uber/data/replay/menus/productos_completo.jsonl --taken-at 2026-10-16
+    python src/menu_snapshots.py list
+    python src/menu_snapshots.py changes --prices
+    python src/menu_snapshots.py menu https://www.ubereats.com/cl/store/... --at 2026-06-01
+    python src/menu_snapshots.py history https://www.ubereats.com/cl/store/... "Pizza Napolitana"
+
+The input is one crawl (raw JSONL or 04's Parquet directory). A restaurant
+listed more than once keeps its last menu, so the appended
+productos_completo.jsonl of a scrape can be recorded as is.
+"""
+import argparse
+import json
+from dataclasses import asdict
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from clean_data import BASE_DIR, iter_restaurants, iter_restaurants_parquet
+from utils import metrics
+from utils.menu_snapshots import MenuSnapshotStore
+
+SNAPSHOT_DB = BASE_DIR / "uber" / "data" / "menu_snapshots.sqlite3"
+METRICS_DIR = BASE_DIR / "uber" / "data" / "metrics"
+
+
+def parse_time(value: Optional[str]) -> Optional[float]:
+    """A 'YYYY-MM-DD' or ISO date-time (local time) as a timestamp."""
+    if not value:
+        return None
+    return datetime.fromisoformat(value).timestamp()
+
+
+def format_time(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp).isoformat(sep=" ", timespec="seconds")
+
+
+def format_price(price: Optional[int]) -> str:
+    return "-" if price is None else f"${price}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Delta-encoded snapshots of the scraped menus.")
+    parser.add_argument("--db", type=Path, default=SNAPSHOT_DB)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = commands.add_parser("record", help="Record one crawl as a new snapshot.")
+    record_parser.add_argument("input", type=Path, help="productos_completo.jsonl or the Parquet directory.")
+    record_parser.add_argument("--taken-at", default=None, help="When the crawl ran (ISO date or time; default now).")
+    record_parser.add_argument("--full", action="store_true",
+                               help="The crawl covered every restaurant: remove the menus of those missing from it.")
+    record_parser.add_argument("--workers", type=int, default=None, help="Parser processes (default: CPU count).")
+
+    commands.add_parser("list", help="List the snapshots.")
+
+    changes_parser = commands.add_parser("changes", help="What a snapshot changed (default: the latest).")
+    changes_parser.add_argument("--snapshot", type=int, default=None)
+    changes_parser.add_argument("--prices", action="store_true", help="Only price changes, additions and removals.")
+
+    menu_parser = commands.add_parser("menu", help="A restaurant's menu as of a date.")
+    menu_parser.add_argument("restaurant", help="Restaurant URL (or 'name|address' when it had none).")
+    menu_parser.add_argument("--at", default=None, help="ISO date or time (default: the latest snapshot).")
+
+    history_parser = commands.add_parser("history", help="Price history of a restaurant's item.")
+    history_parser.add_argument("restaurant")
+    history_parser.add_argument("food")
+    history_parser.add_argument("--category", default=None)
+
+    commands.add_parser("stats", help="Print store statistics.")
+    args = parser.parse_args()
+
+    metrics.configure("menu_snapshots", METRICS_DIR)
+    with MenuSnapshotStore(args.db) as store:
+        if args.command == "record":
+            if args.input.is_dir():
+                restaurants = iter_restaurants_parquet(args.input)
+            else:
+                restaurants = iter_restaurants(args.input, workers=args.workers)
+            with metrics.stage("record"):
+                snapshot = store.record(
+                    restaurants, taken_at=parse_time(args.taken_at), source=str(args.input), full=args.full
+                )
+            print(
+                f"Snapshot {snapshot.id} ({format_time(snapshot.taken_at)}): {snapshot.restaurants} restaurants, "
+                f"{snapshot.items} items; +{snapshot.added} ~{snapshot.changed} -{snapshot.removed}"
+            )
+            metrics.event("menu_snapshot", **asdict(snapshot))
+            print(json.dumps(store.stats()))
+            print(metrics.summary())
+        elif args.command == "list":
+            for snapshot in store.snapshots():
+                print(
+                    f"{snapshot.id:5d}  {format_time(snapshot.taken_at)}  {snapshot.restaurants:7d} restaurants "
+                    f"{snapshot.items:9d} items  +{snapshot.added} ~{snapshot.changed} -{snapshot.removed}"
+                    f"{'  (full)' if snapshot.full else ''}"
+                )
+        elif args.command == "changes":
+            snapshots = store.snapshots()
+            if not snapshots:
+                raise SystemExit("No snapshots recorded yet.")
+            snapshot_id = args.snapshot if args.snapshot is not None else snapshots[-1].id
+            for change in store.changes(snapshot_id, prices_only=args.prices):
+                print(
+                    f"{change.kind:8s} {format_price(change.old_price):>9s} -> {format_price(change.new_price):<9s} "
+                    f"{change.food} | {change.category} | {change.restaurant}"
+                )
+        elif args.command == "menu":
+            for item in store.menu(args.restaurant, at=parse_time(args.at)):
+                print(f"{format_price(item.price):>9s}  {item.food} | {item.category}")
+        elif args.command == "history":
+            for point in store.price_history(args.restaurant, args.food, category=args.category):
+                price = "removed" if point.removed else format_price(point.price)
+                print(f"{format_time(point.taken_at)}  {price:>9s}  {point.food} | {point.category}")
+        else:
+            print(json.dumps(store.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
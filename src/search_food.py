@@ -0,0 +1,250 @@
+"""
+Full-text search over the food items (utils.search_index), from the command
+line or a small local HTTP endpoint.
+
+    # Index the cleaning exports; --full also drops restaurants no longer exported.
+    python src/search_food.py index --full
+    # Add or refresh restaurants from newly scraped menus (JSONL or 04's Parquet dir).
+    python src/search_food.py index --menus uber/data/productos_completo.jsonl
+    python src/search_food.py query "empanadas de pino" --zone Providencia --max-price 5000
+    python src/search_food.py serve --port 8765
+    curl 'http://127.0.0.1:8765/search?q=piz&prefix=1&service=Rappi'
+
+Restaurants are replaced as a whole: re-indexing a restaurant adds its new
+items, deletes the ones it no longer lists and keeps the rest as they are.
+"""
+import argparse
+import csv
+import json
+import threading
+import time
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+from clean_data import (
+    BASE_DIR,
+    OUTPUT_FOOD_ITEMS,
+    OUTPUT_RESTAURANTS,
+    SERVICE_LINKS,
+    iter_restaurants,
+    iter_restaurants_parquet,
+    sanitize_text,
+)
+from utils import metrics
+from utils.search_index import DEFAULT_LIMIT, SearchIndex
+
+INDEX_DIR = BASE_DIR / "uber" / "data" / "search_index"
+METRICS_DIR = BASE_DIR / "uber" / "data" / "metrics"
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# The server re-reads index.json at most this often, to pick up updates.
+REFRESH_SECONDS = 1.0
+MAX_LIMIT = 200
+
+
+def iter_export_documents(food_items_path: Path, restaurants_path: Path) -> Iterator[Dict[str, Any]]:
+    """
+    Food item rows of the CSV exports, with their restaurant's zone and
+    address. The export ids are renumbered on every run, so they are left out.
+    """
+    restaurants: Dict[str, Dict[str, str]] = {}
+    with restaurants_path.open(newline="", encoding="utf-8") as handle:
+        for row in csv.DictReader(handle):
+            restaurants[row["id"]] = {"zone": row.get("zone", ""), "address": row.get("address", "")}
+    with food_items_path.open(newline="", encoding="utf-8") as handle:
+        for row in csv.DictReader(handle):
+            restaurant = restaurants.get(row.pop("restaurant_id", ""), {"zone": "", "address": ""})
+            for column in ("id", "created_at"):
+                row.pop(column, None)
+            row.update(restaurant)
+            yield row
+
+
+def iter_menu_documents(path: Path) -> Iterator[Dict[str, Any]]:
+    """
+    Food items of scraped JSON-LD menus (raw JSONL or 04's Parquet
+    directory), one per service like the cleaning exports.
+    """
+    payloads = iter_restaurants_parquet(path) if path.is_dir() else iter_restaurants(path)
+    for payload in payloads:
+        for service, link_builder in SERVICE_LINKS.items():
+            service_link = sanitize_text(link_builder(payload["service_link"]))
+            for section in payload["sections"]:
+                for item in section["items"]:
+                    yield {
+                        "restaurant": payload["name"],
+                        "food": item["food"],
+                        "price": item["price"],
+                        "service": service,
+                        "service_link": service_link,
+                        "category": section["category"],
+                        "description": item["description"],
+                        "zone": payload["zone"],
+                        "address": payload["address"],
+                    }
+
+
+def _optional_int(values: Dict[str, List[str]], name: str) -> Optional[int]:
+    raw = values.get(name, [""])[0]
+    return int(raw) if raw else None
+
+
+def _flag(values: Dict[str, List[str]], name: str, default: bool) -> bool:
+    raw = values.get(name, [""])[0].lower()
+    if not raw:
+        return default
+    return raw in ("1", "true", "yes")
+
+
+class SearchHandler(BaseHTTPRequestHandler):
+    """GET /search?q=...&service=&zone=&min_price=&max_price=&limit=&prefix=&all= and GET /stats."""
+
+    index: SearchIndex
+    _refresh_lock = threading.Lock()
+    _refreshed_at = 0.0
+
+    def log_message(self, *args: Any) -> None:
+        # One line per request on stderr would cost more than the search itself.
+        return
+
+    def _send_json(self, status: HTTPStatus, payload: Dict[str, Any]) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _maybe_refresh(self) -> None:
+        cls = type(self)
+        now = time.monotonic()
+        if now - cls._refreshed_at < REFRESH_SECONDS:
+            return
+        with cls._refresh_lock:
+            if now - cls._refreshed_at >= REFRESH_SECONDS:
+                self.index.refresh()
+                cls._refreshed_at = now
+
+    def do_GET(self) -> None:
+        url = urlsplit(self.path)
+        self._maybe_refresh()
+        if url.path == "/stats":
+            self._send_json(HTTPStatus.OK, self.index.stats())
+            return
+        if url.path != "/search":
+            self._send_json(HTTPStatus.NOT_FOUND, {"error": f"Unknown path {url.path}"})
+            return
+        values = parse_qs(url.query)
+        try:
+            limit = _optional_int(values, "limit")
+            if limit is not None and limit < 1:
+                raise ValueError(f"limit must be at least 1, got {limit}")
+            result = self.index.search(
+                values.get("q", [""])[0],
+                limit=min(MAX_LIMIT, DEFAULT_LIMIT if limit is None else limit),
+                service=values.get("service"),
+                zone=values.get("zone"),
+                min_price=_optional_int(values, "min_price"),
+                max_price=_optional_int(values, "max_price"),
+                prefix_last=_flag(values, "prefix", False),
+                match_all=_flag(values, "all", True),
+            )
+        except ValueError as exc:
+            self._send_json(HTTPStatus.BAD_REQUEST, {"error": str(exc)})
+            return
+        metrics.observe("search", result.seconds)
+        metrics.count("search_requests")
+        self._send_json(HTTPStatus.OK, result.as_dict())
+
+
+def serve(index: SearchIndex, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> None:
+    handler = type("BoundSearchHandler", (SearchHandler,), {"index": index})
+    server = ThreadingHTTPServer((host, port), handler)
+    print(f"Serving {index.stats()['documents']} documents on http://{host}:{server.server_port}/search")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Search the food items.")
+    parser.add_argument("--index-dir", type=Path, default=INDEX_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    index_parser = commands.add_parser("index", help="Add or update documents.")
+    index_parser.add_argument("--food-items", type=Path, default=OUTPUT_FOOD_ITEMS)
+    index_parser.add_argument("--restaurants", type=Path, default=OUTPUT_RESTAURANTS)
+    index_parser.add_argument("--menus", type=Path, default=None,
+                              help="Index scraped menus (raw JSONL or the Parquet directory) instead of the exports.")
+    index_parser.add_argument("--full", action="store_true",
+                              help="The input is the whole collection: delete restaurants missing from it.")
+    index_parser.add_argument("--merge", action="store_true", help="Merge all segments afterwards.")
+
+    query_parser = commands.add_parser("query", help="Run one query.")
+    query_parser.add_argument("query")
+    query_parser.add_argument("--service", action="append", default=None)
+    query_parser.add_argument("--zone", action="append", default=None)
+    query_parser.add_argument("--min-price", type=int, default=None)
+    query_parser.add_argument("--max-price", type=int, default=None)
+    query_parser.add_argument("--limit", type=int, default=10)
+    query_parser.add_argument("--prefix", action="store_true", help="Treat the last word as a prefix.")
+    query_parser.add_argument("--any", action="store_true", help="Match any word instead of all of them.")
+
+    serve_parser = commands.add_parser("serve", help="Serve /search and /stats over HTTP.")
+    serve_parser.add_argument("--host", default=DEFAULT_HOST)
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+
+    commands.add_parser("stats", help="Print index statistics.")
+    args = parser.parse_args()
+
+    metrics.configure("search_food", METRICS_DIR)
+    with SearchIndex(args.index_dir) as index:
+        if args.command == "index":
+            if args.menus is not None:
+                documents = iter_menu_documents(args.menus)
+            else:
+                documents = iter_export_documents(args.food_items, args.restaurants)
+            with metrics.stage("index"):
+                stats = index.update(metrics.timed_iter("read", documents), replace_all=args.full)
+                if args.merge and not stats.merged:
+                    index.merge()
+            print(
+                f"Indexed {stats.added} new documents, deleted {stats.deleted}, kept {stats.unchanged} "
+                f"({len(index.segments)} segments{', merged' if stats.merged or args.merge else ''})."
+            )
+            print(json.dumps(index.stats()))
+        elif args.command == "query":
+            result = index.search(
+                args.query,
+                limit=args.limit,
+                service=args.service,
+                zone=args.zone,
+                min_price=args.min_price,
+                max_price=args.max_price,
+                prefix_last=args.prefix,
+                match_all=not args.any,
+            )
+            print(f"{result.total} matches in {result.seconds * 1000:.2f} ms")
+            for hit in result.hits:
+                document = hit.document
+                print(
+                    f"{hit.score:7.3f}  {document.get('food')} | {document.get('category')} | "
+                    f"{document.get('restaurant')} ({document.get('service')}, {document.get('zone')}) "
+                    f"${document.get('price')}"
+                )
+        elif args.command == "serve":
+            serve(index, args.host, args.port)
+        else:
+            print(json.dumps(index.stats(), indent=2))
+    if args.command == "index":
+        print(metrics.summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,397 @@
+"""
+Incremental sync of the CSV exports to Supabase.
+
+Instead of truncating and reloading both tables, every row gets a stable id
+derived from a natural key and a hash of its content. The new export is diffed
+against a local manifest of what the last sync sent, and only inserts, updates
+and deletes are sent as batched upserts/deletes. The manifest is replaced only
+after all changes were accepted, so a failed sync is simply retried in full
+next time.
+
+The first sync is a one-time migration, not a diff: rows loaded by
+upload_supabase.py have sequential ids, which never match the stable ids, so
+every exported row is inserted and every existing row is deleted. It only
+runs with --migrate (check the counts with --dry-run first); an empty table
+needs no flag. Later syncs send only what changed.
+
+    python src/sync_supabase.py --dry-run
+    python src/sync_supabase.py --migrate   # first run against tables loaded by upload_supabase.py
+    python src/sync_supabase.py
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+from psycopg2 import sql
+from supabase import Client
+
+from upload_supabase import (
+    CSV_DIR,
+    DEFAULT_BATCH_SIZE,
+    FOOD_ITEM_FLOAT_FIELDS,
+    FOOD_ITEM_INT_FIELDS,
+    FOOD_ITEMS_CSV,
+    METRICS_DIR,
+    RESTAURANT_FLOAT_FIELDS,
+    RESTAURANT_INT_FIELDS,
+    RESTAURANTS_CSV,
+    RETRY_BASE_DELAY,
+    _call_with_retry,
+    _db_schema,
+    _require_env,
+    _stream_csv_batches,
+    _upload_settings,
+    get_client,
+    get_database_connection,
+    get_table_columns,
+    upload_batches_concurrent,
+)
+from utils import metrics
+
+MANIFEST_PATH = CSV_DIR / "sync_manifest.sqlite3"
+
+RESTAURANT_KEY_FIELDS = ("service", "name", "address", "latitude", "longitude")
+FOOD_ITEM_KEY_FIELDS = ("food", "category", "description")
+# Not part of the content hash: ids are derived, created_at changes every export.
+HASH_IGNORED_FIELDS = {"id", "restaurant_id", "created_at"}
+# Kept from the original insert when a row is updated.
+UPDATE_IGNORED_FIELDS = {"created_at"}
+
+_MANIFEST_SCHEMA = """
+CREATE TABLE IF NOT EXISTS manifest (
+    table_name TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    row_hash TEXT NOT NULL,
+    PRIMARY KEY (table_name, id)
+);
+"""
+_CURRENT_SCHEMA = """
+CREATE TEMP TABLE current (
+    table_name TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    row_hash TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    PRIMARY KEY (table_name, id)
+);
+"""
+
+
+def stable_id(*parts: Any) -> int:
+    """Positive 63-bit id derived from the natural key of a row."""
+    digest = hashlib.blake2b("\x1f".join(str(part) for part in parts).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") >> 1
+
+
+def row_hash(row: Dict[str, Any]) -> str:
+    content = {key: value for key, value in row.items() if key not in HASH_IGNORED_FIELDS}
+    encoded = json.dumps(content, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.blake2b(encoded.encode("utf-8"), digest_size=16).hexdigest()
+
+
+@dataclass
+class TableDiff:
+    table_name: str
+    inserts: int = 0
+    updates: int = 0
+    deletes: int = 0
+    unchanged: int = 0
+
+
+class SyncManifest:
+    """Rows sent by the last successful sync, plus a staging area for the current export."""
+
+    def __init__(self, path: Path = MANIFEST_PATH):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path))
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_MANIFEST_SCHEMA)
+        self._conn.executescript(_CURRENT_SCHEMA)
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __enter__(self) -> "SyncManifest":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def has_rows(self, table_name: str) -> bool:
+        row = self._conn.execute("SELECT 1 FROM manifest WHERE table_name = ? LIMIT 1", (table_name,)).fetchone()
+        return row is not None
+
+    def seed_from_database(self, table_name: str, ids: Sequence[int]) -> None:
+        """
+        Use the ids in the database as the previous state, with unknown hashes.
+        Ids that are not stable ids (rows from upload_supabase.py) all end up
+        as deletes; see the module docstring.
+        """
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO manifest (table_name, id, row_hash) VALUES (?, ?, '')",
+            ((table_name, row_id) for row_id in ids),
+        )
+
+    def stage(self, table_name: str, rows: Sequence[Dict[str, Any]]) -> None:
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO current (table_name, id, row_hash, payload) VALUES (?, ?, ?, ?)",
+            (
+                (table_name, row["id"], row_hash(row), json.dumps(row, ensure_ascii=False))
+                for row in rows
+            ),
+        )
+
+    def diff(self, table_name: str) -> TableDiff:
+        counts = self._conn.execute(
+            """
+            SELECT
+                SUM(m.id IS NULL),
+                SUM(m.id IS NOT NULL AND m.row_hash != c.row_hash),
+                SUM(m.id IS NOT NULL AND m.row_hash = c.row_hash)
+            FROM current c
+            LEFT JOIN manifest m ON m.table_name = c.table_name AND m.id = c.id
+            WHERE c.table_name = ?
+            """,
+            (table_name,),
+        ).fetchone()
+        deletes = self._conn.execute(
+            """
+            SELECT COUNT(*) FROM manifest m
+            LEFT JOIN current c ON c.table_name = m.table_name AND c.id = m.id
+            WHERE m.table_name = ? AND c.id IS NULL
+            """,
+            (table_name,),
+        ).fetchone()[0]
+        inserts, updates, unchanged = (value or 0 for value in counts)
+        return TableDiff(table_name, inserts=inserts, updates=updates, deletes=deletes, unchanged=unchanged)
+
+    def iter_upserts(self, table_name: str, *, new: bool, batch_size: int) -> Iterator[List[Dict[str, Any]]]:
+        """Batches of staged rows that are new (`new=True`) or changed (`new=False`)."""
+        condition = "m.id IS NULL" if new else "m.id IS NOT NULL AND m.row_hash != c.row_hash"
+        cursor = self._conn.execute(
+            f"""
+            SELECT c.payload FROM current c
+            LEFT JOIN manifest m ON m.table_name = c.table_name AND m.id = c.id
+            WHERE c.table_name = ? AND {condition}
+            """,
+            (table_name,),
+        )
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield [json.loads(payload) for (payload,) in rows]
+
+    def iter_deletes(self, table_name: str, *, batch_size: int) -> Iterator[List[int]]:
+        cursor = self._conn.execute(
+            """
+            SELECT m.id FROM manifest m
+            LEFT JOIN current c ON c.table_name = m.table_name AND c.id = m.id
+            WHERE m.table_name = ? AND c.id IS NULL
+            """,
+            (table_name,),
+        )
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield [row_id for (row_id,) in rows]
+
+    def commit(self, table_names: Sequence[str]) -> None:
+        """Make the staged export the new manifest."""
+        with self._conn:
+            for table_name in table_names:
+                self._conn.execute("DELETE FROM manifest WHERE table_name = ?", (table_name,))
+                self._conn.execute(
+                    """
+                    INSERT INTO manifest (table_name, id, row_hash)
+                    SELECT table_name, id, row_hash FROM current WHERE table_name = ?
+                    """,
+                    (table_name,),
+                )
+
+
+def _stable_restaurants(batch_size: int, allowed_fields: Set[str]) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """Yield (csv id, row with stable id) for every restaurant in the export."""
+    for batch in _stream_csv_batches(
+        RESTAURANTS_CSV,
+        int_fields=RESTAURANT_INT_FIELDS,
+        float_fields=RESTAURANT_FLOAT_FIELDS,
+        batch_size=batch_size,
+        allowed_fields=allowed_fields | {"id"},
+    ):
+        for row in batch:
+            csv_id = row["id"]
+            row["id"] = stable_id("restaurant", *(row.get(field) for field in RESTAURANT_KEY_FIELDS))
+            yield csv_id, row
+
+
+def _stable_food_items(
+    batch_size: int,
+    allowed_fields: Set[str],
+    restaurant_ids: Dict[int, int],
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yield food items with stable ids. Items of one restaurant that share the
+    natural key are told apart by their order of appearance.
+    """
+    occurrences: Dict[Tuple[Any, ...], int] = {}
+    current_restaurant: Optional[int] = None
+    for batch in _stream_csv_batches(
+        FOOD_ITEMS_CSV,
+        int_fields=FOOD_ITEM_INT_FIELDS,
+        float_fields=FOOD_ITEM_FLOAT_FIELDS,
+        batch_size=batch_size,
+        allowed_fields=allowed_fields | {"id", "restaurant_id"},
+    ):
+        for row in batch:
+            restaurant_id = restaurant_ids.get(row.get("restaurant_id"))
+            if restaurant_id is None:
+                continue
+            if restaurant_id != current_restaurant:
+                occurrences.clear()
+                current_restaurant = restaurant_id
+            key = tuple(row.get(field) for field in FOOD_ITEM_KEY_FIELDS)
+            occurrence = occurrences.get(key, 0)
+            occurrences[key] = occurrence + 1
+            row["restaurant_id"] = restaurant_id
+            row["id"] = stable_id("food_item", restaurant_id, *key, occurrence)
+            yield row
+
+
+def _chunked(rows: Iterator[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    batch: List[Dict[str, Any]] = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _database_ids(table_name: str) -> List[int]:
+    with get_database_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(sql.SQL("SELECT id FROM {}").format(sql.Identifier(_db_schema(), table_name)))
+            return [row[0] for row in cursor.fetchall()]
+
+
+def _apply_upserts(
+    client: Client,
+    manifest: SyncManifest,
+    table_name: str,
+    batch_size: int,
+) -> None:
+    settings = _upload_settings()
+    inserts = manifest.iter_upserts(table_name, new=True, batch_size=batch_size)
+    print(f"Inserted {upload_batches_concurrent(client, table_name, inserts, **settings).summary()}.")
+    updates = (
+        [{key: value for key, value in row.items() if key not in UPDATE_IGNORED_FIELDS} for row in batch]
+        for batch in manifest.iter_upserts(table_name, new=False, batch_size=batch_size)
+    )
+    print(f"Updated {upload_batches_concurrent(client, table_name, updates, **settings).summary()}.")
+
+
+def _apply_deletes(client: Client, manifest: SyncManifest, table_name: str, batch_size: int) -> None:
+    max_retries = _upload_settings()["max_retries"]
+    for ids in manifest.iter_deletes(table_name, batch_size=batch_size):
+        # Deleting by id is idempotent, so a retry after a lost response is safe.
+        _call_with_retry(
+            lambda ids=ids: client.table(table_name).delete().in_("id", ids).execute(),
+            table_name=table_name,
+            description=f"Delete of {len(ids)} rows from {table_name}",
+            stage="delete",
+            max_retries=max_retries,
+            base_delay=RETRY_BASE_DELAY,
+        )
+
+
+def sync_from_csv(
+    *,
+    dry_run: bool = False,
+    manifest_path: Path = MANIFEST_PATH,
+    migrate: bool = False,
+) -> List[TableDiff]:
+    """
+    Diff the exports against the manifest and apply the changes. Without a
+    manifest, rows already in a table are replaced wholesale, which needs
+    `migrate=True` (a RuntimeError otherwise, before anything is sent).
+    """
+    restaurants_table = _require_env("SUPABASE_TABLE_RESTAURANTS")
+    food_items_table = _require_env("SUPABASE_TABLE_FOOD_ITEMS")
+    batch_size = int(os.getenv("SUPABASE_BATCH_SIZE", str(DEFAULT_BATCH_SIZE)))
+
+    restaurant_columns = get_table_columns(restaurants_table)
+    food_columns = get_table_columns(food_items_table)
+
+    with SyncManifest(manifest_path) as manifest:
+        seeds = {
+            table_name: _database_ids(table_name)
+            for table_name in (restaurants_table, food_items_table)
+            if not manifest.has_rows(table_name)
+        }
+        unmigrated = [f"{table_name} ({len(ids)} rows)" for table_name, ids in seeds.items() if ids]
+        if unmigrated and not migrate and not dry_run:
+            raise RuntimeError(
+                f"First sync would replace every row of {', '.join(unmigrated)}; "
+                f"check it with --dry-run and rerun with --migrate."
+            )
+        for table_name, ids in seeds.items():
+            if ids:
+                print(
+                    f"No sync manifest for {table_name}: its {len(ids)} existing rows will be deleted "
+                    f"and the export inserted with stable ids (one-time migration)."
+                )
+            manifest.seed_from_database(table_name, ids)
+
+        # csv id -> stable id, needed to rewrite restaurant_id on the food items.
+        restaurant_ids: Dict[int, int] = {}
+        batch: List[Dict[str, Any]] = []
+        for csv_id, row in _stable_restaurants(batch_size, restaurant_columns):
+            restaurant_ids[csv_id] = row["id"]
+            batch.append(row)
+            if len(batch) >= batch_size:
+                manifest.stage(restaurants_table, batch)
+                batch = []
+        if batch:
+            manifest.stage(restaurants_table, batch)
+
+        for batch in _chunked(_stable_food_items(batch_size, food_columns, restaurant_ids), batch_size):
+            manifest.stage(food_items_table, batch)
+
+        diffs = [manifest.diff(restaurants_table), manifest.diff(food_items_table)]
+        for diff in diffs:
+            print(
+                f"{diff.table_name}: {diff.inserts} inserts, {diff.updates} updates, "
+                f"{diff.deletes} deletes, {diff.unchanged} unchanged."
+            )
+        if dry_run:
+            return diffs
+
+        client = get_client()
+        # Parents before children on the way in, children before parents on the way out.
+        _apply_upserts(client, manifest, restaurants_table, batch_size)
+        _apply_upserts(client, manifest, food_items_table, batch_size)
+        _apply_deletes(client, manifest, food_items_table, batch_size)
+        _apply_deletes(client, manifest, restaurants_table, batch_size)
+
+        manifest.commit([restaurants_table, food_items_table])
+    print("Sync complete.")
+    return diffs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incrementally sync the CSV exports to Supabase.")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would change.")
+    parser.add_argument("--manifest", type=Path, default=MANIFEST_PATH)
+    parser.add_argument("--migrate", action="store_true",
+                        help="Allow the first sync to replace rows loaded by upload_supabase.py.")
+    args = parser.parse_args()
+    metrics.configure("sync_supabase", METRICS_DIR)
+    sync_from_csv(dry_run=args.dry_run, manifest_path=args.manifest, migrate=args.migrate)
+    print(metrics.summary())
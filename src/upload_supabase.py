@@ -1,21 +1,46 @@
+import argparse
 import csv
+import io
+import json
 import os
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Set
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
 
+import httpx
 import psycopg2
 from psycopg2 import sql
 from psycopg2.extensions import connection as PgConnection
+from postgrest.exceptions import APIError
 from supabase import Client, create_client
 from dotenv import load_dotenv
 
+from utils import metrics
+
 load_dotenv()
 
 BASE_DIR = Path(__file__).resolve().parents[1]
 CSV_DIR = BASE_DIR / "supabase_update"
 RESTAURANTS_CSV = CSV_DIR / "restaurants.csv"
 FOOD_ITEMS_CSV = CSV_DIR / "food_items.csv"
+# Written next to the CSVs by `clean_data.py --parquet` and, after the emoji
+# and price steps, by the cleaning notebook's last cell.
+RESTAURANTS_PARQUET = RESTAURANTS_CSV.with_suffix(".parquet")
+FOOD_ITEMS_PARQUET = FOOD_ITEMS_CSV.with_suffix(".parquet")
+METRICS_DIR = BASE_DIR / "uber" / "data" / "metrics"
 DEFAULT_BATCH_SIZE = 1000
+DEFAULT_BATCH_BYTES = 512 * 1024
+DEFAULT_UPLOAD_WORKERS = 4
+DEFAULT_MAX_RETRIES = 5
+RETRY_BASE_DELAY = 1.0
+
+RESTAURANT_INT_FIELDS = {"id"}
+RESTAURANT_FLOAT_FIELDS = {"latitude", "longitude"}
+FOOD_ITEM_INT_FIELDS = {"id", "restaurant_id"}
+FOOD_ITEM_FLOAT_FIELDS: Set[str] = set()
 
 
 def _db_schema() -> str:
@@ -111,14 +136,330 @@ def _stream_csv_batches(
             yield batch
 
 
-def _upload_batches(client: Client, table_name: str, batches: Iterable[List[Dict[str, Any]]]) -> int:
-    total = 0
+@dataclass
+class UploadStats:
+    table_name: str
+    rows: int = 0
+    batches: int = 0
+    bytes: int = 0
+    retries: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    @property
+    def megabytes_per_second(self) -> float:
+        return self.bytes / self.seconds / 1e6 if self.seconds else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"{self.rows} rows in {self.batches} batches to {self.table_name} in {self.seconds:.1f}s "
+            f"({self.rows_per_second:,.0f} rows/s, {self.megabytes_per_second:.2f} MB/s, {self.retries} retries)"
+        )
+
+
+def _byte_sized_batches(
+    batches: Iterable[List[Dict[str, Any]]],
+    *,
+    max_bytes: int,
+    max_rows: int,
+) -> Iterator[Tuple[List[Dict[str, Any]], int]]:
+    """
+    Regroup rows into batches whose JSON body stays under `max_bytes` (and
+    `max_rows`). Yields (batch, approximate body size). A single row larger
+    than `max_bytes` is sent on its own.
+    """
+    if max_bytes <= 0 or max_rows <= 0:
+        raise ValueError("Batch limits must be positive")
+    batch: List[Dict[str, Any]] = []
+    size = 2  # the enclosing brackets
+    for rows in batches:
+        for row in rows:
+            row_size = len(json.dumps(row, ensure_ascii=False).encode("utf-8")) + 1
+            if batch and (size + row_size > max_bytes or len(batch) >= max_rows):
+                yield batch, size
+                batch, size = [], 2
+            batch.append(row)
+            size += row_size
+    if batch:
+        yield batch, size
+
+
+def _call_with_retry(
+    call: Callable[[], Any],
+    *,
+    table_name: str,
+    description: str,
+    stage: str,
+    max_retries: int,
+    base_delay: float,
+) -> int:
+    """
+    Run one idempotent request against `table_name`, retrying API and HTTP
+    errors with exponential back-off. Timed as `stage`; errors and retries
+    are counted as `<stage>_errors` / `<stage>_retries`. Returns the number
+    of retries it took.
+    """
+    attempt = 0
+    while True:
+        try:
+            with metrics.stage(stage):
+                call()
+            return attempt
+        except (APIError, httpx.HTTPError) as exc:
+            code = getattr(exc, "code", None) or type(exc).__name__
+            metrics.count(f"{stage}_errors", table=table_name, code=code)
+            if attempt >= max_retries:
+                raise
+            delay = base_delay * (2 ** attempt) * (1.0 + random.uniform(0.0, 0.25))
+            attempt += 1
+            metrics.count(f"{stage}_retries", table=table_name)
+            print(f"{description} failed ({exc}); retry {attempt} in {delay:.1f}s.")
+            time.sleep(delay)
+
+
+def _send_with_retry(
+    client: Client,
+    table_name: str,
+    batch: List[Dict[str, Any]],
+    *,
+    max_retries: int,
+    base_delay: float,
+) -> int:
+    """
+    Upsert one batch on the primary key, so a retry after a lost response
+    cannot duplicate rows. Returns the number of retries it took.
+    """
+    return _call_with_retry(
+        lambda: client.table(table_name).upsert(batch, on_conflict="id").execute(),
+        table_name=table_name,
+        description=f"Batch of {len(batch)} rows to {table_name}",
+        stage="upload",
+        max_retries=max_retries,
+        base_delay=base_delay,
+    )
+
+
+def upload_batches_concurrent(
+    client: Client,
+    table_name: str,
+    batches: Iterable[List[Dict[str, Any]]],
+    *,
+    workers: int = DEFAULT_UPLOAD_WORKERS,
+    max_bytes: int = DEFAULT_BATCH_BYTES,
+    max_rows: int = DEFAULT_BATCH_SIZE,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    base_delay: float = RETRY_BASE_DELAY,
+) -> UploadStats:
+    """
+    Send `batches` with up to `workers` requests in flight while the calling
+    thread keeps parsing the next ones. At most `2 * workers` batches are held
+    in memory. Batches are regrouped by serialized size and retried with
+    exponential back-off; the first batch that exhausts its retries raises
+    after the in-flight ones finish.
+    """
+    if workers <= 0:
+        raise ValueError("Workers must be positive")
+    stats = UploadStats(table_name)
+    started = time.perf_counter()
+    in_flight: Dict[Future, Tuple[int, int]] = {}
+
+    def collect(done: Iterable[Future]) -> None:
+        for future in done:
+            rows, size = in_flight.pop(future)
+            stats.retries += future.result()
+            stats.rows += rows
+            stats.bytes += size
+            stats.batches += 1
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        try:
+            # "prepare": reading, normalizing and sizing the next batch on this thread.
+            sized = _byte_sized_batches(batches, max_bytes=max_bytes, max_rows=max_rows)
+            for batch, size in metrics.timed_iter("prepare", sized):
+                if len(in_flight) >= workers * 2:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(done)
+                future = executor.submit(
+                    _send_with_retry,
+                    client,
+                    table_name,
+                    batch,
+                    max_retries=max_retries,
+                    base_delay=base_delay,
+                )
+                in_flight[future] = (len(batch), size)
+            collect(list(in_flight))
+        except BaseException:
+            for future in in_flight:
+                future.cancel()
+            raise
+    stats.seconds = time.perf_counter() - started
+    metrics.count("upload_rows", stats.rows, table=table_name)
+    metrics.count("upload_batches", stats.batches, table=table_name)
+    metrics.count("upload_bytes", stats.bytes, table=table_name)
+    metrics.event("upload", table=table_name, rows=stats.rows, batches=stats.batches, bytes=stats.bytes,
+                  retries=stats.retries, seconds=round(stats.seconds, 3))
+    return stats
+
+
+def _upload_settings() -> Dict[str, int]:
+    return {
+        "workers": int(os.getenv("SUPABASE_UPLOAD_WORKERS", str(DEFAULT_UPLOAD_WORKERS))),
+        "max_bytes": int(os.getenv("SUPABASE_BATCH_BYTES", str(DEFAULT_BATCH_BYTES))),
+        "max_rows": int(os.getenv("SUPABASE_BATCH_SIZE", str(DEFAULT_BATCH_SIZE))),
+        "max_retries": int(os.getenv("SUPABASE_MAX_RETRIES", str(DEFAULT_MAX_RETRIES))),
+    }
+
+
+def _csv_columns(csv_path: Path, allowed_fields: Optional[Set[str]] = None) -> List[str]:
+    if not csv_path.exists():
+        raise FileNotFoundError(f"CSV file not found: {csv_path}")
+    with csv_path.open(newline="", encoding="utf-8") as handle:
+        header = next(csv.reader(handle), [])
+    return [column for column in header if allowed_fields is None or column in allowed_fields]
+
+
+class _ChunkStream(io.TextIOBase):
+    """Read-only file object over an iterator of text chunks, for cursor.copy_expert."""
+
+    def __init__(self, chunks: Iterator[str]):
+        self._chunks = chunks
+        self._buffer = ""
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: Optional[int] = -1) -> str:
+        if size is None or size < 0:
+            data = self._buffer + "".join(self._chunks)
+            self._buffer = ""
+            return data
+        while len(self._buffer) < size:
+            try:
+                self._buffer += next(self._chunks)
+            except StopIteration:
+                break
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def _batches_as_csv(batches: Iterable[List[Dict[str, Any]]], columns: Sequence[str]) -> Iterator[str]:
+    """
+    Serialize normalized batches as CSV text for COPY. None becomes an
+    unquoted empty field, which COPY reads as NULL.
+    """
     for batch in batches:
-        if not batch:
-            continue
-        client.table(table_name).insert(batch).execute()
-        total += len(batch)
-    return total
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        for row in batch:
+            writer.writerow(["" if row.get(column) is None else row[column] for column in columns])
+        yield buffer.getvalue()
+
+
+def copy_csv_into_table(
+    conn: PgConnection,
+    table_name: str,
+    csv_path: Path,
+    *,
+    int_fields: Set[str],
+    float_fields: Set[str],
+    batch_size: int,
+    allowed_fields: Optional[Set[str]] = None,
+) -> int:
+    """
+    Stream a CSV export into `table_name` with COPY ... FROM STDIN on `conn`.
+    Rows go through the same normalization as the REST path. The caller owns
+    the transaction. Returns the number of rows copied.
+    """
+    columns = _csv_columns(csv_path, allowed_fields)
+    batches = _stream_csv_batches(
+        csv_path,
+        int_fields=int_fields,
+        float_fields=float_fields,
+        batch_size=batch_size,
+        allowed_fields=set(columns),
+    )
+    return _copy_batches(conn, table_name, columns, batches)
+
+
+def _copy_batches(
+    conn: PgConnection,
+    table_name: str,
+    columns: Sequence[str],
+    batches: Iterable[List[Dict[str, Any]]],
+) -> int:
+    query = sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv)").format(
+        sql.Identifier(_db_schema(), table_name),
+        sql.SQL(", ").join(sql.Identifier(column) for column in columns),
+    )
+    with conn.cursor() as cursor, metrics.stage("copy"):
+        cursor.copy_expert(query.as_string(conn), _ChunkStream(_batches_as_csv(batches, columns)))
+        copied = cursor.rowcount
+    metrics.count("copy_rows", copied, table=table_name)
+    return copied
+
+
+def _stream_parquet_batches(
+    parquet_path: Path,
+    *,
+    batch_size: int,
+    allowed_fields: Optional[Set[str]] = None,
+) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Row batches from a Parquet export. Only the allowed columns are decoded
+    (memory-mapped) and values already carry their types, so no per-row
+    normalization is needed.
+    """
+    from utils.columnar import iter_row_batches
+
+    if not parquet_path.exists():
+        raise FileNotFoundError(f"Parquet file not found: {parquet_path}")
+    columns = sorted(allowed_fields) if allowed_fields is not None else None
+    yield from iter_row_batches(parquet_path, columns=columns, batch_size=batch_size)
+
+
+def check_parquet_export(parquet_path: Path, csv_path: Path) -> None:
+    """
+    Refuse a Parquet export that would upload different data than its CSV:
+    one older than the CSV (the notebook rewrote the CSV after the Parquet was
+    written) or missing one of the CSV's columns (e.g. `image`).
+    """
+    from utils.columnar import parquet_columns
+
+    if not parquet_path.exists():
+        raise FileNotFoundError(f"Parquet file not found: {parquet_path}")
+    if csv_path.exists():
+        if parquet_path.stat().st_mtime < csv_path.stat().st_mtime:
+            raise RuntimeError(
+                f"{parquet_path} is older than {csv_path}; rewrite it (the cleaning notebook's last cell) "
+                f"or upload the CSV without --parquet."
+            )
+        available = set(parquet_columns(parquet_path))
+        missing = [column for column in _csv_columns(csv_path) if column not in available]
+        if missing:
+            raise RuntimeError(f"{parquet_path} lacks the columns {missing} of {csv_path}.")
+
+
+def copy_parquet_into_table(
+    conn: PgConnection,
+    table_name: str,
+    parquet_path: Path,
+    *,
+    batch_size: int,
+    allowed_fields: Optional[Set[str]] = None,
+) -> int:
+    """COPY a Parquet export into `table_name`. The caller owns the transaction."""
+    from utils.columnar import parquet_columns
+
+    columns = [
+        column for column in parquet_columns(parquet_path)
+        if allowed_fields is None or column in allowed_fields
+    ]
+    batches = _stream_parquet_batches(parquet_path, batch_size=batch_size, allowed_fields=set(columns))
+    return _copy_batches(conn, table_name, columns, batches)
 
 
 def get_table_columns(table_name: str) -> Set[str]:
@@ -137,10 +478,14 @@ def get_table_columns(table_name: str) -> Set[str]:
             return {row[0] for row in cursor.fetchall()}
 
 
-def upload_from_csv() -> None:
+def upload_from_csv(parquet: bool = False) -> None:
     restaurants_table = _require_env("SUPABASE_TABLE_RESTAURANTS")
     food_items_table = _require_env("SUPABASE_TABLE_FOOD_ITEMS")
     batch_size = int(os.getenv("SUPABASE_BATCH_SIZE", str(DEFAULT_BATCH_SIZE)))
+    settings = _upload_settings()
+    if parquet:
+        check_parquet_export(RESTAURANTS_PARQUET, RESTAURANTS_CSV)
+        check_parquet_export(FOOD_ITEMS_PARQUET, FOOD_ITEMS_CSV)
 
     truncate_supabase_tables([food_items_table, restaurants_table])
 
@@ -149,26 +494,115 @@ def upload_from_csv() -> None:
     restaurant_columns = get_table_columns(restaurants_table)
     food_columns = get_table_columns(food_items_table)
 
-    restaurant_batches = _stream_csv_batches(
-        RESTAURANTS_CSV,
-        int_fields={"id"},
-        float_fields={"latitude", "longitude"},
-        batch_size=batch_size,
-        allowed_fields=restaurant_columns,
-    )
-    restaurants_uploaded = _upload_batches(client, restaurants_table, restaurant_batches)
-    print(f"Uploaded {restaurants_uploaded} restaurants to {restaurants_table}.")
+    if parquet:
+        restaurant_batches = _stream_parquet_batches(
+            RESTAURANTS_PARQUET, batch_size=batch_size, allowed_fields=restaurant_columns
+        )
+    else:
+        restaurant_batches = _stream_csv_batches(
+            RESTAURANTS_CSV,
+            int_fields=RESTAURANT_INT_FIELDS,
+            float_fields=RESTAURANT_FLOAT_FIELDS,
+            batch_size=batch_size,
+            allowed_fields=restaurant_columns,
+        )
+    restaurant_stats = upload_batches_concurrent(client, restaurants_table, restaurant_batches, **settings)
+    print(f"Uploaded {restaurant_stats.summary()}.")
 
-    food_batches = _stream_csv_batches(
-        FOOD_ITEMS_CSV,
-        int_fields={"id", "restaurant_id"},
-        float_fields=set(),
-        batch_size=batch_size,
-        allowed_fields=food_columns,
-    )
-    food_uploaded = _upload_batches(client, food_items_table, food_batches)
-    print(f"Uploaded {food_uploaded} food items to {food_items_table}.")
+    if parquet:
+        food_batches = _stream_parquet_batches(FOOD_ITEMS_PARQUET, batch_size=batch_size, allowed_fields=food_columns)
+    else:
+        food_batches = _stream_csv_batches(
+            FOOD_ITEMS_CSV,
+            int_fields=FOOD_ITEM_INT_FIELDS,
+            float_fields=FOOD_ITEM_FLOAT_FIELDS,
+            batch_size=batch_size,
+            allowed_fields=food_columns,
+        )
+    food_stats = upload_batches_concurrent(client, food_items_table, food_batches, **settings)
+    print(f"Uploaded {food_stats.summary()}.")
+
+
+def copy_from_csv(parquet: bool = False) -> None:
+    """
+    Reload both tables over a direct Postgres connection: TRUNCATE and COPY
+    run in a single transaction, so readers never see empty tables and a
+    failure leaves the previous data in place. With `parquet`, the rows come
+    from the Parquet exports instead of the CSVs.
+    """
+    restaurants_table = _require_env("SUPABASE_TABLE_RESTAURANTS")
+    food_items_table = _require_env("SUPABASE_TABLE_FOOD_ITEMS")
+    batch_size = int(os.getenv("SUPABASE_BATCH_SIZE", str(DEFAULT_BATCH_SIZE)))
+    if parquet:
+        check_parquet_export(RESTAURANTS_PARQUET, RESTAURANTS_CSV)
+        check_parquet_export(FOOD_ITEMS_PARQUET, FOOD_ITEMS_CSV)
+
+    restaurant_columns = get_table_columns(restaurants_table)
+    food_columns = get_table_columns(food_items_table)
+
+    with get_database_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                sql.SQL("TRUNCATE TABLE {} RESTART IDENTITY CASCADE;").format(
+                    sql.SQL(", ").join(
+                        sql.Identifier(_db_schema(), table) for table in (food_items_table, restaurants_table)
+                    )
+                )
+            )
+        if parquet:
+            restaurants_uploaded = copy_parquet_into_table(
+                conn,
+                restaurants_table,
+                RESTAURANTS_PARQUET,
+                batch_size=batch_size,
+                allowed_fields=restaurant_columns,
+            )
+            food_uploaded = copy_parquet_into_table(
+                conn,
+                food_items_table,
+                FOOD_ITEMS_PARQUET,
+                batch_size=batch_size,
+                allowed_fields=food_columns,
+            )
+        else:
+            restaurants_uploaded = copy_csv_into_table(
+                conn,
+                restaurants_table,
+                RESTAURANTS_CSV,
+                int_fields=RESTAURANT_INT_FIELDS,
+                float_fields=RESTAURANT_FLOAT_FIELDS,
+                batch_size=batch_size,
+                allowed_fields=restaurant_columns,
+            )
+            food_uploaded = copy_csv_into_table(
+                conn,
+                food_items_table,
+                FOOD_ITEMS_CSV,
+                int_fields=FOOD_ITEM_INT_FIELDS,
+                float_fields=FOOD_ITEM_FLOAT_FIELDS,
+                batch_size=batch_size,
+                allowed_fields=food_columns,
+            )
+    print(f"Copied {restaurants_uploaded} restaurants to {restaurants_table}.")
+    print(f"Copied {food_uploaded} food items to {food_items_table}.")
 
 
 if __name__ == "__main__":
-    upload_from_csv()
+    parser = argparse.ArgumentParser(description="Upload the CSV exports to Supabase.")
+    parser.add_argument(
+        "--copy",
+        action="store_true",
+        help="Load through COPY over the direct Postgres connection instead of PostgREST inserts.",
+    )
+    parser.add_argument(
+        "--parquet",
+        action="store_true",
+        help="Read the Parquet exports instead of the CSVs (refused if older than the CSVs or missing columns).",
+    )
+    args = parser.parse_args()
+    metrics.configure("upload_supabase", METRICS_DIR)
+    if args.copy:
+        copy_from_csv(parquet=args.parquet)
+    else:
+        upload_from_csv(parquet=args.parquet)
+    print(metrics.summary())
@@ -0,0 +1,160 @@
+"""
+Content-addressed archive of raw HTTP responses.
+
+Each response body is gzip-compressed and stored once under its SHA-256
+(`blobs/ab/abcdef....gz`); a SQLite index maps every fetch (URL, kind, fetch
+time, status and optional metadata) to its blob. Scrapers write every page they
+download so extraction logic can later be re-run from disk without touching the
+network.
+"""
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Union
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    url TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    status INTEGER,
+    sha256 TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    meta TEXT
+);
+CREATE INDEX IF NOT EXISTS responses_url ON responses (url, fetched_at);
+CREATE INDEX IF NOT EXISTS responses_kind_time ON responses (kind, fetched_at);
+"""
+
+
+@dataclass
+class ArchivedResponse:
+    kind: str
+    url: str
+    fetched_at: float
+    status: Optional[int]
+    sha256: str
+    meta: Dict[str, Any]
+    archive: "ResponseArchive" = field(repr=False, compare=False)
+
+    def text(self) -> str:
+        return self.archive.read_blob(self.sha256)
+
+
+class ResponseArchive:
+    """Gzip blob store plus a SQLite index keyed by URL and fetch time."""
+
+    def __init__(self, root: Union[str, Path], *, compresslevel: int = 6):
+        self.root = Path(root)
+        self.blob_dir = self.root / "blobs"
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+        self.compresslevel = compresslevel
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.root / "index.sqlite3"), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self) -> "ResponseArchive":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _blob_path(self, digest: str) -> Path:
+        return self.blob_dir / digest[:2] / f"{digest}.gz"
+
+    def _write_blob(self, digest: str, data: bytes) -> None:
+        path = self._blob_path(digest)
+        if path.exists():
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as handle:
+                handle.write(gzip.compress(data, compresslevel=self.compresslevel))
+            os.replace(tmp_name, path)
+        except BaseException:
+            if os.path.exists(tmp_name):
+                os.unlink(tmp_name)
+            raise
+
+    def put(
+        self,
+        kind: str,
+        url: str,
+        body: Union[str, bytes],
+        *,
+        status: Optional[int] = None,
+        meta: Optional[Dict[str, Any]] = None,
+        fetched_at: Optional[float] = None,
+    ) -> str:
+        """Archive one response body and return its SHA-256."""
+        data = body.encode("utf-8") if isinstance(body, str) else body
+        digest = hashlib.sha256(data).hexdigest()
+        self._write_blob(digest, data)
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO responses (kind, url, fetched_at, status, sha256, size, meta)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    kind,
+                    url,
+                    time.time() if fetched_at is None else fetched_at,
+                    status,
+                    digest,
+                    len(data),
+                    json.dumps(meta, ensure_ascii=False) if meta else None,
+                ),
+            )
+        return digest
+
+    def read_blob(self, digest: str) -> str:
+        with gzip.open(self._blob_path(digest), "rb") as handle:
+            return handle.read().decode("utf-8")
+
+    def iter_latest(
+        self,
+        kind: str,
+        *,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+    ) -> Iterator[ArchivedResponse]:
+        """
+        Yield the most recent archived response of each URL of `kind` fetched
+        within [since, until), oldest first.
+        """
+        query = """
+            SELECT kind, url, MAX(fetched_at), status, sha256, meta
+            FROM responses
+            WHERE kind = ? AND fetched_at >= ? AND fetched_at < ?
+            GROUP BY url
+            ORDER BY MAX(fetched_at)
+        """
+        params = (kind, since if since is not None else 0.0, until if until is not None else float("inf"))
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        for kind_, url, fetched_at, status, digest, meta in rows:
+            yield ArchivedResponse(
+                kind=kind_,
+                url=url,
+                fetched_at=fetched_at,
+                status=status,
+                sha256=digest,
+                meta=json.loads(meta) if meta else {},
+                archive=self,
+            )
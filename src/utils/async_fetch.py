@@ -0,0 +1,186 @@
+"""
+Asynchronous HTTP fetching for the scrapers.
+
+Keeps a bounded number of requests in flight over a single pooled keep-alive
+session and spaces requests to the same host according to a per-host budget
+(a fixed-rate HostBudget or an adaptive rate_control.AimdRateController).
+"""
+import asyncio
+import random
+import time
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Callable, Dict, Optional, Sequence, Union
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from utils.rate_control import BLOCK_STATUS_CODES, AimdRateController, RetryQueue
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_TIMEOUT = 10.0
+
+
+@dataclass
+class FetchResult:
+    url: str
+    status: Optional[int]
+    text: Optional[str]
+    error: Optional[str] = None
+    headers: Dict[str, str] = field(default_factory=dict)
+    # Seconds from sending the request to reading the body (budget wait excluded).
+    elapsed: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.status is not None and 200 <= self.status < 300
+
+    @property
+    def blocked(self) -> bool:
+        return self.status in BLOCK_STATUS_CODES
+
+
+class HostBudget:
+    """Spaces requests to each host so it never sees more than `requests_per_second`."""
+
+    def __init__(self, requests_per_second: float, *, jitter: float = 0.25, block_pause: float = 300.0):
+        if requests_per_second <= 0:
+            raise ValueError("requests_per_second must be positive")
+        self.interval = 1.0 / requests_per_second
+        self.jitter = jitter
+        self.block_pause = block_pause
+        self._next_slot: Dict[str, float] = {}
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, host: str) -> None:
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            now = loop.time()
+            slot = max(now, self._next_slot.get(host, now))
+            spacing = self.interval * (1.0 + random.uniform(0.0, self.jitter))
+            self._next_slot[host] = slot + spacing
+        delay = slot - now
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def pause(self, host: str, seconds: Optional[float] = None) -> None:
+        """Push the next free slot for `host` at least `seconds` into the future."""
+        loop = asyncio.get_running_loop()
+        resume_at = loop.time() + (self.block_pause if seconds is None else seconds)
+        self._next_slot[host] = max(self._next_slot.get(host, 0.0), resume_at)
+
+    def record(self, host: str, status: Optional[int], headers: Optional[Dict[str, str]] = None) -> Optional[float]:
+        """Pause `host` for `block_pause` after a block response; returns the pause."""
+        if status in BLOCK_STATUS_CODES:
+            self.pause(host)
+            return self.block_pause
+        return None
+
+
+def _host(url: str) -> str:
+    return urlsplit(url).netloc
+
+
+async def _fetch_one(session: aiohttp.ClientSession, url: str, headers: Dict[str, str]) -> FetchResult:
+    started = time.perf_counter()
+    try:
+        async with session.get(url, headers=headers) as response:
+            text = await response.text()
+            return FetchResult(
+                url=url,
+                status=response.status,
+                text=text,
+                headers=dict(response.headers),
+                elapsed=time.perf_counter() - started,
+            )
+    except Exception as exc:
+        # Not only network errors: text() raises UnicodeDecodeError/LookupError on a
+        # bad charset. fetch_all expects one result per URL, so every failure is one.
+        return FetchResult(
+            url=url,
+            status=None,
+            text=None,
+            error=f"{type(exc).__name__}: {exc}",
+            elapsed=time.perf_counter() - started,
+        )
+
+
+async def fetch_all(
+    urls: Sequence[str],
+    *,
+    headers_factory: Callable[[], Dict[str, str]],
+    extra_headers: Optional[Callable[[str], Dict[str, str]]] = None,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    budget: Optional[Union[HostBudget, AimdRateController]] = None,
+    timeout: float = DEFAULT_TIMEOUT,
+    retry_queue: Optional[RetryQueue] = None,
+) -> AsyncIterator[FetchResult]:
+    """
+    Fetch every URL and yield results in completion order, one per URL.
+
+    At most `concurrency` requests are in flight at once. When a budget is
+    given, each request waits for its host slot and every response is fed
+    back to it (`budget.record`), so a block pauses or slows that host.
+    With a `retry_queue`, blocked URLs are retried once their pause is over,
+    while the queue still accepts them; only the final outcome is yielded.
+    `extra_headers(url)` adds per-URL headers such as conditional-request
+    validators.
+    """
+    if concurrency <= 0:
+        raise ValueError("Concurrency must be positive")
+    if not urls:
+        return
+
+    pending: asyncio.Queue = asyncio.Queue()
+    for url in urls:
+        pending.put_nowait(url)
+    results: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+
+    connector = aiohttp.TCPConnector(limit=concurrency, ttl_dns_cache=300)
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+    async with aiohttp.ClientSession(connector=connector, timeout=client_timeout) as session:
+
+        async def next_url() -> Optional[str]:
+            while True:
+                try:
+                    return pending.get_nowait()
+                except asyncio.QueueEmpty:
+                    pass
+                delay = retry_queue.next_delay() if retry_queue is not None else None
+                if delay is None:
+                    return None
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    continue
+                url = retry_queue.pop_ready()
+                if url is not None:
+                    return url
+
+        async def worker() -> None:
+            while True:
+                url = await next_url()
+                if url is None:
+                    return
+                host = _host(url)
+                if budget is not None:
+                    await budget.acquire(host)
+                try:
+                    headers = headers_factory()
+                    if extra_headers is not None:
+                        headers.update(extra_headers(url))
+                except Exception as exc:
+                    await results.put(FetchResult(url=url, status=None, text=None, error=f"{type(exc).__name__}: {exc}"))
+                    continue
+                result = await _fetch_one(session, url, headers)
+                pause = budget.record(host, result.status, result.headers) if budget is not None else None
+                if result.blocked and retry_queue is not None and retry_queue.push(url, pause or 0.0):
+                    continue
+                await results.put(result)
+
+        workers = [asyncio.create_task(worker()) for _ in range(min(concurrency, len(urls)))]
+        try:
+            for _ in range(len(urls)):
+                yield await results.get()
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
@@ -0,0 +1,397 @@
+"""
+Columnar (Arrow/Parquet) storage for the scraped menus and the cleaned exports.
+
+`ParquetSink` has the same write/flush/sync/close interface as the text sinks
+in `utils.sinks`, so it can sit in a `SinkGroup` next to them. Each flush
+writes one Parquet file per partition (hive layout, `crawl_date=.../zone=...`)
+so that a checkpoint leaves readable files on disk; `close` then compacts the
+files a run wrote into one file per partition. Repeated strings such as store
+and category names are dictionary-encoded.
+Readers memory-map the files and only decode the requested columns.
+
+Requires pyarrow.
+"""
+import json
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+from urllib.parse import unquote
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+PARTITION_COLUMNS = ("crawl_date", "zone")
+UNKNOWN_ZONE = "desconocida"
+
+_DICT_STRING = pa.dictionary(pa.int32(), pa.string())
+
+# One row per flattened menu item (what 04 writes to productos.csv).
+PRODUCT_SCHEMA = pa.schema([
+    ("name", pa.string()),
+    ("description", pa.string()),
+    ("price", pa.string()),
+    ("store_name", _DICT_STRING),
+    ("category_name", _DICT_STRING),
+    ("category_uber", _DICT_STRING),
+    ("restaurante_url", _DICT_STRING),
+    ("crawl_date", pa.string()),
+    ("zone", pa.string()),
+])
+
+# One row per scraped restaurant: the JSON-LD fields the cleaning step needs
+# besides the menu items.
+MENU_SCHEMA = pa.schema([
+    ("store_name", pa.string()),
+    ("restaurante_url", pa.string()),
+    ("latitude", pa.float64()),
+    ("longitude", pa.float64()),
+    ("street_address", pa.string()),
+    ("locality", pa.string()),
+    ("region", pa.string()),
+    ("crawl_date", pa.string()),
+    ("zone", pa.string()),
+])
+
+RESTAURANT_EXPORT_SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("name", pa.string()),
+    ("service", _DICT_STRING),
+    ("latitude", pa.float64()),
+    ("longitude", pa.float64()),
+    ("address", pa.string()),
+    ("zone", _DICT_STRING),
+    ("service_link", pa.string()),
+    ("image", _DICT_STRING),
+    ("created_at", _DICT_STRING),
+])
+
+FOOD_ITEM_EXPORT_SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("restaurant", _DICT_STRING),
+    ("food", pa.string()),
+    ("price", pa.string()),
+    ("service", _DICT_STRING),
+    ("image", _DICT_STRING),
+    ("service_link", _DICT_STRING),
+    ("restaurant_id", pa.int64()),
+    ("category", _DICT_STRING),
+    ("description", pa.string()),
+    ("created_at", _DICT_STRING),
+])
+
+DEFAULT_FLUSH_ROWS = 50_000
+DEFAULT_FLUSH_SECONDS = 60.0
+DEFAULT_ROW_GROUP_ROWS = 64 * 1024
+
+
+def _fsync_path(path: Union[str, Path]) -> None:
+    fd = os.open(str(path), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class ParquetSink:
+    """
+    Buffered writer for a partitioned Parquet dataset under `root`. Rows are
+    dicts; partition values missing from a row fall back to today's date and
+    UNKNOWN_ZONE.
+
+    Every sync (a `SinkGroup` checkpoint) has to leave complete files behind,
+    so a long run writes many small files per partition; `close` rewrites them
+    as one file with DEFAULT_ROW_GROUP_ROWS row groups. The swap is journaled
+    (`_compaction-<pid>-<id>.json` under `root`, which dataset readers skip)
+    and finished by the next sink opened on `root` if the process dies midway,
+    so rows are never lost or left in the dataset twice.
+    """
+
+    def __init__(
+        self,
+        root: Union[str, Path],
+        schema: pa.Schema,
+        *,
+        partition_cols: Sequence[str] = PARTITION_COLUMNS,
+        flush_rows: int = DEFAULT_FLUSH_ROWS,
+        flush_seconds: float = DEFAULT_FLUSH_SECONDS,
+        compression: str = "zstd",
+        compact_on_close: bool = True,
+    ):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.schema = schema
+        self.partition_cols = list(partition_cols)
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.compression = compression
+        self.compact_on_close = compact_on_close
+        self._buffer: List[Dict[str, Any]] = []
+        self._oldest: Optional[float] = None
+        self._unsynced: List[str] = []
+        self._written: Dict[str, List[str]] = {}
+        self._closed = False
+        self.rows_written = 0
+        self.recover()
+
+    def write(self, rows: Sequence[Dict[str, Any]]) -> None:
+        if not rows:
+            return
+        today = time.strftime("%Y-%m-%d")
+        for row in rows:
+            # Copy: the caller's dicts are often written to other sinks too.
+            row = dict(row)
+            row.setdefault("crawl_date", today)
+            if not row.get("zone"):
+                row["zone"] = UNKNOWN_ZONE
+            self._buffer.append(row)
+        self.rows_written += len(rows)
+        if self._oldest is None:
+            self._oldest = time.monotonic()
+        if len(self._buffer) >= self.flush_rows or time.monotonic() - self._oldest >= self.flush_seconds:
+            self.flush()
+
+    def _visit(self, path: str) -> None:
+        self._unsynced.append(path)
+        self._written.setdefault(os.path.dirname(path), []).append(path)
+
+    def flush(self) -> None:
+        """Write the buffered rows as new files, one per partition."""
+        if not self._buffer:
+            return
+        table = pa.Table.from_pylist(self._buffer, schema=self.schema)
+        pq.write_to_dataset(
+            table,
+            root_path=str(self.root),
+            partition_cols=self.partition_cols,
+            basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+            compression=self.compression,
+            use_dictionary=True,
+            file_visitor=lambda written: self._visit(written.path),
+        )
+        self._buffer = []
+        self._oldest = None
+
+    def sync(self) -> None:
+        """Flush and fsync the files (and their directories) written since the last sync."""
+        self.flush()
+        directories = set()
+        for path in self._unsynced:
+            _fsync_path(path)
+            directories.add(os.path.dirname(path))
+        for directory in directories:
+            _fsync_path(directory)
+        self._unsynced = []
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self.sync()
+        self._closed = True
+        if self.compact_on_close:
+            for paths in self._written.values():
+                if len(paths) > 1:
+                    self._compact(paths)
+        self._written = {}
+
+    def _compact(self, paths: List[str]) -> None:
+        """Replace the files of one partition written by this sink with a single file."""
+        directory = os.path.dirname(paths[0])
+        name = f"part-{uuid.uuid4().hex}-c.parquet"
+        target = os.path.join(directory, name)
+        # Hidden and without the .parquet suffix until it is complete.
+        staging = os.path.join(directory, f".{name}.tmp")
+        table = pa.concat_tables([pq.ParquetFile(path, memory_map=True).read() for path in paths])
+        with pq.ParquetWriter(staging, table.schema, compression=self.compression, use_dictionary=True) as writer:
+            writer.write_table(table, row_group_size=DEFAULT_ROW_GROUP_ROWS)
+        _fsync_path(staging)
+
+        journal = self.root / f"_compaction-{os.getpid()}-{uuid.uuid4().hex}.json"
+        with open(journal, "w", encoding="utf-8") as handle:
+            json.dump({"staging": staging, "target": target, "sources": paths}, handle)
+            handle.flush()
+            os.fsync(handle.fileno())
+        _fsync_path(self.root)
+
+        os.replace(staging, target)
+        _fsync_path(directory)
+        self._finish_compaction(journal, target, paths)
+
+    @staticmethod
+    def _finish_compaction(journal: Path, target: str, sources: Sequence[str]) -> None:
+        for path in sources:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        _fsync_path(os.path.dirname(target))
+        os.remove(journal)
+
+    def recover(self) -> int:
+        """
+        Finish or roll back compactions interrupted by a crash (skipping those
+        of processes still running). Returns how many journals were handled.
+        """
+        handled = 0
+        for journal in sorted(self.root.glob("_compaction-*.json")):
+            pid = journal.name.split("-")[1]
+            if pid.isdigit() and int(pid) != os.getpid() and _process_alive(int(pid)):
+                continue
+            try:
+                entry = json.loads(journal.read_text(encoding="utf-8"))
+            except ValueError:
+                # Torn journal: written before the swap, so the sources are intact.
+                journal.unlink()
+                handled += 1
+                continue
+            if os.path.exists(entry["target"]):
+                self._finish_compaction(journal, entry["target"], entry["sources"])
+            else:
+                if os.path.exists(entry["staging"]):
+                    os.remove(entry["staging"])
+                journal.unlink()
+            handled += 1
+        return handled
+
+
+class ParquetTableWriter:
+    """Streams rows into a single Parquet file, one row group per `row_group_rows`."""
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        schema: pa.Schema,
+        *,
+        row_group_rows: int = DEFAULT_ROW_GROUP_ROWS,
+        compression: str = "zstd",
+    ):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.schema = schema
+        self.row_group_rows = row_group_rows
+        self._writer = pq.ParquetWriter(str(self.path), schema, compression=compression, use_dictionary=True)
+        self._buffer: List[Dict[str, Any]] = []
+
+    def write(self, row: Dict[str, Any]) -> None:
+        self._buffer.append(row)
+        if len(self._buffer) >= self.row_group_rows:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self._buffer:
+            self._writer.write_table(pa.Table.from_pylist(self._buffer, schema=self.schema))
+            self._buffer = []
+
+    def close(self) -> None:
+        self._flush()
+        self._writer.close()
+
+    def __enter__(self) -> "ParquetTableWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def _export_value(value: Any, kind: pa.DataType) -> Any:
+    """A CSV cell as upload_supabase would send it: stripped, empty as None, typed."""
+    if value is None or (isinstance(value, float) and value != value):
+        return None
+    text = str(value).strip()
+    if not text:
+        return None
+    if pa.types.is_integer(kind):
+        return int(float(text)) if "." in text else int(text)
+    if pa.types.is_floating(kind):
+        return float(text)
+    return text
+
+
+def write_export(frame: Any, path: Union[str, Path], schema: pa.Schema, *, compression: str = "zstd") -> int:
+    """
+    Write a final export table (a pandas DataFrame, e.g. the notebook's after
+    the emoji and price steps) as a Parquet file, replacing `path` atomically.
+    Columns missing from the frame are written as nulls. Returns the row count.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    arrays = []
+    for field in schema:
+        values = frame[field.name].tolist() if field.name in frame.columns else [None] * len(frame)
+        arrays.append(pa.array([_export_value(value, field.type) for value in values], type=field.type))
+    table = pa.Table.from_arrays(arrays, schema=schema)
+    staging = path.with_name(f".{path.name}.tmp")
+    pq.write_table(table, str(staging), compression=compression, use_dictionary=True,
+                   row_group_size=DEFAULT_ROW_GROUP_ROWS)
+    os.replace(staging, path)
+    return table.num_rows
+
+
+def read_table(
+    path: Union[str, Path],
+    *,
+    columns: Optional[Sequence[str]] = None,
+    filters: Optional[List[Tuple[str, str, Any]]] = None,
+) -> pa.Table:
+    """Memory-mapped read of a Parquet file or hive-partitioned dataset, projected to `columns`."""
+    return pq.read_table(
+        str(path),
+        columns=list(columns) if columns is not None else None,
+        filters=filters,
+        memory_map=True,
+    )
+
+
+def parquet_columns(path: Union[str, Path]) -> List[str]:
+    """Column names of a Parquet file, from its footer only."""
+    return pq.read_schema(str(path), memory_map=True).names
+
+
+def iter_row_batches(
+    path: Union[str, Path],
+    *,
+    columns: Optional[Sequence[str]] = None,
+    batch_size: int = DEFAULT_ROW_GROUP_ROWS,
+) -> Iterator[List[Dict[str, Any]]]:
+    """Stream a single Parquet file as lists of row dicts, decoding only `columns`."""
+    parquet_file = pq.ParquetFile(str(path), memory_map=True)
+    if columns is not None:
+        available = set(parquet_file.schema_arrow.names)
+        columns = [column for column in columns if column in available]
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+        # Column-wise conversion: RecordBatch.to_pylist() looks dictionary
+        # values up one row at a time and is slower than parsing the CSV.
+        values = [
+            column.dictionary_decode() if pa.types.is_dictionary(column.type) else column
+            for column in batch.columns
+        ]
+        names = batch.schema.names
+        yield [dict(zip(names, row)) for row in zip(*(column.to_pylist() for column in values))]
+
+
+def partitions(root: Union[str, Path]) -> List[Tuple[Dict[str, str], Path]]:
+    """(partition values, directory) for every leaf partition under `root`, sorted."""
+    root = Path(root)
+    leaves = []
+    for directory, _subdirs, files in os.walk(root):
+        if not any(name.endswith(".parquet") for name in files):
+            continue
+        relative = Path(directory).relative_to(root)
+        values = {
+            key: unquote(value)
+            for key, value in (part.split("=", 1) for part in relative.parts if "=" in part)
+        }
+        leaves.append((values, Path(directory)))
+    leaves.sort(key=lambda leaf: str(leaf[1]))
+    return leaves
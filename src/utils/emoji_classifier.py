@@ -0,0 +1,278 @@
+"""
+Emoji tagging for the food_items and restaurants exports.
+
+A menu category gets the emoji of its first word that is a known keyword
+(or a keyword plus a plural "s"), after accent folding, so "Pizzas
+Clásicas" -> 🍕. Categories without a keyword get DEFAULT_EMOJI. Each
+restaurant takes the most common emoji of its items, and items left on the
+default inherit their restaurant's emoji.
+
+The keywords are compiled once into an Aho-Corasick automaton that scans
+the folded text in a single pass, classifications are memoized per
+category string, and the pandas helpers classify each distinct category
+once and compute the per-restaurant mode with a group count instead of a
+Python callback per group.
+
+    from utils.emoji_classifier import apply_emoji_images
+    restaurants_df, food_items_df = apply_emoji_images(restaurants_df, food_items_df)
+"""
+import unicodedata
+from collections import deque
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+DEFAULT_EMOJI = "🍽️"
+DEFAULT_CACHE_SIZE = 65_536
+
+KEYWORD_TO_EMOJI = {
+    "pizza": "🍕",
+    "pasta": "🍝",
+    "lasana": "🍝",
+    "noodle": "🍜",
+    "ramen": "🍜",
+    "sopa": "🍲",
+    "soup": "🍲",
+    "arroz": "🍚",
+    "rice": "🍚",
+    "curry": "🍛",
+    "sandwich": "🥪",
+    "panini": "🥪",
+    "wrap": "🌯",
+    "taco": "🌮",
+    "tacos": "🌮",
+    "burrito": "🌯",
+    "empanada": "🥟",
+    "queso": "🧀",
+    "bife": "🥩",
+    "steak": "🥩",
+    "carne": "🥩",
+    "beef": "🥩",
+    "churrasco": "🥩",
+    "burger": "🍔",
+    "hamburguesa": "🍔",
+    "pollo": "🍗",
+    "chicken": "🍗",
+    "cerdo": "🥓",
+    "res": "🥩",
+    "pescado": "🐟",
+    "marisco": "🦞",
+    "camaron": "🦐",
+    "salmon": "🐟",
+    "ensalada": "🥗",
+    "salad": "🥗",
+    "vegano": "🥬",
+    "vegetariano": "🥦",
+    "veggie": "🥦",
+    "sushi": "🍣",
+    "roll": "🍣",
+    "gohan": "🍱",
+    "combo": "🍱",
+    "postre": "🍰",
+    "dessert": "🍰",
+    "torta": "🍰",
+    "cake": "🍰",
+    "kuchen": "🥧",
+    "pie": "🥧",
+    "galleta": "🍪",
+    "cookie": "🍪",
+    "brownie": "🍫",
+    "helado": "🍨",
+    "ice": "🍨",
+    "bebida": "🥤",
+    "bebestible": "🥤",
+    "drink": "🥤",
+    "jugo": "🧃",
+    "juice": "🧃",
+    "coffee": "☕",
+    "cafe": "☕",
+    "te": "🍵",
+    "desayuno": "🍳",
+    "breakfast": "🍳",
+    "snack": "🍿",
+    "kids": "🧒",
+    "nino": "🧒",
+    "dulce": "🍬",
+    "bakery": "🥐",
+}
+
+
+def fold_text(text: str) -> str:
+    """Lowercase `text` and strip its accents (NFKD minus combining marks): "Niño" -> "nino"."""
+    normalized = unicodedata.normalize("NFKD", text)
+    return "".join(ch for ch in normalized if not unicodedata.combining(ch)).lower()
+
+
+def _is_word_char(ch: str) -> bool:
+    # Same characters as the [\w']+ tokens the notebook split categories into.
+    return ch.isalnum() or ch == "_" or ch == "'"
+
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton over a fixed set of keywords."""
+
+    def __init__(self, keywords: Iterable[str]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[Tuple[str, ...]] = [()]
+        for keyword in keywords:
+            if keyword:
+                self._add(keyword)
+        self._link()
+
+    def _add(self, keyword: str) -> None:
+        state = 0
+        for ch in keyword:
+            following = self._goto[state].get(ch)
+            if following is None:
+                following = len(self._goto)
+                self._goto[state][ch] = following
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(())
+            state = following
+        self._output[state] += (keyword,)
+
+    def _link(self) -> None:
+        # Breadth-first, so each state's failure target is final before its children need it.
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, following in self._goto[state].items():
+                queue.append(following)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(ch, 0)
+                self._fail[following] = target if target != following else 0
+                self._output[following] += self._output[self._fail[following]]
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int, str]]:
+        """Yield (start, end, keyword) for every occurrence in `text`, ordered by end."""
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for index, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for keyword in output[state]:
+                yield index + 1 - len(keyword), index + 1, keyword
+
+
+class EmojiClassifier:
+    """Maps category strings to emojis; `classify` is memoized (LRU) per instance."""
+
+    def __init__(
+        self,
+        keyword_to_emoji: Mapping[str, str] = KEYWORD_TO_EMOJI,
+        *,
+        default: str = DEFAULT_EMOJI,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+    ):
+        self.default = default
+        self._emoji = {fold_text(keyword): emoji for keyword, emoji in keyword_to_emoji.items()}
+        self._automaton = KeywordAutomaton(self._emoji)
+        self.classify = lru_cache(maxsize=cache_size)(self._classify)
+
+    def _classify(self, text: str) -> str:
+        """
+        Emoji of the earliest word that is a keyword, or a keyword plus "s"
+        (an exact match wins within the same word); the default otherwise.
+        """
+        if not text:
+            return self.default
+        folded = fold_text(text)
+        size = len(folded)
+        best: Optional[Tuple[int, int]] = None
+        emoji = self.default
+        for start, end, keyword in self._automaton.iter_matches(folded):
+            if start > 0 and _is_word_char(folded[start - 1]):
+                continue
+            if end == size or not _is_word_char(folded[end]):
+                rank = 0
+            elif folded[end] == "s" and (end + 1 == size or not _is_word_char(folded[end + 1])):
+                rank = 1
+            else:
+                continue
+            if best is None or (start, rank) < best:
+                best = (start, rank)
+                emoji = self._emoji[keyword]
+        return emoji
+
+    def cache_info(self):
+        return self.classify.cache_info()
+
+
+_default_classifier: Optional[EmojiClassifier] = None
+
+
+def default_classifier() -> EmojiClassifier:
+    global _default_classifier
+    if _default_classifier is None:
+        _default_classifier = EmojiClassifier()
+    return _default_classifier
+
+
+def classify(text: str) -> str:
+    return default_classifier().classify(text)
+
+
+def tag_series(categories, classifier: Optional[EmojiClassifier] = None):
+    """Emoji for each value of a pandas Series of categories (each distinct value classified once)."""
+    import numpy as np
+    import pandas as pd
+
+    classifier = classifier or default_classifier()
+    codes, uniques = pd.factorize(categories)
+    # Missing values get code -1, which picks the trailing default.
+    emojis = np.array([classifier.classify(str(value)) for value in uniques] + [classifier.default], dtype=object)
+    return pd.Series(emojis[codes], index=categories.index, name=categories.name)
+
+
+def mode_by_group(keys, values):
+    """
+    Most common value per key, as a Series indexed by key. Ties go to the
+    smallest value, like `Series.mode().iat[0]` in a groupby callback.
+    Works on integer codes: one sort of (key, value) pairs, no per-group calls.
+    """
+    import numpy as np
+    import pandas as pd
+
+    key_codes, key_uniques = pd.factorize(keys)
+    # Sorted uniques, so the smallest code is the smallest value.
+    value_codes, value_uniques = pd.factorize(values, sort=True)
+    width = max(len(value_uniques), 1)
+    present = (key_codes >= 0) & (value_codes >= 0)
+    pairs, counts = np.unique(key_codes[present].astype(np.int64) * width + value_codes[present], return_counts=True)
+    pair_keys, pair_values = np.divmod(pairs, width)
+    # Per key: highest count first, then smallest value; keep the first row of each key.
+    order = np.lexsort((pair_values, -counts, pair_keys))
+    sorted_keys = pair_keys[order]
+    first = order[np.r_[True, sorted_keys[1:] != sorted_keys[:-1]]] if len(order) else order
+    return pd.Series(
+        np.asarray(value_uniques, dtype=object)[pair_values[first]],
+        index=pd.Index(np.asarray(key_uniques, dtype=object)[pair_keys[first]], name=keys.name),
+        name=values.name,
+    )
+
+
+def apply_emoji_images(restaurants_df, food_items_df, classifier: Optional[EmojiClassifier] = None):
+    """
+    Fill the `image` column of both exports: items from their category,
+    restaurants from their items' most common emoji, and items left on the
+    default from their restaurant. Returns new (restaurants_df, food_items_df).
+    """
+    classifier = classifier or default_classifier()
+    default = classifier.default
+    food_items_df = food_items_df.copy()
+    restaurants_df = restaurants_df.copy()
+
+    food_items_df["image"] = tag_series(food_items_df["category"], classifier)
+    restaurant_emoji = mode_by_group(food_items_df["restaurant_id"], food_items_df["image"])
+    restaurants_df["image"] = restaurants_df["id"].map(restaurant_emoji).fillna(default)
+
+    default_mask = food_items_df["image"] == default
+    if default_mask.any():
+        restaurant_image = restaurants_df.drop_duplicates("id", keep="last").set_index("id")["image"]
+        fallback = food_items_df.loc[default_mask, "restaurant_id"].map(restaurant_image)
+        food_items_df.loc[default_mask, "image"] = fallback.fillna(default)
+    return restaurants_df, food_items_df
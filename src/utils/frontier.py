@@ -0,0 +1,259 @@
+"""
+SQLite-backed crawl frontier shared by the scrapers.
+
+Every unit of work (a zone for the listing scraper, a restaurant URL for the
+menu scraper) is a row keyed by `(kind, key)` with its status, attempt count,
+last fetch time and the earliest time it may be fetched again. The database
+runs in WAL mode and every state change is its own transaction, so a crash
+mid-run loses at most the item that was in flight.
+"""
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+STATUS_PENDING = "pending"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+STATUS_DEAD = "dead"
+
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_RETRY_DELAY = 600.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS frontier (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    successes INTEGER NOT NULL DEFAULT 0,
+    last_fetch REAL,
+    next_eligible REAL NOT NULL DEFAULT 0,
+    last_error TEXT,
+    etag TEXT,
+    last_modified TEXT,
+    content_hash TEXT,
+    PRIMARY KEY (kind, key)
+);
+CREATE INDEX IF NOT EXISTS frontier_eligible
+    ON frontier (kind, status, next_eligible);
+"""
+
+# Columns added after the first release, with their types, for in-place upgrades.
+_ADDED_COLUMNS = {
+    "etag": "TEXT",
+    "last_modified": "TEXT",
+    "content_hash": "TEXT",
+}
+
+
+class Frontier:
+    """Transactional per-item crawl state stored in a single SQLite file."""
+
+    def __init__(
+        self,
+        db_path: Union[str, Path],
+        *,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        retry_delay: float = DEFAULT_RETRY_DELAY,
+    ):
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._upgrade_schema()
+
+    def _upgrade_schema(self) -> None:
+        existing = {row[1] for row in self._conn.execute("PRAGMA table_info(frontier)")}
+        for column, column_type in _ADDED_COLUMNS.items():
+            if column not in existing:
+                self._conn.execute(f"ALTER TABLE frontier ADD COLUMN {column} {column_type}")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self) -> "Frontier":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _execute(self, query: str, params: Tuple = ()) -> None:
+        with self._lock:
+            self._conn.execute(query, params)
+
+    def _fetchall(self, query: str, params: Tuple = ()) -> List[Tuple]:
+        with self._lock:
+            return self._conn.execute(query, params).fetchall()
+
+    def is_empty(self, kind: str) -> bool:
+        return not self._fetchall("SELECT 1 FROM frontier WHERE kind = ? LIMIT 1", (kind,))
+
+    def add_many(self, kind: str, keys: Iterable[str]) -> int:
+        """Insert new pending keys, leaving existing rows untouched. Returns the number added."""
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO frontier (kind, key) VALUES (?, ?)",
+                    ((kind, key) for key in keys),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return self._conn.total_changes - before
+
+    def seed(
+        self,
+        kind: str,
+        key: str,
+        *,
+        successes: int = 0,
+        last_fetch: Optional[float] = None,
+    ) -> None:
+        """Insert a key with prior history (used when migrating older state files)."""
+        status = STATUS_DONE if successes else STATUS_PENDING
+        self._execute(
+            """
+            INSERT OR IGNORE INTO frontier (kind, key, status, successes, last_fetch)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            (kind, key, status, successes, last_fetch),
+        )
+
+    def eligible(self, kind: str, *, limit: Optional[int] = None, now: Optional[float] = None) -> List[str]:
+        """Keys that are pending, or failed and past their retry time."""
+        now = time.time() if now is None else now
+        query = """
+            SELECT key FROM frontier
+            WHERE kind = ? AND status IN (?, ?) AND next_eligible <= ?
+            ORDER BY next_eligible, attempts
+        """
+        params: Tuple = (kind, STATUS_PENDING, STATUS_FAILED, now)
+        if limit is not None:
+            query += " LIMIT ?"
+            params += (limit,)
+        return [row[0] for row in self._fetchall(query, params)]
+
+    def refreshable(self, kind: str, older_than: float, *, now: Optional[float] = None) -> List[str]:
+        """Eligible keys plus done keys whose last fetch is older than `older_than` seconds."""
+        now = time.time() if now is None else now
+        rows = self._fetchall(
+            """
+            SELECT key FROM frontier
+            WHERE kind = ? AND (
+                (status IN (?, ?) AND next_eligible <= ?)
+                OR (status = ? AND COALESCE(last_fetch, 0) <= ?)
+            )
+            """,
+            (kind, STATUS_PENDING, STATUS_FAILED, now, STATUS_DONE, now - older_than),
+        )
+        return [row[0] for row in rows]
+
+    def validators(self, kind: str, key: str) -> Dict[str, Optional[str]]:
+        """Stored ETag, Last-Modified and content hash for a key (None when unknown)."""
+        rows = self._fetchall(
+            "SELECT etag, last_modified, content_hash FROM frontier WHERE kind = ? AND key = ?",
+            (kind, key),
+        )
+        etag, last_modified, content_hash = rows[0] if rows else (None, None, None)
+        return {"etag": etag, "last_modified": last_modified, "content_hash": content_hash}
+
+    def last_fetch(self, kind: str, key: str) -> Optional[float]:
+        rows = self._fetchall("SELECT last_fetch FROM frontier WHERE kind = ? AND key = ?", (kind, key))
+        return rows[0][0] if rows else None
+
+    def status(self, kind: str, key: str) -> Optional[str]:
+        rows = self._fetchall("SELECT status FROM frontier WHERE kind = ? AND key = ?", (kind, key))
+        return rows[0][0] if rows else None
+
+    def by_priority(self, kind: str) -> List[Tuple[str, int, Optional[float]]]:
+        """All keys of `kind` ordered by fewest successes, then oldest fetch."""
+        rows = self._fetchall(
+            """
+            SELECT key, successes, last_fetch FROM frontier
+            WHERE kind = ?
+            ORDER BY successes, COALESCE(last_fetch, 0)
+            """,
+            (kind,),
+        )
+        return [(row[0], row[1], row[2]) for row in rows]
+
+    def mark_done(
+        self,
+        kind: str,
+        key: str,
+        *,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+        content_hash: Optional[str] = None,
+    ) -> None:
+        """Record a successful fetch. Validators left as None keep their stored value."""
+        now = time.time()
+        self._execute(
+            """
+            INSERT INTO frontier (kind, key, status, successes, last_fetch, etag, last_modified, content_hash)
+            VALUES (?, ?, ?, 1, ?, ?, ?, ?)
+            ON CONFLICT (kind, key) DO UPDATE SET
+                status = excluded.status,
+                successes = frontier.successes + 1,
+                attempts = 0,
+                last_fetch = excluded.last_fetch,
+                last_error = NULL,
+                etag = COALESCE(excluded.etag, frontier.etag),
+                last_modified = COALESCE(excluded.last_modified, frontier.last_modified),
+                content_hash = COALESCE(excluded.content_hash, frontier.content_hash)
+            """,
+            (kind, key, STATUS_DONE, now, etag, last_modified, content_hash),
+        )
+
+    def mark_failed(self, kind: str, key: str, error: str, *, retry_in: Optional[float] = None) -> None:
+        """
+        Record a failed attempt. The key becomes eligible again after an
+        exponential back-off, or is parked as dead after `max_attempts`.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT attempts FROM frontier WHERE kind = ? AND key = ?", (kind, key)
+            ).fetchone()
+            attempts = (row[0] if row else 0) + 1
+            status = STATUS_DEAD if attempts >= self.max_attempts else STATUS_FAILED
+            delay = self.retry_delay * (2 ** (attempts - 1)) if retry_in is None else retry_in
+            self._conn.execute(
+                """
+                INSERT INTO frontier (kind, key, status, attempts, last_fetch, next_eligible, last_error)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (kind, key) DO UPDATE SET
+                    status = excluded.status,
+                    attempts = excluded.attempts,
+                    last_fetch = excluded.last_fetch,
+                    next_eligible = excluded.next_eligible,
+                    last_error = excluded.last_error
+                """,
+                (kind, key, status, attempts, now, now + delay, error),
+            )
+
+    def defer(self, kind: str, key: str, seconds: float, reason: str = "") -> None:
+        """Push a key back without counting an attempt (e.g. the server blocked us)."""
+        self._execute(
+            """
+            UPDATE frontier SET next_eligible = ?, last_error = ?
+            WHERE kind = ? AND key = ?
+            """,
+            (time.time() + seconds, reason or None, kind, key),
+        )
+
+    def counts(self, kind: str) -> Dict[str, int]:
+        rows = self._fetchall(
+            "SELECT status, COUNT(*) FROM frontier WHERE kind = ? GROUP BY status", (kind,)
+        )
+        return {status: count for status, count in rows}
@@ -1,7 +1,170 @@
 """
 Utility functions for geographic operations.
+
+`calculate_distance` is a NumPy haversine that broadcasts over arrays of
+points. `SpatialIndex` buckets points into a regular latitude/longitude grid
+(cells sorted by id, one contiguous slice per cell) so radius and k-nearest
+queries only compute distances for the points in the cells around the query.
 """
+import csv
+import math
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180.0
+DEFAULT_CELL_KM = 1.0
+
+ArrayLike = Union[float, Sequence[float], np.ndarray]
+
+
+def calculate_distance(lat1: ArrayLike, lon1: ArrayLike, lat2: ArrayLike, lon2: ArrayLike) -> Union[float, np.ndarray]:
+    """
+    Great-circle distance in kilometres between two geographic coordinates.
+
+    Arguments broadcast like NumPy arrays, so one point can be compared against
+    an array of points (or two arrays element-wise). Scalars in, float out.
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(value, dtype=np.float64)) for value in (lat1, lon1, lat2, lon2))
+    half_dlat = (lat2 - lat1) * 0.5
+    half_dlon = (lon2 - lon1) * 0.5
+    a = np.sin(half_dlat) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(half_dlon) ** 2
+    distance = 2.0 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+    return float(distance) if distance.ndim == 0 else distance
+
+
+class SpatialIndex:
+    """
+    Grid bucket index over latitude/longitude points.
+
+    Cells are roughly `cell_km` wide at the mean latitude of the data. Points
+    with missing coordinates are skipped; query results are positions in the
+    arrays given to the constructor, nearest first.
+    """
+
+    def __init__(
+        self,
+        latitudes: ArrayLike,
+        longitudes: ArrayLike,
+        *,
+        cell_km: float = DEFAULT_CELL_KM,
+        ids: Optional[Sequence] = None,
+        names: Optional[Sequence[str]] = None,
+    ):
+        if cell_km <= 0:
+            raise ValueError("cell_km must be positive")
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+        if latitudes.shape != longitudes.shape or latitudes.ndim != 1:
+            raise ValueError("latitudes and longitudes must be 1-D arrays of the same length")
+
+        self.ids = np.asarray(ids) if ids is not None else None
+        self.names = list(names) if names is not None else None
+
+        valid = np.flatnonzero(np.isfinite(latitudes) & np.isfinite(longitudes))
+        lat = latitudes[valid]
+        lon = longitudes[valid]
+        mean_lat = float(lat.mean()) if len(lat) else 0.0
+        self.cell_lat = cell_km / KM_PER_DEGREE
+        self.cell_lon = cell_km / (KM_PER_DEGREE * max(math.cos(math.radians(mean_lat)), 1e-6))
+        self.lat0 = float(lat.min()) if len(lat) else 0.0
+        self.lon0 = float(lon.min()) if len(lon) else 0.0
+
+        rows = np.floor((lat - self.lat0) / self.cell_lat).astype(np.int64)
+        cols = np.floor((lon - self.lon0) / self.cell_lon).astype(np.int64)
+        self.n_rows = int(rows.max()) + 1 if len(rows) else 0
+        self.n_cols = int(cols.max()) + 1 if len(cols) else 0
+
+        cell_ids = cols * self.n_rows + rows
+        order = np.argsort(cell_ids, kind="stable")
+        self._cell_ids = cell_ids[order]
+        self._positions = valid[order]
+        self._lat = lat[order]
+        self._lon = lon[order]
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    @classmethod
+    def from_csv(
+        cls,
+        csv_path: Union[str, Path],
+        *,
+        cell_km: float = DEFAULT_CELL_KM,
+        service: Optional[str] = None,
+    ) -> "SpatialIndex":
+        """Build an index from restaurants.csv, optionally for a single service."""
+        ids: List[str] = []
+        names: List[str] = []
+        latitudes: List[float] = []
+        longitudes: List[float] = []
+        with Path(csv_path).open(newline="", encoding="utf-8") as handle:
+            for row in csv.DictReader(handle):
+                if service is not None and row.get("service") != service:
+                    continue
+                ids.append(row.get("id", ""))
+                names.append(row.get("name", ""))
+                latitudes.append(_to_float(row.get("latitude")))
+                longitudes.append(_to_float(row.get("longitude")))
+        return cls(latitudes, longitudes, cell_km=cell_km, ids=ids, names=names)
+
+    def _candidates(self, lat: float, lon: float, radius_km: float) -> np.ndarray:
+        """Sorted-array slots of every point in the cells covering the radius' bounding box."""
+        if not len(self._positions):
+            return np.empty(0, dtype=np.int64)
+        dlat = radius_km / KM_PER_DEGREE
+        widest_lat = min(abs(lat) + dlat, 89.9)
+        dlon = radius_km / (KM_PER_DEGREE * math.cos(math.radians(widest_lat)))
+
+        row_lo = max(int(math.floor((lat - dlat - self.lat0) / self.cell_lat)), 0)
+        row_hi = min(int(math.floor((lat + dlat - self.lat0) / self.cell_lat)), self.n_rows - 1)
+        col_lo = max(int(math.floor((lon - dlon - self.lon0) / self.cell_lon)), 0)
+        col_hi = min(int(math.floor((lon + dlon - self.lon0) / self.cell_lon)), self.n_cols - 1)
+        if row_lo > row_hi or col_lo > col_hi:
+            return np.empty(0, dtype=np.int64)
+
+        # Within one grid column, the cells row_lo..row_hi are one contiguous id range.
+        columns = np.arange(col_lo, col_hi + 1, dtype=np.int64) * self.n_rows
+        starts = np.searchsorted(self._cell_ids, columns + row_lo, side="left")
+        ends = np.searchsorted(self._cell_ids, columns + row_hi, side="right")
+        lengths = ends - starts
+        total = int(lengths.sum())
+        if not total:
+            return np.empty(0, dtype=np.int64)
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        return offsets + np.arange(total, dtype=np.int64)
+
+    def within_radius(self, lat: float, lon: float, radius_km: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Positions and distances (km) of every point within `radius_km`, nearest first."""
+        slots = self._candidates(lat, lon, radius_km)
+        distances = calculate_distance(lat, lon, self._lat[slots], self._lon[slots])
+        keep = distances <= radius_km
+        slots, distances = slots[keep], distances[keep]
+        order = np.argsort(distances, kind="stable")
+        return self._positions[slots[order]], distances[order]
+
+    def nearest(self, lat: float, lon: float, k: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Positions and distances (km) of the `k` nearest points. The search
+        radius doubles until it holds `k` points, which makes the result exact.
+        """
+        if k <= 0:
+            raise ValueError("k must be positive")
+        k = min(k, len(self))
+        if not k:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        radius = self.cell_lat * KM_PER_DEGREE
+        while True:
+            positions, distances = self.within_radius(lat, lon, radius)
+            if len(positions) >= k:
+                return positions[:k], distances[:k]
+            radius *= 2.0
+
 
-def calculate_distance(lat1, lon1, lat2, lon2):
-    """Calculate distance between two geographic coordinates."""
-    pass
+def _to_float(value: Optional[str]) -> float:
+    try:
+        return float(value) if value not in (None, "") else math.nan
+    except ValueError:
+        return math.nan
@@ -1,7 +1,54 @@
 """
 Utility functions for HTML parsing and manipulation.
 """
+import re
+from typing import Optional
 
-def parse_html(html_content):
-    """Parse HTML content."""
-    pass
+from bs4 import BeautifulSoup
+
+JSON_LD_TYPE = "application/ld+json"
+
+_SCRIPT_CLOSE = re.compile(r"</script\s*>", re.IGNORECASE)
+
+
+def _script_open_pattern(script_type: str) -> "re.Pattern[str]":
+    return re.compile(
+        r"<script\b[^>]*?\stype\s*=\s*([\"']?)" + re.escape(script_type) + r"\1[^>]*>",
+        re.IGNORECASE,
+    )
+
+
+_JSON_LD_OPEN = _script_open_pattern(JSON_LD_TYPE)
+
+
+def _parse_with_soup(html_content: str, script_type: str) -> Optional[str]:
+    soup = BeautifulSoup(html_content, "html.parser")
+    script_tag = soup.find("script", type=script_type)
+    if script_tag is None or script_tag.string is None:
+        return None
+    return str(script_tag.string)
+
+
+def parse_html(html_content: str, script_type: str = JSON_LD_TYPE) -> Optional[str]:
+    """
+    Return the text of the first <script> block of `script_type` in the page.
+
+    The page is scanned for the opening tag and its closing </script> without
+    building a DOM. Pages where the scan is inconclusive (the type string is
+    present but no well-formed tag matches, or the block is never closed) are
+    handed to BeautifulSoup instead. Returns None when there is no such block.
+    """
+    if not html_content:
+        return None
+
+    opener = _JSON_LD_OPEN if script_type == JSON_LD_TYPE else _script_open_pattern(script_type)
+    match = opener.search(html_content)
+    if match is None:
+        if script_type not in html_content:
+            return None
+        return _parse_with_soup(html_content, script_type)
+
+    closing = _SCRIPT_CLOSE.search(html_content, match.end())
+    if closing is None:
+        return _parse_with_soup(html_content, script_type)
+    return html_content[match.end():closing.start()]
@@ -0,0 +1,551 @@
+"""
+Versioned store of the scraped menus, one snapshot per crawl.
+
+A crawl is stored as its delta against the previous state: the items that
+appeared, the ones whose price or description changed, and the ones that
+disappeared from a restaurant that was crawled again. Everything lives in
+one SQLite file:
+
+    restaurants   one row per restaurant (keyed by its URL), latest name/address
+    items         one row per menu item ever seen, keyed by restaurant and
+                  (category, food, ordinal) — the ordinal tells apart items
+                  listed twice under the same name
+    texts         interned categories and descriptions, keyed by their hash
+    snapshots     one row per recorded crawl, with its delta counts
+    changes       (item, snapshot) -> price, description, removed; the deltas
+    current       the latest live version of every item
+
+Prices are integers (whole pesos, NULL when the menu has none). `changes`
+is clustered by (item, snapshot), so the version of an item at any point
+in time is one index seek (the last change at or before that snapshot) and
+its price history is one range scan; a secondary index on the snapshot
+lists what a crawl changed. A crawl where 1% of prices move costs 1% of a
+full copy, so a year of daily snapshots is a few full copies.
+
+Restaurants missing from a crawl are left as they were, unless the crawl
+is recorded with `full=True` (it covered every restaurant), in which case
+their items are marked removed. Snapshots are recorded in time order.
+
+    with MenuSnapshotStore(path) as store:
+        store.record(iter_restaurants(jsonl_path), taken_at=time.time())
+        store.menu(restaurant_url, at=some_time)
+        store.price_history(restaurant_url, "Pizza Napolitana")
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from itertools import groupby
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+from utils.prices import parse_price
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS restaurants (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,
+    name TEXT,
+    address TEXT,
+    zone TEXT,
+    latitude REAL,
+    longitude REAL,
+    last_snapshot INTEGER
+);
+CREATE TABLE IF NOT EXISTS texts (
+    id INTEGER PRIMARY KEY,
+    text TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY,
+    restaurant_id INTEGER NOT NULL,
+    key INTEGER NOT NULL,
+    category_id INTEGER NOT NULL,
+    food TEXT NOT NULL,
+    ordinal INTEGER NOT NULL,
+    UNIQUE (restaurant_id, key)
+);
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY,
+    taken_at REAL NOT NULL,
+    source TEXT,
+    full INTEGER NOT NULL DEFAULT 0,
+    restaurants INTEGER NOT NULL DEFAULT 0,
+    items INTEGER NOT NULL DEFAULT 0,
+    added INTEGER NOT NULL DEFAULT 0,
+    changed INTEGER NOT NULL DEFAULT 0,
+    removed INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS changes (
+    item_id INTEGER NOT NULL,
+    snapshot_id INTEGER NOT NULL,
+    price INTEGER,
+    description_id INTEGER,
+    removed INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (item_id, snapshot_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS changes_snapshot ON changes (snapshot_id);
+CREATE TABLE IF NOT EXISTS current (
+    item_id INTEGER PRIMARY KEY,
+    price INTEGER,
+    description_id INTEGER NOT NULL
+);
+"""
+
+# The crawl being recorded, before it is compared with `current`.
+_STAGING = """
+CREATE TEMP TABLE staged_restaurants (
+    key TEXT PRIMARY KEY,
+    name TEXT,
+    address TEXT,
+    zone TEXT,
+    latitude REAL,
+    longitude REAL
+);
+CREATE TEMP TABLE staged_items (
+    restaurant_key TEXT NOT NULL,
+    key INTEGER NOT NULL,
+    category_id INTEGER NOT NULL,
+    food TEXT NOT NULL,
+    ordinal INTEGER NOT NULL,
+    price INTEGER,
+    description_id INTEGER NOT NULL
+);
+CREATE TEMP TABLE staged_texts (
+    id INTEGER PRIMARY KEY,
+    text TEXT NOT NULL
+);
+CREATE INDEX temp.staged_items_restaurant ON staged_items (restaurant_key);
+"""
+
+ADDED = "added"
+CHANGED = "changed"
+REMOVED = "removed"
+
+
+@dataclass
+class Snapshot:
+    id: int
+    taken_at: float
+    source: str
+    full: bool
+    restaurants: int
+    items: int
+    added: int
+    changed: int
+    removed: int
+
+
+@dataclass
+class MenuItem:
+    category: str
+    food: str
+    price: Optional[int]
+    description: str
+
+
+@dataclass
+class PricePoint:
+    """An item's price from `taken_at` on; `price` is None when it has none or was removed."""
+
+    taken_at: float
+    category: str
+    food: str
+    price: Optional[int]
+    removed: bool
+
+
+@dataclass
+class ItemChange:
+    restaurant: str
+    category: str
+    food: str
+    kind: str
+    old_price: Optional[int]
+    new_price: Optional[int]
+
+
+def restaurant_key(payload: Dict[str, Any]) -> str:
+    """The restaurant's URL, or its name and address when the menu had none."""
+    return payload.get("service_link") or f"{payload.get('name', '')}|{payload.get('address', '')}"
+
+
+def _hash64(*parts: Any) -> int:
+    """Signed 64-bit hash (what an SQLite INTEGER holds)."""
+    digest = hashlib.blake2b("\x1f".join(str(part) for part in parts).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+def item_key(category: str, food: str, ordinal: int) -> int:
+    """An item's identity within its restaurant."""
+    return _hash64(category, food, ordinal)
+
+
+def text_id(text: str) -> int:
+    return _hash64(text)
+
+
+def _menu_rows(key: str, payload: Dict[str, Any], texts: Dict[str, int]) -> Iterator[Tuple[Any, ...]]:
+    """
+    staged_items rows of one parsed restaurant (clean_data.parse_payload's
+    shape); the categories and descriptions are added to `texts`.
+    """
+    seen: Dict[Tuple[str, str], int] = {}
+    for section in payload.get("sections") or []:
+        category = section.get("category") or ""
+        category_id = texts.setdefault(category, text_id(category))
+        for item in section.get("items") or []:
+            food = item.get("food") or ""
+            description = item.get("description") or ""
+            ordinal = seen.get((category, food), 0)
+            seen[(category, food)] = ordinal + 1
+            yield (
+                key,
+                item_key(category, food, ordinal),
+                category_id,
+                food,
+                ordinal,
+                parse_price(item.get("price") or ""),
+                texts.setdefault(description, text_id(description)),
+            )
+
+
+class MenuSnapshotStore:
+    """Delta-encoded menu snapshots in a single SQLite file. One writer at a time."""
+
+    def __init__(self, db_path: Union[str, Path]):
+        self.path = Path(db_path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self) -> "MenuSnapshotStore":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _fetchall(self, query: str, params: Tuple = ()) -> List[Tuple]:
+        with self._lock:
+            return self._conn.execute(query, params).fetchall()
+
+    # --- Recording -----------------------------------------------------------
+
+    def _stage(self, restaurants: Iterable[Dict[str, Any]]) -> None:
+        """Load a crawl into the temp tables; a restaurant seen twice keeps its last menu."""
+        conn = self._conn
+        # Statement by statement: executescript() would commit the open transaction.
+        for statement in _STAGING.split(";"):
+            if statement.strip():
+                conn.execute(statement)
+        seen: Set[str] = set()
+        for payload in restaurants:
+            key = restaurant_key(payload)
+            if key in seen:
+                conn.execute("DELETE FROM staged_items WHERE restaurant_key = ?", (key,))
+            seen.add(key)
+            conn.execute(
+                "INSERT OR REPLACE INTO staged_restaurants VALUES (?, ?, ?, ?, ?, ?)",
+                (key, payload.get("name"), payload.get("address"), payload.get("zone"),
+                 payload.get("latitude"), payload.get("longitude")),
+            )
+            texts: Dict[str, int] = {}
+            conn.executemany("INSERT INTO staged_items VALUES (?, ?, ?, ?, ?, ?, ?)", _menu_rows(key, payload, texts))
+            conn.executemany(
+                "INSERT OR IGNORE INTO staged_texts VALUES (?, ?)", ((ident, text) for text, ident in texts.items())
+            )
+
+    def record(
+        self,
+        restaurants: Iterable[Dict[str, Any]],
+        *,
+        taken_at: Optional[float] = None,
+        source: str = "",
+        full: bool = False,
+    ) -> Snapshot:
+        """
+        Record one crawl (parsed restaurants, as yielded by
+        clean_data.iter_restaurants) as a new snapshot and return it.
+        Raises ValueError when `taken_at` is older than the latest snapshot.
+        """
+        taken_at = time.time() if taken_at is None else taken_at
+        with self._lock:
+            conn = self._conn
+            latest = conn.execute("SELECT max(taken_at) FROM snapshots").fetchone()[0]
+            if latest is not None and taken_at < latest:
+                raise ValueError(
+                    f"Snapshots must be recorded in time order: {taken_at} is older than the latest ({latest})"
+                )
+            conn.execute("BEGIN")
+            try:
+                self._stage(restaurants)
+                snapshot_id = conn.execute(
+                    "INSERT INTO snapshots (taken_at, source, full) VALUES (?, ?, ?)",
+                    (taken_at, source, int(full)),
+                ).lastrowid
+                counts = self._apply_crawl(snapshot_id, full)
+                conn.execute(
+                    """
+                    UPDATE snapshots SET restaurants = ?, items = ?, added = ?, changed = ?, removed = ?
+                    WHERE id = ?
+                    """,
+                    (*counts, snapshot_id),
+                )
+                conn.execute("DROP TABLE temp.staged_items")
+                conn.execute("DROP TABLE temp.staged_texts")
+                conn.execute("DROP TABLE temp.staged_restaurants")
+                conn.execute("DROP TABLE IF EXISTS temp.crawl")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            # Recording a crawl touches many pages; move them into the database file
+            # rather than leaving a WAL as large as the delta between crawls.
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return self.snapshot(snapshot_id)
+
+    def _apply_crawl(self, snapshot_id: int, full: bool) -> Tuple[int, int, int, int, int]:
+        """Diff the staged crawl against `current`, write the changes and move `current` forward."""
+        conn = self._conn
+        conn.execute(
+            """
+            INSERT INTO restaurants (key, name, address, zone, latitude, longitude, last_snapshot)
+            SELECT key, name, address, zone, latitude, longitude, ? FROM staged_restaurants WHERE true
+            ON CONFLICT (key) DO UPDATE SET
+                name = excluded.name, address = excluded.address, zone = excluded.zone,
+                latitude = excluded.latitude, longitude = excluded.longitude,
+                last_snapshot = excluded.last_snapshot
+            """,
+            (snapshot_id,),
+        )
+        conn.execute(
+            """
+            INSERT OR IGNORE INTO texts (id, text) SELECT id, text FROM staged_texts
+            """
+        )
+        conn.execute(
+            """
+            INSERT OR IGNORE INTO items (restaurant_id, key, category_id, food, ordinal)
+            SELECT r.id, s.key, s.category_id, s.food, s.ordinal
+            FROM staged_items s
+            JOIN restaurants r ON r.key = s.restaurant_key
+            """
+        )
+        conn.execute(
+            """
+            CREATE TEMP TABLE crawl AS
+            SELECT i.id AS item_id, s.price, s.description_id
+            FROM staged_items s
+            JOIN restaurants r ON r.key = s.restaurant_key
+            JOIN items i ON i.restaurant_id = r.id AND i.key = s.key
+            """
+        )
+        conn.execute("CREATE UNIQUE INDEX temp.crawl_item ON crawl (item_id)")
+
+        added = conn.execute(
+            """
+            INSERT INTO changes (item_id, snapshot_id, price, description_id)
+            SELECT c.item_id, ?, c.price, c.description_id
+            FROM crawl c LEFT JOIN current cur ON cur.item_id = c.item_id
+            WHERE cur.item_id IS NULL
+            """,
+            (snapshot_id,),
+        ).rowcount
+        changed = conn.execute(
+            """
+            INSERT INTO changes (item_id, snapshot_id, price, description_id)
+            SELECT c.item_id, ?, c.price, c.description_id
+            FROM crawl c JOIN current cur ON cur.item_id = c.item_id
+            WHERE c.price IS NOT cur.price OR c.description_id != cur.description_id
+            """,
+            (snapshot_id,),
+        ).rowcount
+        in_scope = "" if full else (
+            "AND cur.item_id IN (SELECT i.id FROM staged_restaurants s JOIN restaurants r ON r.key = s.key "
+            "JOIN items i ON i.restaurant_id = r.id)"
+        )
+        removed = conn.execute(
+            f"""
+            INSERT INTO changes (item_id, snapshot_id, removed)
+            SELECT cur.item_id, ?, 1 FROM current cur
+            WHERE NOT EXISTS (SELECT 1 FROM crawl c WHERE c.item_id = cur.item_id) {in_scope}
+            """,
+            (snapshot_id,),
+        ).rowcount
+
+        conn.execute(
+            "DELETE FROM current WHERE item_id IN (SELECT item_id FROM changes WHERE snapshot_id = ? AND removed = 1)",
+            (snapshot_id,),
+        )
+        conn.execute(
+            """
+            INSERT OR REPLACE INTO current (item_id, price, description_id)
+            SELECT c.item_id, c.price, c.description_id
+            FROM changes ch JOIN crawl c ON c.item_id = ch.item_id
+            WHERE ch.snapshot_id = ? AND ch.removed = 0
+            """,
+            (snapshot_id,),
+        )
+        restaurant_count = conn.execute("SELECT count(*) FROM staged_restaurants").fetchone()[0]
+        item_count = conn.execute("SELECT count(*) FROM crawl").fetchone()[0]
+        return restaurant_count, item_count, added, changed, removed
+
+    # --- Snapshots -----------------------------------------------------------
+
+    def snapshots(self) -> List[Snapshot]:
+        return [_snapshot(row) for row in self._fetchall(f"SELECT {_SNAPSHOT_COLUMNS} FROM snapshots ORDER BY id")]
+
+    def snapshot(self, snapshot_id: int) -> Snapshot:
+        rows = self._fetchall(f"SELECT {_SNAPSHOT_COLUMNS} FROM snapshots WHERE id = ?", (snapshot_id,))
+        if not rows:
+            raise KeyError(f"Unknown snapshot {snapshot_id}")
+        return _snapshot(rows[0])
+
+    def snapshot_at(self, when: float) -> Optional[Snapshot]:
+        """The latest snapshot taken at or before `when`, or None."""
+        rows = self._fetchall(
+            f"SELECT {_SNAPSHOT_COLUMNS} FROM snapshots WHERE taken_at <= ? ORDER BY id DESC LIMIT 1", (when,)
+        )
+        return _snapshot(rows[0]) if rows else None
+
+    def _snapshot_id(self, at: Optional[float]) -> Optional[int]:
+        """Snapshot to read for `at` (None: the latest); -1 when `at` is before the first one."""
+        if at is None:
+            return None
+        snapshot = self.snapshot_at(at)
+        return -1 if snapshot is None else snapshot.id
+
+    # --- Reading -------------------------------------------------------------
+
+    def _menu_rows(self, snapshot_id: Optional[int], restaurant: Optional[str]) -> List[Tuple]:
+        where = "WHERE r.key = ?" if restaurant is not None else ""
+        params: Tuple = (restaurant,) if restaurant is not None else ()
+        if snapshot_id is None:
+            query = f"""
+                SELECT r.key, c.text, i.food, cur.price, d.text
+                FROM restaurants r
+                JOIN items i ON i.restaurant_id = r.id
+                JOIN current cur ON cur.item_id = i.id
+                JOIN texts c ON c.id = i.category_id
+                JOIN texts d ON d.id = cur.description_id
+                {where}
+                ORDER BY r.id, i.id
+            """
+            return self._fetchall(query, params)
+        query = f"""
+            SELECT r.key, c.text, i.food, ch.price, d.text
+            FROM restaurants r
+            JOIN items i ON i.restaurant_id = r.id
+            JOIN changes ch ON ch.item_id = i.id AND ch.snapshot_id = (
+                SELECT max(snapshot_id) FROM changes WHERE item_id = i.id AND snapshot_id <= ?
+            )
+            JOIN texts c ON c.id = i.category_id
+            JOIN texts d ON d.id = ch.description_id
+            {where}{' AND' if where else 'WHERE'} ch.removed = 0
+            ORDER BY r.id, i.id
+        """
+        return self._fetchall(query, (snapshot_id, *params))
+
+    def menu(self, restaurant: str, *, at: Optional[float] = None) -> List[MenuItem]:
+        """A restaurant's items as of time `at` (default: the latest snapshot)."""
+        rows = self._menu_rows(self._snapshot_id(at), restaurant)
+        return [MenuItem(category, food, price, description) for _key, category, food, price, description in rows]
+
+    def iter_menus(self, *, at: Optional[float] = None) -> Iterator[Tuple[str, List[MenuItem]]]:
+        """(restaurant key, items) of every restaurant with items as of time `at`."""
+        rows = self._menu_rows(self._snapshot_id(at), None)
+        for key, group in groupby(rows, key=lambda row: row[0]):
+            yield key, [MenuItem(category, food, price, description) for _key, category, food, price, description in group]
+
+    def price_history(self, restaurant: str, food: str, *, category: Optional[str] = None) -> List[PricePoint]:
+        """
+        Every price the restaurant's items called `food` had, oldest first:
+        one point per item and snapshot where the price changed, the item
+        appeared or it was removed (description-only changes are skipped).
+        """
+        rows = self._fetchall(
+            f"""
+            SELECT s.taken_at, c.text, i.food, i.id, ch.price, ch.removed
+            FROM restaurants r
+            JOIN items i ON i.restaurant_id = r.id
+            JOIN texts c ON c.id = i.category_id
+            JOIN changes ch ON ch.item_id = i.id
+            JOIN snapshots s ON s.id = ch.snapshot_id
+            WHERE r.key = ? AND i.food = ? {'AND c.text = ?' if category is not None else ''}
+            ORDER BY i.id, ch.snapshot_id
+            """,
+            (restaurant, food) if category is None else (restaurant, food, category),
+        )
+        history: List[PricePoint] = []
+        previous: Dict[int, Tuple[Optional[int], bool]] = {}
+        for taken_at, category_text, food_text, item_id, price, removed in rows:
+            state = (price, bool(removed))
+            if previous.get(item_id) == state:
+                continue
+            previous[item_id] = state
+            history.append(PricePoint(taken_at, category_text, food_text, price, bool(removed)))
+        history.sort(key=lambda point: point.taken_at)
+        return history
+
+    def changes(self, snapshot_id: int, *, prices_only: bool = False) -> Iterator[ItemChange]:
+        """What a snapshot changed, with each item's price before and after."""
+        rows = self._fetchall(
+            """
+            SELECT r.key, c.text, i.food, ch.price, ch.removed, prev.price, prev.removed
+            FROM changes ch
+            JOIN items i ON i.id = ch.item_id
+            JOIN restaurants r ON r.id = i.restaurant_id
+            JOIN texts c ON c.id = i.category_id
+            LEFT JOIN changes prev ON prev.item_id = ch.item_id AND prev.snapshot_id = (
+                SELECT max(snapshot_id) FROM changes WHERE item_id = ch.item_id AND snapshot_id < ch.snapshot_id
+            )
+            WHERE ch.snapshot_id = ?
+            ORDER BY r.id, i.id
+            """,
+            (snapshot_id,),
+        )
+        for key, category, food, price, removed, old_price, old_removed in rows:
+            existed = old_removed is not None and not old_removed
+            if removed:
+                kind, new_price = REMOVED, None
+            else:
+                kind, new_price = (CHANGED if existed else ADDED), price
+            old_price = old_price if existed else None
+            if prices_only and kind == CHANGED and old_price == new_price:
+                continue
+            yield ItemChange(key, category, food, kind, old_price, new_price)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = {
+                table: self._conn.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+                for table in ("snapshots", "restaurants", "items", "changes", "current")
+            }
+        size = sum(
+            os.path.getsize(path) for path in (self.path, Path(f"{self.path}-wal")) if os.path.exists(path)
+        )
+        return {
+            "snapshots": counts["snapshots"],
+            "restaurants": counts["restaurants"],
+            "items_seen": counts["items"],
+            "live_items": counts["current"],
+            "changes": counts["changes"],
+            "bytes": size,
+        }
+
+
+_SNAPSHOT_COLUMNS = "id, taken_at, source, full, restaurants, items, added, changed, removed"
+
+
+def _snapshot(row: Tuple) -> Snapshot:
+    snapshot_id, taken_at, source, full, restaurants, items, added, changed, removed = row
+    return Snapshot(snapshot_id, taken_at, source or "", bool(full), restaurants, items, added, changed, removed)
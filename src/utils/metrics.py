@@ -0,0 +1,319 @@
+"""
+Per-stage timings and counters for the pipeline scripts.
+
+Scripts record into a process-wide registry, the way they would use
+`logging`:
+
+    from utils import metrics
+    metrics.configure("04_extraer_comida_restaurante", METRICS_DIR)
+    with metrics.stage("fetch"):
+        ...
+    metrics.count("http_status", code=200)
+
+Stage latencies keep their count and total plus a window of the most recent
+samples for p50/p95. Once configured, the registry writes
+`<directory>/<script>.prom` (Prometheus textfile collector format, replaced
+atomically) and appends structured events to `<directory>/<script>.jsonl`,
+every `export_interval` seconds and at exit. Unconfigured, it only keeps the
+numbers in memory, so library code can record unconditionally.
+"""
+import atexit
+import json
+import math
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar, Union
+
+DEFAULT_EXPORT_INTERVAL = 15.0
+DEFAULT_SAMPLE_WINDOW = 10_000
+QUANTILES = (0.5, 0.95)
+METRIC_PREFIX = "pipeline"
+# Overrides the directory passed to configure(), e.g. a node_exporter textfile dir.
+DIRECTORY_ENV = "PIPELINE_METRICS_DIR"
+
+T = TypeVar("T")
+LabelSet = Tuple[Tuple[str, str], ...]
+
+_NAME_INVALID = re.compile(r"[^a-zA-Z0-9_]")
+
+
+def _metric_name(name: str) -> str:
+    return _NAME_INVALID.sub("_", name)
+
+
+def _label_value(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ""
+    body = ",".join(f'{_metric_name(key)}="{_label_value(value)}"' for key, value in labels.items())
+    return "{" + body + "}"
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list (nan when empty)."""
+    if not sorted_values:
+        return math.nan
+    rank = max(1, math.ceil(q * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class StageStats:
+    def __init__(self, window: int = DEFAULT_SAMPLE_WINDOW):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples: Deque[float] = deque(maxlen=window)
+
+    def add(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.samples.append(seconds)
+
+    def summary(self) -> Dict[str, float]:
+        ordered = sorted(self.samples)
+        summary = {"count": self.count, "total_seconds": round(self.total, 6), "max_seconds": round(self.max, 6)}
+        for q in QUANTILES:
+            summary[f"p{int(q * 100)}_seconds"] = round(percentile(ordered, q), 6)
+        return summary
+
+
+class Metrics:
+    """Thread-safe registry of stage timings, labelled counters and a JSON event log."""
+
+    def __init__(
+        self,
+        script: str = "pipeline",
+        directory: Optional[Union[str, Path]] = None,
+        *,
+        export_interval: float = DEFAULT_EXPORT_INTERVAL,
+        sample_window: int = DEFAULT_SAMPLE_WINDOW,
+    ):
+        self.script = script
+        self.directory = Path(directory) if directory else None
+        self.export_interval = export_interval
+        self.sample_window = sample_window
+        self._stages: Dict[str, StageStats] = {}
+        self._counters: Dict[Tuple[str, LabelSet], float] = {}
+        self._lock = threading.RLock()
+        self._started = time.time()
+        self._last_export = time.monotonic()
+        self._log = None
+
+    @property
+    def prometheus_path(self) -> Optional[Path]:
+        return self.directory / f"{self.script}.prom" if self.directory else None
+
+    @property
+    def log_path(self) -> Optional[Path]:
+        return self.directory / f"{self.script}.jsonl" if self.directory else None
+
+    # --- Recording ---------------------------------------------------------
+
+    def observe(self, stage_name: str, seconds: float) -> None:
+        with self._lock:
+            stats = self._stages.get(stage_name)
+            if stats is None:
+                stats = self._stages[stage_name] = StageStats(self.sample_window)
+            stats.add(seconds)
+        self._maybe_export()
+
+    @contextmanager
+    def stage(self, stage_name: str) -> Iterator[None]:
+        """Time the block as one sample of `stage_name` (also when it raises)."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage_name, time.perf_counter() - started)
+
+    def timed_iter(self, stage_name: str, iterable: Iterable[T]) -> Iterator[T]:
+        """Yield from `iterable`, timing each step of the iteration as `stage_name`."""
+        iterator = iter(iterable)
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            self.observe(stage_name, time.perf_counter() - started)
+            yield item
+
+    def count(self, name: str, value: float = 1, **labels: Any) -> None:
+        key = (name, tuple(sorted((label, str(label_value)) for label, label_value in labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+        self._maybe_export()
+
+    def event(self, event: str, **fields: Any) -> None:
+        """Append one structured event to the JSON log (no-op when unconfigured)."""
+        if self.directory is None:
+            return
+        record = {"ts": round(time.time(), 3), "script": self.script, "event": event, **fields}
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            if self._log is None:
+                self.directory.mkdir(parents=True, exist_ok=True)
+                self._log = open(self.log_path, "a", encoding="utf-8")
+            self._log.write(line)
+            self._log.flush()
+
+    # --- Reading -------------------------------------------------------------
+
+    def counter(self, name: str, **labels: Any) -> float:
+        key = (name, tuple(sorted((label, str(label_value)) for label, label_value in labels.items())))
+        with self._lock:
+            return self._counters.get(key, 0)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            stages = {name: stats.summary() for name, stats in sorted(self._stages.items())}
+            counters = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(self._counters.items())
+            ]
+        return {"uptime_seconds": round(time.time() - self._started, 3), "stages": stages, "counters": counters}
+
+    def prometheus_text(self) -> str:
+        snapshot = self.snapshot()
+        base = {"script": self.script}
+        lines: List[str] = []
+        if snapshot["stages"]:
+            metric = f"{METRIC_PREFIX}_stage_seconds"
+            lines.append(f"# HELP {metric} Wall time per pipeline stage (quantiles over the recent sample window).")
+            lines.append(f"# TYPE {metric} summary")
+            for name, summary in snapshot["stages"].items():
+                labels = {**base, "stage": name}
+                for q in QUANTILES:
+                    value = summary[f"p{int(q * 100)}_seconds"]
+                    lines.append(f"{metric}{_format_labels({**labels, 'quantile': q})} {value!r}")
+                lines.append(f"{metric}_sum{_format_labels(labels)} {summary['total_seconds']!r}")
+                lines.append(f"{metric}_count{_format_labels(labels)} {summary['count']}")
+
+        declared = set()
+        for counter in snapshot["counters"]:
+            metric = f"{METRIC_PREFIX}_{_metric_name(counter['name'])}_total"
+            if metric not in declared:
+                declared.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{_format_labels({**base, **counter['labels']})} {counter['value']!r}")
+
+        metric = f"{METRIC_PREFIX}_last_export_timestamp_seconds"
+        lines.append(f"# TYPE {metric} gauge")
+        lines.append(f"{metric}{_format_labels(base)} {time.time():.3f}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        """Human-readable p50/p95 table, for the end of a run."""
+        snapshot = self.snapshot()
+        lines = [f"[Metrics] {self.script} ({snapshot['uptime_seconds']:.1f}s)"]
+        for name, stage_summary in snapshot["stages"].items():
+            lines.append(
+                f"  {name:<10} n={stage_summary['count']:<7} total={stage_summary['total_seconds']:9.2f}s  "
+                f"p50={stage_summary['p50_seconds'] * 1000:9.1f}ms  p95={stage_summary['p95_seconds'] * 1000:9.1f}ms"
+            )
+        for counter in snapshot["counters"]:
+            labels = ",".join(f"{key}={value}" for key, value in counter["labels"].items())
+            name = f"{counter['name']}{{{labels}}}" if labels else counter["name"]
+            lines.append(f"  {name:<30} {counter['value']:g}")
+        return "\n".join(lines)
+
+    # --- Export ----------------------------------------------------------------
+
+    def _maybe_export(self) -> None:
+        if self.directory is None or time.monotonic() - self._last_export < self.export_interval:
+            return
+        self.export()
+
+    def export(self) -> None:
+        """Rewrite the Prometheus textfile and log a snapshot event."""
+        if self.directory is None:
+            return
+        with self._lock:
+            self._last_export = time.monotonic()
+            self.directory.mkdir(parents=True, exist_ok=True)
+            fd, tmp_name = tempfile.mkstemp(dir=self.directory, prefix=f".{self.script}.", suffix=".prom.tmp")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as handle:
+                    handle.write(self.prometheus_text())
+                os.replace(tmp_name, self.prometheus_path)
+            except BaseException:
+                if os.path.exists(tmp_name):
+                    os.unlink(tmp_name)
+                raise
+            self.event("metrics", **self.snapshot())
+
+    def close(self) -> None:
+        with self._lock:
+            self.export()
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+
+
+_registry = Metrics()
+_atexit_registered = False
+
+
+def configure(
+    script: str,
+    directory: Optional[Union[str, Path]] = None,
+    *,
+    export_interval: float = DEFAULT_EXPORT_INTERVAL,
+) -> Metrics:
+    """
+    Name the process-wide registry and start exporting to `directory` (or
+    $PIPELINE_METRICS_DIR). Everything recorded before the call is kept.
+    """
+    global _atexit_registered
+    directory = os.getenv(DIRECTORY_ENV) or directory
+    with _registry._lock:
+        _registry.script = script
+        _registry.directory = Path(directory) if directory else None
+        _registry.export_interval = export_interval
+        if not _atexit_registered:
+            atexit.register(_registry.close)
+            _atexit_registered = True
+    _registry.event("start", pid=os.getpid())
+    return _registry
+
+
+def registry() -> Metrics:
+    return _registry
+
+
+def stage(stage_name: str):
+    return _registry.stage(stage_name)
+
+
+def observe(stage_name: str, seconds: float) -> None:
+    _registry.observe(stage_name, seconds)
+
+
+def timed_iter(stage_name: str, iterable: Iterable[T]) -> Iterator[T]:
+    return _registry.timed_iter(stage_name, iterable)
+
+
+def count(name: str, value: float = 1, **labels: Any) -> None:
+    _registry.count(name, value, **labels)
+
+
+def event(event_name: str, **fields: Any) -> None:
+    _registry.event(event_name, **fields)
+
+
+def export() -> None:
+    _registry.export()
+
+
+def summary() -> str:
+    return _registry.summary()
@@ -0,0 +1,190 @@
+"""
+Price parsing and the Rappi/PedidosYa price adjustment of the cleaning
+exports, per value and vectorized over pandas columns.
+
+Prices are whole pesos. `normalize_price` is what clean_data.py writes to
+the `price` column ("$12.990,5" -> "12": the digits before the first dot);
+`parse_price` reads that column back as an int. The `*_prices` functions
+do the same for a whole Series with pandas string ops and return the same
+values as mapping the scalar versions over it.
+
+`adjust_prices` moves a seeded sample of the prices of some services by a
+random multiple of 100, like the notebook's adjustment cell did row by row.
+The random draws come from the same `random.Random(seed)` stream in the same
+order, so a seed gives the same prices as the notebook; the prices are then
+parsed, shifted and written back as whole columns.
+
+The vectorized functions need pandas and pyarrow (Arrow compute kernels do
+the string work).
+
+    from utils.prices import adjust_prices
+    food_items_df, adjusted = adjust_prices(food_items_df)
+"""
+import random
+import re
+from typing import Any, Iterable, Optional, Sequence, Tuple
+
+ADJUSTABLE_SERVICES = ("Rappi", "PedidosYa")
+ALLOWED_DELTAS = tuple(range(100, 3001, 100))
+SAMPLE_FRACTION = 0.5
+ADJUSTMENT_SEED = 42
+SIGNS = (-1, 1)
+
+_NON_DIGITS = re.compile(r"\D")
+# Longest digit string that always fits in an int64.
+_MAX_INT64_DIGITS = 18
+
+
+def normalize_price(value: Any) -> str:
+    """Digits before the first ".", without leading zeros; "" when there are none."""
+    text = "" if value is None else str(value)
+    digits = _NON_DIGITS.sub("", text.split(".", 1)[0])
+    if not digits:
+        return ""
+    return str(int(digits))
+
+
+def parse_price(value: Optional[str]) -> Optional[int]:
+    """All the digits of `value` as an int, or None when it has none."""
+    if not value:
+        return None
+    digits = _NON_DIGITS.sub("", value)
+    if not digits:
+        return None
+    return int(digits)
+
+
+def format_price(amount: Optional[int]) -> str:
+    if amount is None:
+        return ""
+    return str(amount)
+
+
+def _as_text(values):
+    """`values` as a str Series, with None/NaN as "" (an object column may mix types)."""
+    return values.where(values.notna(), "").astype(str)
+
+
+def _replace_where(text, mask, pattern: str):
+    """Apply a regex replacement only to the rows of `mask`; most rows are usually clean."""
+    import pyarrow.compute as pc
+
+    if not pc.any(mask).as_py():
+        return text
+    return pc.replace_with_mask(text, mask, pc.replace_substring_regex(text.filter(mask), pattern, ""))
+
+
+def _digit_strings(values, *, before_dot: bool):
+    """
+    The digits of each value as an Arrow string array (what _NON_DIGITS.sub
+    leaves), optionally only those before the first ".".
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    text = pa.array(_as_text(values), type=pa.large_string())
+    if before_dot:
+        text = pc.list_element(pc.split_pattern(text, ".", max_splits=1), 0)
+    # Python's \d is any Unicode decimal digit; RE2's is ASCII only.
+    return _replace_where(text, pc.invert(pc.utf8_is_decimal(text)), r"[^\p{Nd}]+")
+
+
+def _canonical_digits(digits):
+    """
+    Digit strings as str(int(...)) prints them: leading zeros stripped, "0"
+    for all zeros, "" kept. Non-ASCII digits (which int() accepts) are
+    converted one by one.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    stripped = pc.utf8_ltrim(digits, "0")
+    result = pc.if_else(pc.and_(pc.equal(stripped, ""), pc.not_equal(digits, "")), "0", stripped)
+    exotic = pc.invert(pc.string_is_ascii(digits))
+    if pc.any(exotic).as_py():
+        converted = [str(int(text)) for text in digits.filter(exotic).to_pylist()]
+        result = pc.replace_with_mask(result, exotic, pa.array(converted, type=result.type))
+    return result
+
+
+def normalize_prices(values):
+    """normalize_price over a pandas Series; returns a str Series with the same index."""
+    digits = _canonical_digits(_digit_strings(values, before_dot=True))
+    return digits.to_pandas().set_axis(values.index).rename(values.name)
+
+
+def parse_prices(values):
+    """
+    parse_price over a pandas Series, as a nullable Int64 Series (<NA> where
+    parse_price returns None). Prices over 18 digits do not fit in an int64
+    and are left as <NA>.
+    """
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    digits = _canonical_digits(_digit_strings(values, before_dot=False))
+    missing = pc.or_(pc.equal(digits, ""), pc.greater(pc.utf8_length(digits), _MAX_INT64_DIGITS))
+    amounts = pc.cast(pc.if_else(missing, None, digits), pa.int64())
+    amounts = amounts.to_pandas(types_mapper={pa.int64(): pd.Int64Dtype()}.get)
+    return amounts.set_axis(values.index).rename(values.name)
+
+
+def format_prices(amounts):
+    """format_price over an Int64 Series: "" for <NA>."""
+    return amounts.astype("string").fillna("").astype(str)
+
+
+def draw_adjustments(
+    eligible: int,
+    *,
+    deltas: Sequence[int] = ALLOWED_DELTAS,
+    fraction: float = SAMPLE_FRACTION,
+    seed: int = ADJUSTMENT_SEED,
+) -> Tuple[list, list]:
+    """
+    Pick `int(eligible * fraction)` of `eligible` rows and a signed delta for
+    each. Returns (positions, signed deltas), in the order the notebook drew
+    them: random.sample first, then a delta and a sign per picked row.
+    """
+    rng = random.Random(seed)
+    count = int(eligible * fraction)
+    if not count:
+        return [], []
+    # sample() only looks at the population size, so positions stand in for the index labels.
+    positions = rng.sample(range(eligible), k=count)
+    choice = rng.choice
+    signed = [choice(deltas) * choice(SIGNS) for _ in range(count)]
+    return positions, signed
+
+
+def adjust_prices(
+    food_items_df,
+    *,
+    services: Iterable[str] = ADJUSTABLE_SERVICES,
+    deltas: Sequence[int] = ALLOWED_DELTAS,
+    fraction: float = SAMPLE_FRACTION,
+    seed: int = ADJUSTMENT_SEED,
+):
+    """
+    Shift a seeded sample of the prices of `services` by +/- one of `deltas`,
+    never below `deltas[0]`. Only rows with a parseable price are
+    eligible. Returns a new frame and the number of adjusted rows.
+    """
+    import numpy as np
+
+    food_items_df = food_items_df.copy()
+    prices = parse_prices(food_items_df["price"])
+    eligible = food_items_df["service"].isin(list(services)).to_numpy() & prices.notna().to_numpy()
+    eligible_positions = np.flatnonzero(eligible)
+
+    positions, signed = draw_adjustments(len(eligible_positions), deltas=deltas, fraction=fraction, seed=seed)
+    if not positions:
+        return food_items_df, 0
+
+    rows = eligible_positions[np.asarray(positions, dtype=np.int64)]
+    current = prices.to_numpy(dtype=np.int64, na_value=0)[rows]
+    adjusted = np.maximum(current + np.asarray(signed, dtype=np.int64), deltas[0])
+    price_column = food_items_df.columns.get_loc("price")
+    food_items_df.iloc[rows, price_column] = adjusted.astype(str).astype(object)
+    return food_items_df, len(rows)
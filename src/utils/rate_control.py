@@ -0,0 +1,240 @@
+"""
+Adaptive (AIMD) request pacing shared by the scrapers.
+
+`AimdRateController` keeps a request rate per host. Every healthy response
+adds `increase` requests/s (up to `max_rate`); a block signal (403/429/503)
+multiplies the rate by `decrease` and pauses the host for the server's
+Retry-After or, without one, for a cool-down that doubles with each
+consecutive block. Requests are spaced at 1/rate with some jitter, so the
+rate settles just under what the server tolerates instead of a fixed pause.
+
+`RetryQueue` holds blocked URLs until their delay has passed, so they are
+retried later in the same run instead of being dropped until the next one.
+"""
+import asyncio
+import heapq
+import itertools
+import random
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Generic, Hashable, List, Mapping, Optional, Tuple, TypeVar
+
+BLOCK_STATUS_CODES = {403, 429, 503}
+
+DEFAULT_INITIAL_RATE = 0.3      # ~ one request every 3.3 s, like the old fixed pause
+DEFAULT_MIN_RATE = 1 / 120
+DEFAULT_MAX_RATE = 2.0
+DEFAULT_INCREASE = 0.02         # requests/s added per healthy response
+DEFAULT_DECREASE = 0.5          # rate multiplier on a block
+DEFAULT_JITTER = 0.25
+DEFAULT_COOLDOWN = 30.0         # first pause after a block without Retry-After
+DEFAULT_MAX_COOLDOWN = 900.0
+DEFAULT_MAX_ATTEMPTS = 3
+
+K = TypeVar("K", bound=Hashable)
+
+
+def parse_retry_after(value: Optional[str], *, now: Optional[datetime] = None) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP-date), or None."""
+    if value is None:
+        return None
+    value = value.strip()
+    if not value:
+        return None
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - (now or datetime.now(timezone.utc))).total_seconds())
+
+
+def _header(headers: Optional[Mapping[str, str]], name: str) -> Optional[str]:
+    if not headers:
+        return None
+    lowered = name.lower()
+    for key, value in headers.items():
+        if key.lower() == lowered:
+            return value
+    return None
+
+
+@dataclass
+class HostRate:
+    rate: float
+    next_slot: float = 0.0
+    blocked_until: float = 0.0
+    consecutive_blocks: int = 0
+    successes: int = 0
+    blocks: int = 0
+
+
+class AimdRateController:
+    """Per-host additive-increase / multiplicative-decrease pacing. Thread-safe."""
+
+    def __init__(
+        self,
+        *,
+        initial_rate: float = DEFAULT_INITIAL_RATE,
+        min_rate: float = DEFAULT_MIN_RATE,
+        max_rate: float = DEFAULT_MAX_RATE,
+        increase: float = DEFAULT_INCREASE,
+        decrease: float = DEFAULT_DECREASE,
+        jitter: float = DEFAULT_JITTER,
+        cooldown: float = DEFAULT_COOLDOWN,
+        max_cooldown: float = DEFAULT_MAX_COOLDOWN,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if not 0 < min_rate <= initial_rate <= max_rate:
+            raise ValueError("Rates must satisfy 0 < min_rate <= initial_rate <= max_rate")
+        if not 0 < decrease < 1:
+            raise ValueError("decrease must be between 0 and 1")
+        self.initial_rate = initial_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.jitter = jitter
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self._clock = clock
+        self._hosts: Dict[str, HostRate] = {}
+        self._lock = threading.Lock()
+
+    def _state(self, host: str) -> HostRate:
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = HostRate(self.initial_rate)
+        return state
+
+    def rate(self, host: str = "") -> float:
+        with self._lock:
+            return self._state(host).rate
+
+    def reserve(self, host: str = "") -> float:
+        """Book the next request slot for `host`; returns how long to wait for it."""
+        with self._lock:
+            state = self._state(host)
+            now = self._clock()
+            slot = max(now, state.next_slot, state.blocked_until)
+            spacing = (1.0 / state.rate) * (1.0 + random.uniform(0.0, self.jitter))
+            state.next_slot = slot + spacing
+            return slot - now
+
+    def wait(self, host: str = "") -> float:
+        """Block the calling thread until the next slot. Returns the seconds waited."""
+        delay = self.reserve(host)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    async def acquire(self, host: str = "") -> None:
+        """Async counterpart of wait(); same interface as async_fetch.HostBudget."""
+        delay = self.reserve(host)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def on_success(self, host: str = "") -> None:
+        with self._lock:
+            state = self._state(host)
+            state.successes += 1
+            state.consecutive_blocks = 0
+            state.rate = min(self.max_rate, state.rate + self.increase)
+
+    def on_block(self, host: str = "", retry_after: Optional[float] = None) -> float:
+        """Cut the rate and pause the host. Returns the pause in seconds."""
+        with self._lock:
+            state = self._state(host)
+            state.blocks += 1
+            state.consecutive_blocks += 1
+            state.rate = max(self.min_rate, state.rate * self.decrease)
+            if retry_after is None:
+                pause = min(self.max_cooldown, self.cooldown * 2 ** (state.consecutive_blocks - 1))
+            else:
+                pause = min(self.max_cooldown, retry_after)
+            state.blocked_until = max(state.blocked_until, self._clock() + pause)
+            return pause
+
+    def record(self, host: str, status: Optional[int], headers: Optional[Mapping[str, str]] = None) -> Optional[float]:
+        """
+        Feed back one response. Block codes call on_block (honouring
+        Retry-After) and return the pause; other responses below 500 count as
+        healthy. Network errors and other 5xx leave the rate unchanged.
+        """
+        if status in BLOCK_STATUS_CODES:
+            return self.on_block(host, parse_retry_after(_header(headers, "Retry-After")))
+        if status is not None and status < 500:
+            self.on_success(host)
+        return None
+
+    def pause(self, host: str, seconds: float) -> None:
+        """Pause `host` without changing its rate (HostBudget compatibility)."""
+        with self._lock:
+            state = self._state(host)
+            state.blocked_until = max(state.blocked_until, self._clock() + seconds)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            now = self._clock()
+            return {
+                host: {
+                    "rate": round(state.rate, 4),
+                    "successes": state.successes,
+                    "blocks": state.blocks,
+                    "paused_for": round(max(0.0, state.blocked_until - now), 1),
+                }
+                for host, state in self._hosts.items()
+            }
+
+
+class RetryQueue(Generic[K]):
+    """
+    Items waiting to be retried, ordered by when they become ready. Each item
+    can be pushed `max_attempts` times; after that push() refuses it.
+    Thread-safe.
+    """
+
+    def __init__(self, max_attempts: int = DEFAULT_MAX_ATTEMPTS, *, clock: Callable[[], float] = time.monotonic):
+        self.max_attempts = max_attempts
+        self._clock = clock
+        self._heap: List[Tuple[float, int, K]] = []
+        self._order = itertools.count()
+        self._attempts: Dict[K, int] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._heap)
+
+    def attempts(self, item: K) -> int:
+        with self._lock:
+            return self._attempts.get(item, 0)
+
+    def push(self, item: K, delay: float) -> bool:
+        """Schedule `item` in `delay` seconds. False if it has used all its attempts."""
+        with self._lock:
+            attempts = self._attempts.get(item, 0)
+            if attempts >= self.max_attempts:
+                return False
+            self._attempts[item] = attempts + 1
+            heapq.heappush(self._heap, (self._clock() + max(0.0, delay), next(self._order), item))
+            return True
+
+    def pop_ready(self) -> Optional[K]:
+        with self._lock:
+            if self._heap and self._heap[0][0] <= self._clock():
+                return heapq.heappop(self._heap)[2]
+            return None
+
+    def next_delay(self) -> Optional[float]:
+        """Seconds until the next item is ready (0 if one is), or None when empty."""
+        with self._lock:
+            if not self._heap:
+                return None
+            return max(0.0, self._heap[0][0] - self._clock())
@@ -0,0 +1,768 @@
+"""
+On-disk inverted index over the food items, with BM25 ranking.
+
+Text is folded like the cleaning notebook's emoji tagging (NFKD, accents
+dropped, lowercase; see emoji_classifier.fold_text) and split into [\\w']+
+tokens, so "Ñoquis" and "noquis" are the same term. `food`, `category`,
+`restaurant` and `description` are indexed with per-field weights
+(FIELD_WEIGHTS) into a single weighted term frequency per document.
+
+The index is a directory of immutable segments plus `index.json`, which
+lists the live segments and their deletion files. A segment stores, as
+numpy arrays opened with mmap:
+
+    terms.txt          sorted terms, one per line
+    term_offsets.npy   where each term's postings start in postings/freqs
+    postings.npy       local document numbers (uint32), ascending per term
+    freqs.npy          weighted term frequencies (float16)
+    lengths.npy        weighted document lengths
+    keys.npy, groups.npy    document and restaurant keys (uint64)
+    service.npy, zone.npy, price.npy   filter columns
+    docs.bin + doc_blocks.npy          stored documents, zlib-compressed in
+                                       blocks of DOC_BLOCK (JSON rows)
+
+Updates never rewrite a segment: new documents go to new segments and
+removed ones are recorded in a per-segment deletion file. `index.json` is
+replaced atomically, so readers see either the old or the new state; a
+reader picks up changes with `refresh()`. When there are too many segments
+or too many deleted documents, everything is merged into one segment.
+One writer at a time.
+
+    index = SearchIndex(path)
+    index.update(documents)
+    hits = index.search("pizza napo*", zone="Providencia", max_price=12000)
+"""
+import bisect
+import hashlib
+import json
+import math
+import mmap
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import zlib
+from array import array
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple, Union
+
+import numpy as np
+
+from utils.emoji_classifier import fold_text
+from utils.prices import parse_price
+
+MANIFEST_NAME = "index.json"
+FORMAT_VERSION = 1
+
+FIELD_WEIGHTS = {"food": 3.0, "category": 1.5, "restaurant": 1.5, "description": 1.0}
+# A restaurant is one service listing of one place; its documents are replaced together.
+GROUP_FIELDS = ("service", "restaurant", "address", "zone")
+CONTENT_FIELDS = ("food", "category", "description", "price")
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+DEFAULT_LIMIT = 20
+MAX_PREFIX_EXPANSIONS = 64
+SEGMENT_DOCS = 250_000
+DOC_BLOCK = 64
+DOC_BLOCK_CACHE = 256
+MAX_SEGMENTS = 8
+MAX_DELETED_RATIO = 0.3
+NO_PRICE = -1
+MAX_PRICE = 2**31 - 1
+
+TOKEN_PATTERN = re.compile(r"[\w']+")
+
+
+@lru_cache(maxsize=65_536)
+def tokenize(text: str) -> Tuple[str, ...]:
+    """Folded [\\w']+ tokens of `text` ("Pizzas Clásicas" -> ("pizzas", "clasicas"))."""
+    return tuple(TOKEN_PATTERN.findall(fold_text(text))) if text else ()
+
+
+def _hash64(*parts: Any) -> int:
+    digest = hashlib.blake2b("\x1f".join(str(part) for part in parts).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def group_key(document: Dict[str, Any]) -> int:
+    return _hash64(*(document.get(name) or "" for name in GROUP_FIELDS))
+
+
+def _text(document: Dict[str, Any], name: str) -> str:
+    value = document.get(name)
+    return "" if value is None else str(value)
+
+
+@dataclass
+class SearchHit:
+    score: float
+    document: Dict[str, Any]
+
+
+@dataclass
+class SearchResult:
+    query: str
+    total: int
+    hits: List[SearchHit]
+    seconds: float
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "query": self.query,
+            "total": self.total,
+            "took_ms": round(self.seconds * 1000, 3),
+            "hits": [{"score": round(hit.score, 4), **hit.document} for hit in self.hits],
+        }
+
+
+@dataclass
+class UpdateStats:
+    added: int = 0
+    deleted: int = 0
+    unchanged: int = 0
+    segments: int = 0
+    merged: bool = False
+
+
+def _write_array(directory: Path, name: str, values: np.ndarray) -> None:
+    np.save(directory / name, values, allow_pickle=False)
+
+
+def _write_json(path: Path, payload: Any) -> None:
+    """Replace `path` atomically."""
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as handle:
+            json.dump(payload, handle, ensure_ascii=False, indent=1)
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(tmp_name, path)
+    except BaseException:
+        if os.path.exists(tmp_name):
+            os.unlink(tmp_name)
+        raise
+
+
+def write_segment(
+    directory: Path,
+    documents: Sequence[Dict[str, Any]],
+    keys: Sequence[int],
+    groups: Sequence[int],
+) -> None:
+    """Index `documents` (with their precomputed keys) into a new segment directory."""
+    directory.mkdir(parents=True)
+    term_ids: Dict[str, int] = {}
+    posting_terms = array("i")
+    posting_docs = array("I")
+    posting_freqs = array("f")
+    lengths = np.zeros(len(documents), dtype=np.float32)
+    service_codes: Dict[str, int] = {}
+    zone_codes: Dict[str, int] = {}
+    services = np.zeros(len(documents), dtype=np.uint16)
+    zones = np.zeros(len(documents), dtype=np.uint32)
+    prices = np.full(len(documents), NO_PRICE, dtype=np.int32)
+    fields: Dict[str, int] = {}
+    block: List[List[Any]] = []
+    block_offsets = [0]
+
+    def flush_block() -> None:
+        payload = json.dumps(block, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        docs_handle.write(zlib.compress(payload, 6))
+        block_offsets.append(docs_handle.tell())
+        block.clear()
+
+    with (directory / "docs.bin").open("wb") as docs_handle:
+        for number, document in enumerate(documents):
+            frequencies: Counter = Counter()
+            for name, weight in FIELD_WEIGHTS.items():
+                for token in tokenize(_text(document, name)):
+                    frequencies[token] += weight
+            for token, frequency in frequencies.items():
+                term_id = term_ids.setdefault(token, len(term_ids))
+                posting_terms.append(term_id)
+                posting_docs.append(number)
+                posting_freqs.append(frequency)
+            lengths[number] = sum(frequencies.values())
+            services[number] = service_codes.setdefault(_text(document, "service"), len(service_codes))
+            zones[number] = zone_codes.setdefault(_text(document, "zone"), len(zone_codes))
+            price = parse_price(_text(document, "price"))
+            if price is not None:
+                prices[number] = min(price, MAX_PRICE)
+            for name in document:
+                fields.setdefault(name, len(fields))
+            row: List[Any] = [None] * len(fields)
+            for name, value in document.items():
+                row[fields[name]] = value
+            block.append(row)
+            if len(block) >= DOC_BLOCK:
+                flush_block()
+        if block:
+            flush_block()
+
+    vocabulary = sorted(term_ids)
+    # Old term id -> position in the sorted vocabulary.
+    rank = np.empty(len(vocabulary), dtype=np.int64)
+    rank[[term_ids[term] for term in vocabulary]] = np.arange(len(vocabulary))
+    terms = rank[np.frombuffer(posting_terms, dtype=np.int32)] if posting_terms else np.zeros(0, dtype=np.int64)
+    docs = np.frombuffer(posting_docs, dtype=np.uint32) if posting_docs else np.zeros(0, dtype=np.uint32)
+    freqs = np.frombuffer(posting_freqs, dtype=np.float32) if posting_freqs else np.zeros(0, dtype=np.float32)
+    # Documents were numbered in order, so a stable sort by term keeps each posting list ascending.
+    order = np.argsort(terms, kind="stable")
+    term_offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(terms, minlength=len(vocabulary)), out=term_offsets[1:])
+
+    (directory / "terms.txt").write_text("\n".join(vocabulary), encoding="utf-8")
+    _write_array(directory, "term_offsets.npy", term_offsets)
+    _write_array(directory, "postings.npy", docs[order])
+    _write_array(directory, "freqs.npy", freqs[order].astype(np.float16))
+    _write_array(directory, "lengths.npy", lengths)
+    _write_array(directory, "keys.npy", np.asarray(keys, dtype=np.uint64))
+    _write_array(directory, "groups.npy", np.asarray(groups, dtype=np.uint64))
+    _write_array(directory, "service.npy", services)
+    _write_array(directory, "zone.npy", zones)
+    _write_array(directory, "price.npy", prices)
+    _write_array(directory, "doc_blocks.npy", np.asarray(block_offsets, dtype=np.int64))
+    meta = {
+        "docs": len(documents),
+        "fields": list(fields),
+        "total_length": float(lengths.sum(dtype=np.float64)),
+        "services": list(service_codes),
+        "zones": list(zone_codes),
+    }
+    (directory / "meta.json").write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+
+
+class Segment:
+    """A read-only segment, memory-mapped, with its current deletions."""
+
+    def __init__(self, directory: Path, deletes: Optional[Path] = None):
+        self.directory = directory
+        self.name = directory.name
+        meta = json.loads((directory / "meta.json").read_text(encoding="utf-8"))
+        self.size: int = meta["docs"]
+        self.total_length: float = meta["total_length"]
+        self.services: List[str] = meta["services"]
+        self.zones: List[str] = meta["zones"]
+        self.fields: List[str] = meta["fields"]
+        text = (directory / "terms.txt").read_text(encoding="utf-8")
+        self.terms: List[str] = text.split("\n") if text else []
+        self._term_index = {term: position for position, term in enumerate(self.terms)}
+        self.term_offsets = self._load("term_offsets.npy")
+        self.postings = self._load("postings.npy")
+        self.freqs = self._load("freqs.npy")
+        self.lengths = self._load("lengths.npy")
+        self.keys = self._load("keys.npy")
+        self.groups = self._load("groups.npy")
+        self.service = self._load("service.npy")
+        self.zone = self._load("zone.npy")
+        self.price = self._load("price.npy")
+        self.doc_blocks = self._load("doc_blocks.npy")
+        self.deletes_path = deletes
+        self.deleted = np.load(deletes) if deletes is not None else np.zeros(self.size, dtype=bool)
+        self.live = ~self.deleted
+        self.live_count = int(self.live.sum())
+        with (directory / "docs.bin").open("rb") as handle:
+            self._docs = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        self._blocks: "OrderedDict[int, List[List[Any]]]" = OrderedDict()
+        self._blocks_lock = threading.Lock()
+        self._norms: Tuple[float, Optional[np.ndarray]] = (0.0, None)
+
+    def _load(self, name: str) -> np.ndarray:
+        return np.load(self.directory / name, mmap_mode="r", allow_pickle=False)
+
+    def close(self) -> None:
+        self._docs.close()
+
+    def length_norms(self, average_length: float) -> np.ndarray:
+        """BM25's k1 * (1 - b + b * length / average) per document, cached for the last average."""
+        cached_average, norms = self._norms
+        if norms is None or cached_average != average_length:
+            norms = BM25_K1 * (1.0 - BM25_B + BM25_B * np.asarray(self.lengths) / average_length)
+            norms = norms.astype(np.float32)
+            self._norms = (average_length, norms)
+        return norms
+
+    def doc_freq(self, term: str) -> int:
+        position = self._term_index.get(term)
+        if position is None:
+            return 0
+        return int(self.term_offsets[position + 1] - self.term_offsets[position])
+
+    def expand_prefix(self, prefix: str) -> List[str]:
+        """Terms starting with `prefix`, the most frequent first, at most MAX_PREFIX_EXPANSIONS."""
+        start = bisect.bisect_left(self.terms, prefix)
+        end = bisect.bisect_left(self.terms, prefix + "\U0010ffff", lo=start)
+        if end - start <= MAX_PREFIX_EXPANSIONS:
+            return self.terms[start:end]
+        frequencies = np.diff(self.term_offsets[start:end + 1])
+        best = np.argsort(-frequencies, kind="stable")[:MAX_PREFIX_EXPANSIONS]
+        return [self.terms[start + position] for position in best]
+
+    def postings_for(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        position = self._term_index.get(term)
+        if position is None:
+            return np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.float16)
+        start, end = self.term_offsets[position], self.term_offsets[position + 1]
+        return self.postings[start:end], self.freqs[start:end]
+
+    def filter_mask(
+        self,
+        numbers: np.ndarray,
+        services: Optional[Set[str]],
+        zones: Optional[Set[str]],
+        min_price: Optional[int],
+        max_price: Optional[int],
+    ) -> np.ndarray:
+        """Which of the documents `numbers` are live and pass the filters."""
+        mask = self.live[numbers]
+        if services is not None:
+            codes = [code for code, name in enumerate(self.services) if fold_text(name) in services]
+            mask &= np.isin(self.service[numbers], codes)
+        if zones is not None:
+            codes = [code for code, name in enumerate(self.zones) if fold_text(name) in zones]
+            mask &= np.isin(self.zone[numbers], codes)
+        if min_price is not None or max_price is not None:
+            prices = self.price[numbers]
+            mask &= prices != NO_PRICE
+            if min_price is not None:
+                mask &= prices >= min_price
+            if max_price is not None:
+                mask &= prices <= max_price
+        return mask
+
+    def score_clause(
+        self,
+        terms: Sequence[str],
+        idf: Dict[str, float],
+        norms: np.ndarray,
+        within: Optional[np.ndarray] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (documents, BM25 scores) matching any of `terms`, documents ascending,
+        optionally only among the sorted documents `within`. A document
+        matching several terms (a prefix clause) scores as its best one.
+        """
+        parts = []
+        for term in terms:
+            docs, freqs = self.postings_for(term)
+            if within is not None and len(docs):
+                positions = np.minimum(np.searchsorted(docs, within), len(docs) - 1)
+                positions = positions[docs[positions] == within]
+                docs, freqs = docs[positions], freqs[positions]
+            if len(docs):
+                tf = np.asarray(freqs, dtype=np.float32)
+                parts.append((np.asarray(docs), idf[term] * tf * (BM25_K1 + 1.0) / (tf + norms[docs])))
+        if not parts:
+            return np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.float32)
+        if len(parts) == 1:
+            return parts[0]
+        docs = np.concatenate([part[0] for part in parts])
+        scores = np.concatenate([part[1] for part in parts])
+        order = np.lexsort((-scores, docs))
+        docs, scores = docs[order], scores[order]
+        first = np.r_[True, docs[1:] != docs[:-1]]
+        return docs[first], scores[first]
+
+    def _read_block(self, block: int) -> List[List[Any]]:
+        start, end = int(self.doc_blocks[block]), int(self.doc_blocks[block + 1])
+        return json.loads(zlib.decompress(self._docs[start:end]))
+
+    def _block(self, block: int) -> List[List[Any]]:
+        with self._blocks_lock:
+            rows = self._blocks.get(block)
+            if rows is not None:
+                self._blocks.move_to_end(block)
+                return rows
+        rows = self._read_block(block)
+        with self._blocks_lock:
+            self._blocks[block] = rows
+            if len(self._blocks) > DOC_BLOCK_CACHE:
+                self._blocks.popitem(last=False)
+        return rows
+
+    def _as_document(self, row: List[Any]) -> Dict[str, Any]:
+        return {name: value for name, value in zip(self.fields, row) if value is not None}
+
+    def document(self, number: int) -> Dict[str, Any]:
+        return self._as_document(self._block(number // DOC_BLOCK)[number % DOC_BLOCK])
+
+    def iter_live(self) -> Iterator[Tuple[Dict[str, Any], int, int]]:
+        """(document, key, group) for every live document, in order."""
+        for block in range(len(self.doc_blocks) - 1):
+            for offset, row in enumerate(self._read_block(block)):
+                number = block * DOC_BLOCK + offset
+                if self.live[number]:
+                    yield self._as_document(row), int(self.keys[number]), int(self.groups[number])
+
+
+def _parse_query(query: str, prefix_last: bool) -> List[Tuple[str, bool]]:
+    """(token, is_prefix) clauses; "word*" is a prefix, and so is the last word with `prefix_last`."""
+    clauses: List[Tuple[str, bool]] = []
+    pieces = query.split()
+    for index, piece in enumerate(pieces):
+        tokens = tokenize(piece)
+        if not tokens:
+            continue
+        prefix = piece.endswith("*") or (prefix_last and index == len(pieces) - 1)
+        clauses.extend((token, False) for token in tokens[:-1])
+        clauses.append((tokens[-1], prefix))
+    return clauses
+
+
+def _folded_set(values: Union[None, str, Iterable[str]]) -> Optional[Set[str]]:
+    if values is None:
+        return None
+    if isinstance(values, str):
+        values = [values]
+    folded = {fold_text(value) for value in values if value}
+    return folded or None
+
+
+class SearchIndex:
+    """The segments listed in `<path>/index.json`; see the module docstring."""
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._manifest: Dict[str, Any] = {"version": FORMAT_VERSION, "generation": 0, "next_segment": 1, "segments": []}
+        self._manifest_version: Optional[Tuple[int, int]] = None
+        self.segments: List[Segment] = []
+        self.refresh()
+
+    @property
+    def manifest_path(self) -> Path:
+        return self.path / MANIFEST_NAME
+
+    @property
+    def generation(self) -> int:
+        return self._manifest["generation"]
+
+    def close(self) -> None:
+        for segment in self.segments:
+            segment.close()
+
+    def __enter__(self) -> "SearchIndex":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    # ------------------------------------------------------------------ reading
+
+    def refresh(self) -> bool:
+        """Reload the segment list if index.json changed. Returns whether it did."""
+        try:
+            stat = self.manifest_path.stat()
+        except FileNotFoundError:
+            return False
+        # index.json is replaced, never rewritten in place, so a new inode means a new version.
+        version = (stat.st_ino, stat.st_mtime_ns)
+        if version == self._manifest_version:
+            return False
+        manifest = json.loads(self.manifest_path.read_text(encoding="utf-8"))
+        if manifest.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported search index version in {self.manifest_path}: {manifest.get('version')}")
+        previous = {segment.name: segment for segment in self.segments}
+        segments = []
+        for entry in manifest["segments"]:
+            deletes = self.path / entry["deletes"] if entry.get("deletes") else None
+            old = previous.get(entry["name"])
+            if old is not None and old.deletes_path == deletes:
+                segments.append(old)
+            else:
+                segments.append(Segment(self.path / entry["name"], deletes))
+        with self._lock:
+            self._manifest = manifest
+            self._manifest_version = version
+            self.segments = segments
+        # Dropped segments are not closed here: a search running in another
+        # thread may still hold them. Their mmaps close when they are collected.
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        segments = self.segments
+        return {
+            "generation": self.generation,
+            "segments": len(segments),
+            "documents": sum(segment.live_count for segment in segments),
+            "deleted": sum(segment.size - segment.live_count for segment in segments),
+            "terms": sum(len(segment.terms) for segment in segments),
+            "bytes": sum(entry.stat().st_size for entry in self.path.rglob("*") if entry.is_file()),
+        }
+
+    def search(
+        self,
+        query: str,
+        *,
+        limit: int = DEFAULT_LIMIT,
+        service: Union[None, str, Iterable[str]] = None,
+        zone: Union[None, str, Iterable[str]] = None,
+        min_price: Optional[int] = None,
+        max_price: Optional[int] = None,
+        prefix_last: bool = False,
+        match_all: bool = True,
+    ) -> SearchResult:
+        """
+        BM25-ranked documents for `query`. Words ending in "*" (and the last
+        word with `prefix_last`) match every term they prefix. With
+        `match_all` a document must match every word. `service` and `zone`
+        compare accent- and case-insensitively; a price range excludes
+        documents without a price. Document frequencies count deleted
+        documents until the next merge, like most segment-based engines.
+        """
+        if limit < 1:
+            raise ValueError(f"limit must be at least 1, got {limit}")
+        started = time.perf_counter()
+        segments = self.segments
+        clauses = _parse_query(query, prefix_last)
+        if not clauses or not segments:
+            return SearchResult(query, 0, [], time.perf_counter() - started)
+
+        # Collection statistics across segments.
+        total_docs = sum(segment.size for segment in segments)
+        average_length = (sum(segment.total_length for segment in segments) / total_docs) or 1.0
+        clause_terms: List[List[str]] = []
+        for token, is_prefix in clauses:
+            if is_prefix:
+                expanded: Set[str] = set()
+                for segment in segments:
+                    expanded.update(segment.expand_prefix(token))
+                clause_terms.append(sorted(expanded))
+            else:
+                clause_terms.append([token])
+        idf: Dict[str, float] = {}
+        for terms in clause_terms:
+            for term in terms:
+                if term not in idf:
+                    frequency = sum(segment.doc_freq(term) for segment in segments)
+                    idf[term] = math.log(1.0 + (total_docs - frequency + 0.5) / (frequency + 0.5))
+
+        services, zones = _folded_set(service), _folded_set(zone)
+        total = 0
+        candidates: List[Tuple[float, int, int]] = []
+        for segment_number, segment in enumerate(segments):
+            if not segment.live_count:
+                continue
+            norms = segment.length_norms(average_length)
+            # Shortest posting lists first, so later clauses are only scored where earlier ones matched.
+            ordered = sorted(clause_terms, key=lambda terms: sum(segment.doc_freq(term) for term in terms))
+            numbers, scores = segment.score_clause(ordered[0], idf, norms)
+            for terms in ordered[1:]:
+                if match_all:
+                    docs, clause_scores = segment.score_clause(terms, idf, norms, within=numbers)
+                    found = np.isin(numbers, docs, assume_unique=True)
+                    numbers, scores = docs, scores[found] + clause_scores
+                else:
+                    docs, clause_scores = segment.score_clause(terms, idf, norms)
+                    numbers, inverse = np.unique(np.concatenate([numbers, docs]), return_inverse=True)
+                    scores = np.bincount(
+                        inverse, weights=np.concatenate([scores, clause_scores]), minlength=len(numbers)
+                    )
+                if not len(numbers):
+                    break
+            keep = segment.filter_mask(numbers, services, zones, min_price, max_price)
+            numbers, scores = numbers[keep], scores[keep]
+            total += len(numbers)
+            if len(numbers) > limit:
+                best = np.argpartition(-scores, limit - 1)[:limit]
+                numbers, scores = numbers[best], scores[best]
+            candidates.extend(
+                (float(score), segment_number, int(number)) for score, number in zip(scores, numbers)
+            )
+
+        candidates.sort(key=lambda candidate: (-candidate[0], candidate[1], candidate[2]))
+        hits = [
+            SearchHit(score, segments[segment_number].document(number))
+            for score, segment_number, number in candidates[:limit]
+        ]
+        return SearchResult(query, total, hits, time.perf_counter() - started)
+
+    # ------------------------------------------------------------------ writing
+
+    def _new_segment_name(self, manifest: Dict[str, Any]) -> str:
+        # Skip names left on disk by an update that died before its commit.
+        while True:
+            name = f"seg-{manifest['next_segment']:06d}"
+            manifest["next_segment"] += 1
+            if not (self.path / name).exists():
+                return name
+
+    @staticmethod
+    def _remove(paths: Iterable[Path]) -> None:
+        for path in paths:
+            if path.is_dir():
+                shutil.rmtree(path, ignore_errors=True)
+            elif path.exists():
+                path.unlink()
+
+    def _commit(self, manifest: Dict[str, Any], obsolete: Iterable[Path], written: Sequence[Path] = ()) -> None:
+        """
+        Publish `manifest`, then drop the `obsolete` files. If the manifest
+        cannot be written, the segments and deletion files `written` for it
+        are removed instead.
+        """
+        manifest["generation"] += 1
+        try:
+            _write_json(self.manifest_path, manifest)
+        except BaseException:
+            self._remove(written)
+            raise
+        # Readers that loaded the old manifest keep their open mmaps; new ones never see these.
+        self._remove(obsolete)
+        self.refresh()
+
+    def update(
+        self,
+        documents: Iterable[Dict[str, Any]],
+        *,
+        replace_all: bool = False,
+        segment_docs: int = SEGMENT_DOCS,
+    ) -> UpdateStats:
+        """
+        Bring the index in line with `documents`. Every restaurant present in
+        the input is replaced by its input documents: new documents are
+        indexed, documents it no longer has are deleted and unchanged ones
+        are kept. With `replace_all`, restaurants missing from the input are
+        deleted too (the input is the whole collection).
+        """
+        self.refresh()
+        stats = UpdateStats()
+        manifest = json.loads(json.dumps(self._manifest))
+        segments = list(self.segments)
+        live_keys = (
+            np.unique(np.concatenate([np.asarray(segment.keys)[segment.live] for segment in segments]))
+            if segments else np.zeros(0, dtype=np.uint64)
+        )
+
+        incoming_keys: List[np.ndarray] = []
+        incoming_groups: Set[int] = set()
+        occurrences: Counter = Counter()
+        batch: List[Dict[str, Any]] = []
+        batch_keys: List[int] = []
+        batch_groups: List[int] = []
+        new_segments: List[str] = []
+        # Uncommitted segments and deletion files, removed if the update fails.
+        written: List[Path] = []
+
+        def flush() -> None:
+            if not batch:
+                return
+            keys = np.asarray(batch_keys, dtype=np.uint64)
+            incoming_keys.append(keys)
+            fresh = ~np.isin(keys, live_keys)
+            stats.unchanged += int(len(keys) - fresh.sum())
+            if fresh.any():
+                name = self._new_segment_name(manifest)
+                positions = np.flatnonzero(fresh)
+                new_segments.append(name)
+                written.append(self.path / name)
+                write_segment(
+                    self.path / name,
+                    [batch[position] for position in positions],
+                    keys[positions],
+                    [batch_groups[position] for position in positions],
+                )
+                stats.added += len(positions)
+            batch.clear()
+            batch_keys.clear()
+            batch_groups.clear()
+
+        try:
+            for document in documents:
+                group = group_key(document)
+                content = tuple(_text(document, name) for name in CONTENT_FIELDS)
+                occurrence = occurrences[(group, content)]
+                occurrences[(group, content)] = occurrence + 1
+                batch.append(document)
+                batch_keys.append(_hash64(group, *content, occurrence))
+                batch_groups.append(group)
+                incoming_groups.add(group)
+                if len(batch) >= segment_docs:
+                    flush()
+            flush()
+
+            keep = np.unique(np.concatenate(incoming_keys)) if incoming_keys else np.zeros(0, dtype=np.uint64)
+            group_array = np.fromiter(incoming_groups, dtype=np.uint64, count=len(incoming_groups))
+            obsolete: List[Path] = []
+            dropped: Set[str] = set()
+            entries = {entry["name"]: entry for entry in manifest["segments"]}
+            for segment in segments:
+                in_scope = segment.live if replace_all else segment.live & np.isin(segment.groups, group_array)
+                removed = in_scope & ~np.isin(segment.keys, keep)
+                count = int(removed.sum())
+                if not count:
+                    continue
+                stats.deleted += count
+                deleted = segment.deleted | removed
+                if deleted.all():
+                    dropped.add(segment.name)
+                    obsolete.append(segment.directory)
+                    continue
+                relative = f"{segment.name}/deleted-{manifest['generation'] + 1}.npy"
+                written.append(self.path / relative)
+                np.save(self.path / relative, deleted, allow_pickle=False)
+                if segment.deletes_path is not None:
+                    obsolete.append(segment.deletes_path)
+                entries[segment.name]["deletes"] = relative
+            manifest["segments"] = [entry for entry in manifest["segments"] if entry["name"] not in dropped]
+            manifest["segments"].extend({"name": name, "deletes": None} for name in new_segments)
+        except BaseException:
+            self._remove(written)
+            raise
+        if stats.added or stats.deleted:
+            self._commit(manifest, obsolete, written)
+        stats.merged = self._maybe_merge()
+        stats.segments = len(self.segments)
+        return stats
+
+    def _maybe_merge(self) -> bool:
+        segments = self.segments
+        size = sum(segment.size for segment in segments)
+        deleted = size - sum(segment.live_count for segment in segments)
+        if len(segments) <= MAX_SEGMENTS and (not size or deleted / size <= MAX_DELETED_RATIO):
+            return False
+        self.merge()
+        return True
+
+    def merge(self, *, segment_docs: int = SEGMENT_DOCS * 4) -> None:
+        """Rewrite all live documents into as few segments as possible, dropping deletions."""
+        self.refresh()
+        manifest = json.loads(json.dumps(self._manifest))
+        old = list(self.segments)
+        new_segments: List[str] = []
+        written: List[Path] = []
+        documents: List[Dict[str, Any]] = []
+        keys: List[int] = []
+        groups: List[int] = []
+
+        def flush() -> None:
+            if documents:
+                name = self._new_segment_name(manifest)
+                new_segments.append(name)
+                written.append(self.path / name)
+                write_segment(self.path / name, documents, keys, groups)
+                documents.clear()
+                keys.clear()
+                groups.clear()
+
+        try:
+            for segment in old:
+                for document, key, group in segment.iter_live():
+                    documents.append(document)
+                    keys.append(key)
+                    groups.append(group)
+                    if len(documents) >= segment_docs:
+                        flush()
+            flush()
+        except BaseException:
+            self._remove(written)
+            raise
+        manifest["segments"] = [{"name": name, "deletes": None} for name in new_segments]
+        self._commit(manifest, [segment.directory for segment in old], written)
@@ -0,0 +1,175 @@
+"""
+Buffered, long-lived output sinks for the scrapers' JSONL/CSV files.
+
+Each sink keeps its file open for the whole run and buffers encoded rows in
+memory, writing them out when the buffer passes `flush_bytes` or its oldest
+row is older than `flush_seconds`. A `SinkGroup` ties several sinks to the
+crawl state: callbacks registered with `after_durable` (typically marking a
+URL done in the frontier) only run after every sink has been flushed and
+fsynced at the next checkpoint, so a crash can lose buffered rows but never
+leaves an item marked done without its data on disk.
+"""
+import abc
+import csv
+import io
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+DEFAULT_FLUSH_BYTES = 256 * 1024
+DEFAULT_FLUSH_SECONDS = 5.0
+DEFAULT_CHECKPOINT_ITEMS = 50
+DEFAULT_CHECKPOINT_SECONDS = 30.0
+
+
+class BufferedSink(abc.ABC):
+    """Append-only text file with an in-memory write buffer."""
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        flush_bytes: int = DEFAULT_FLUSH_BYTES,
+        flush_seconds: float = DEFAULT_FLUSH_SECONDS,
+    ):
+        self.path = path
+        self.flush_bytes = flush_bytes
+        self.flush_seconds = flush_seconds
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._new_file = not os.path.isfile(path) or os.path.getsize(path) == 0
+        self._handle = open(path, "a", encoding="utf-8", newline="")
+        self._buffer: List[str] = []
+        self._buffered_bytes = 0
+        self._oldest: Optional[float] = None
+        self.rows_written = 0
+
+    @abc.abstractmethod
+    def _encode(self, rows: Sequence[Any]) -> str:
+        """The text appended to the file for `rows`."""
+
+    def write(self, rows: Sequence[Any]) -> None:
+        if not rows:
+            return
+        chunk = self._encode(rows)
+        self._buffer.append(chunk)
+        self._buffered_bytes += len(chunk)
+        self.rows_written += len(rows)
+        if self._oldest is None:
+            self._oldest = time.monotonic()
+        if self._buffered_bytes >= self.flush_bytes or time.monotonic() - self._oldest >= self.flush_seconds:
+            self.flush()
+
+    def flush(self) -> None:
+        """Hand the buffer to the OS (not yet durable)."""
+        if self._buffer:
+            self._handle.write("".join(self._buffer))
+            self._buffer.clear()
+            self._buffered_bytes = 0
+            self._oldest = None
+        self._handle.flush()
+
+    def sync(self) -> None:
+        """Flush and fsync: everything written so far survives a crash."""
+        self.flush()
+        os.fsync(self._handle.fileno())
+
+    def close(self) -> None:
+        if not self._handle.closed:
+            self.sync()
+            self._handle.close()
+
+
+class JsonlSink(BufferedSink):
+    def _encode(self, rows: Sequence[Any]) -> str:
+        return "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+
+
+class CsvSink(BufferedSink):
+    """CSV sink; the header is written once, when the file is new or empty."""
+
+    def __init__(self, path: str, fieldnames: Sequence[str], **kwargs: Any):
+        super().__init__(path, **kwargs)
+        self.fieldnames = list(fieldnames)
+        self._scratch = io.StringIO()
+        self._writer = csv.DictWriter(self._scratch, fieldnames=self.fieldnames, restval=None, extrasaction="ignore")
+        if self._new_file:
+            self._writer.writeheader()
+            self._handle.write(self._take())
+
+    def _take(self) -> str:
+        text = self._scratch.getvalue()
+        self._scratch.seek(0)
+        self._scratch.truncate()
+        return text
+
+    def _encode(self, rows: Sequence[Dict[str, Any]]) -> str:
+        self._writer.writerows(rows)
+        return self._take()
+
+
+class SinkGroup:
+    """
+    Named sinks plus the state updates that must wait until their data is
+    durable. Thread-safe; usable as a context manager (closing checkpoints).
+    """
+
+    def __init__(
+        self,
+        sinks: Dict[str, BufferedSink],
+        *,
+        checkpoint_items: int = DEFAULT_CHECKPOINT_ITEMS,
+        checkpoint_seconds: float = DEFAULT_CHECKPOINT_SECONDS,
+    ):
+        self.sinks = sinks
+        self.checkpoint_items = checkpoint_items
+        self.checkpoint_seconds = checkpoint_seconds
+        self._pending: List[Callable[[], None]] = []
+        self._last_checkpoint = time.monotonic()
+        self._lock = threading.RLock()
+
+    def __enter__(self) -> "SinkGroup":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def write(self, name: str, rows: Sequence[Any]) -> None:
+        with self._lock:
+            self.sinks[name].write(rows)
+
+    def after_durable(self, callback: Callable[[], None]) -> None:
+        """Run `callback` once everything written so far has been fsynced."""
+        with self._lock:
+            self._pending.append(callback)
+            if (
+                len(self._pending) >= self.checkpoint_items
+                or time.monotonic() - self._last_checkpoint >= self.checkpoint_seconds
+            ):
+                self.checkpoint()
+
+    def checkpoint(self) -> int:
+        """Fsync every sink, then run the pending callbacks in order. Returns how many ran."""
+        with self._lock:
+            for sink in self.sinks.values():
+                sink.sync()
+            pending, self._pending = self._pending, []
+            self._last_checkpoint = time.monotonic()
+            for callback in pending:
+                callback()
+            return len(pending)
+
+    def close(self) -> None:
+        with self._lock:
+            try:
+                self.checkpoint()
+            finally:
+                for sink in self.sinks.values():
+                    sink.close()
+
+    def counts(self) -> Dict[str, int]:
+        return {name: sink.rows_written for name, sink in self.sinks.items()}
+
@@ -0,0 +1,162 @@
+"""
+Persistent set of the stores seen by the listing scraper.
+
+The same store card shows up under several category queries and in
+neighbouring zones. Stores are keyed by their normalized path from the card
+`href`; the first sighting is reported as new, later sightings only merge their
+category and zone into the stored record. Backed by SQLite (WAL), so the set
+survives restarts.
+"""
+import json
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from urllib.parse import unquote, urlsplit
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS stores (
+    store_key TEXT PRIMARY KEY,
+    record TEXT NOT NULL,
+    categories TEXT NOT NULL DEFAULT '[]',
+    zones TEXT NOT NULL DEFAULT '[]',
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL
+);
+"""
+
+# "/cl-en/store/some-name/AbC123?diningMode=DELIVERY" -> locale, slug, store id
+_STORE_PATH = re.compile(r"^(?:/[a-z]{2}(?:-[a-z]{2})?)?/store/(?:[^/]+/)?([^/]+)$", re.IGNORECASE)
+_LOCALE_PREFIX = re.compile(r"^/[a-z]{2}(?:-[a-z]{2})?(?=/)", re.IGNORECASE)
+
+
+def normalize_store_path(href: str) -> str:
+    """
+    Stable key for a store link: the store id from `/store/<slug>/<id>` paths
+    (the slug and locale vary between listings), otherwise the lowercased path
+    without locale, query string or trailing slash.
+    """
+    path = urlsplit(href).path if "://" in href else href.split("?", 1)[0].split("#", 1)[0]
+    if "/" in path and not path.startswith("/"):
+        # Hosts glued onto a path without a scheme ("www.ubereats.com/cl/store/...")
+        path = path[path.index("/"):]
+    path = unquote(path).rstrip("/")
+    match = _STORE_PATH.match(path)
+    if match:
+        return f"store/{match.group(1)}"
+    return _LOCALE_PREFIX.sub("", path).lower()
+
+
+@dataclass
+class StoreRecord:
+    key: str
+    record: Dict[str, Any]
+    categories: List[str] = field(default_factory=list)
+    zones: List[str] = field(default_factory=list)
+
+    def merged(self) -> Dict[str, Any]:
+        """The stored record with the categories and zones where it was seen."""
+        return {**self.record, "categories": self.categories, "zones": self.zones}
+
+
+def _merge(existing: List[str], value: Optional[str]) -> Tuple[List[str], bool]:
+    if value is None or value in existing:
+        return existing, False
+    return existing + [value], True
+
+
+class StoreRegistry:
+    """Stores seen so far, with the categories and zones they were listed under."""
+
+    def __init__(self, db_path: Union[str, Path]):
+        if str(db_path) != ":memory:":
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self) -> "StoreRegistry":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM stores").fetchone()[0]
+
+    def observe(
+        self,
+        records: Iterable[Dict[str, Any]],
+        *,
+        category: Optional[str] = None,
+        zone: Optional[str] = None,
+        link_field: str = "service_link",
+    ) -> List[Dict[str, Any]]:
+        """
+        Register one page of store records in a single transaction. Returns the
+        records seen for the first time (duplicates within the page included
+        once); known stores only get `category` and `zone` merged in.
+        """
+        now = time.time()
+        new: List[Dict[str, Any]] = []
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for record in records:
+                    link = record.get(link_field)
+                    if not link:
+                        continue
+                    key = normalize_store_path(link)
+                    row = self._conn.execute(
+                        "SELECT categories, zones FROM stores WHERE store_key = ?", (key,)
+                    ).fetchone()
+                    if row is None:
+                        self._conn.execute(
+                            """
+                            INSERT INTO stores (store_key, record, categories, zones, first_seen, last_seen)
+                            VALUES (?, ?, ?, ?, ?, ?)
+                            """,
+                            (
+                                key,
+                                json.dumps(record, ensure_ascii=False),
+                                json.dumps([category] if category is not None else [], ensure_ascii=False),
+                                json.dumps([zone] if zone is not None else [], ensure_ascii=False),
+                                now,
+                                now,
+                            ),
+                        )
+                        new.append(record)
+                        continue
+                    categories, categories_changed = _merge(json.loads(row[0]), category)
+                    zones, zones_changed = _merge(json.loads(row[1]), zone)
+                    if categories_changed or zones_changed:
+                        self._conn.execute(
+                            "UPDATE stores SET categories = ?, zones = ?, last_seen = ? WHERE store_key = ?",
+                            (json.dumps(categories, ensure_ascii=False), json.dumps(zones, ensure_ascii=False), now, key),
+                        )
+                    else:
+                        self._conn.execute("UPDATE stores SET last_seen = ? WHERE store_key = ?", (now, key))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return new
+
+    def iter_stores(self) -> Iterator[StoreRecord]:
+        """Every store in first-seen order."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT store_key, record, categories, zones FROM stores ORDER BY first_seen, rowid"
+            ).fetchall()
+        for key, record, categories, zones in rows:
+            yield StoreRecord(key, json.loads(record), json.loads(categories), json.loads(zones))
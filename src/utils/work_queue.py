@@ -0,0 +1,544 @@
+"""
+Crawl work queue shared by several scraper processes, possibly on different hosts.
+
+Each job is a row keyed by `(kind, key)` with an optional JSON payload. A
+worker claims jobs with a time-limited lease and then completes, fails or
+releases them; every state change checks the lease token, so a worker whose
+lease was reclaimed cannot overwrite the job's newer state. Leases that
+expire (the worker died or hung) are reclaimed at the next claim: the job
+counts a failed attempt and becomes claimable again at once, or is parked
+as dead after `max_attempts`.
+
+`PostgresWorkQueue` claims with `FOR UPDATE SKIP LOCKED`, so concurrent
+workers never wait on each other's rows, and takes every timestamp from the
+database clock. `SqliteWorkQueue` has the same interface for a single
+machine (several processes over one file) and for local testing. Use
+`open_work_queue(url)` to pick one from a `postgresql://...` URL or a
+SQLite path.
+"""
+import abc
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple, Union
+
+STATUS_PENDING = "pending"
+STATUS_LEASED = "leased"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+STATUS_DEAD = "dead"
+
+DEFAULT_LEASE_SECONDS = 300.0
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_RETRY_DELAY = 600.0
+TABLE = "crawl_queue"
+
+_SQLITE_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS {TABLE} (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    payload TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    position INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_eligible REAL NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_token TEXT,
+    lease_expires REAL,
+    last_error TEXT,
+    updated_at REAL,
+    PRIMARY KEY (kind, key)
+);
+CREATE INDEX IF NOT EXISTS {TABLE}_claimable
+    ON {TABLE} (kind, status, next_eligible, position);
+"""
+
+_POSTGRES_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS {TABLE} (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    payload TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    position BIGINT NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_eligible DOUBLE PRECISION NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_token TEXT,
+    lease_expires DOUBLE PRECISION,
+    last_error TEXT,
+    updated_at DOUBLE PRECISION,
+    PRIMARY KEY (kind, key)
+);
+CREATE INDEX IF NOT EXISTS {TABLE}_claimable
+    ON {TABLE} (kind, status, next_eligible, position);
+"""
+
+# Seconds since the epoch on the database server, so hosts with skewed clocks agree.
+_PG_NOW = "EXTRACT(EPOCH FROM clock_timestamp())"
+
+
+@dataclass(frozen=True)
+class Lease:
+    kind: str
+    key: str
+    payload: Any
+    token: str
+    attempts: int
+    expires_at: float
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _dump_payload(payload: Any) -> Optional[str]:
+    return None if payload is None else json.dumps(payload, ensure_ascii=False, sort_keys=True)
+
+
+def _load_payload(payload: Optional[str]) -> Any:
+    return None if payload is None else json.loads(payload)
+
+
+class WorkQueue(abc.ABC):
+    """Interface shared by the SQLite and Postgres queues."""
+
+    def __init__(
+        self,
+        *,
+        lease_seconds: float = DEFAULT_LEASE_SECONDS,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        retry_delay: float = DEFAULT_RETRY_DELAY,
+    ):
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> "WorkQueue":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _retry_in(self, attempts: int) -> float:
+        return self.retry_delay * (2 ** max(0, attempts - 1))
+
+    @abc.abstractmethod
+    def close(self) -> None:
+        """Close the connection."""
+
+    @abc.abstractmethod
+    def enqueue_many(
+        self,
+        kind: str,
+        keys: Iterable[str],
+        payloads: Optional[Mapping[str, Any]] = None,
+        *,
+        requeue_finished: bool = False,
+    ) -> int:
+        """
+        Add jobs, claimed in the order given. Existing jobs are left alone,
+        unless `requeue_finished` puts done and dead ones back to pending (a
+        new crawl round). Returns the number of jobs added or requeued.
+        """
+
+    @abc.abstractmethod
+    def claim(
+        self, kind: str, worker: str, *, limit: int = 1, lease_seconds: Optional[float] = None
+    ) -> List[Lease]:
+        """Lease up to `limit` claimable jobs to `worker`, reclaiming expired leases first."""
+
+    @abc.abstractmethod
+    def renew(self, lease: Lease, seconds: Optional[float] = None) -> bool:
+        """Extend a lease still held. False if it was lost (expired and reclaimed)."""
+
+    @abc.abstractmethod
+    def complete(self, lease: Lease) -> bool:
+        """Mark the job done. False if the lease was lost."""
+
+    @abc.abstractmethod
+    def fail(self, lease: Lease, error: str, *, retry_in: Optional[float] = None) -> bool:
+        """Count a failed attempt; the job is retried after an exponential back-off, or dies."""
+
+    @abc.abstractmethod
+    def release(self, lease: Lease, *, delay: float = 0.0, reason: str = "") -> bool:
+        """Give a job back without counting the attempt (e.g. the worker could not start)."""
+
+    @abc.abstractmethod
+    def reclaim_expired(self, kind: str) -> int:
+        """Take back expired leases, counting a failed attempt each. Returns how many."""
+
+    @abc.abstractmethod
+    def counts(self, kind: str, key_prefix: str = "") -> Dict[str, int]:
+        """Jobs per status, optionally only those whose key starts with `key_prefix`."""
+
+    @abc.abstractmethod
+    def next_due(self, kind: str) -> Optional[float]:
+        """
+        Seconds until some job can be claimed (0 if one can now; leased jobs
+        count at their lease expiry), or None when every job is done or dead.
+        """
+
+
+class SqliteWorkQueue(WorkQueue):
+    """Work queue in a SQLite file (WAL); claims take the write lock with BEGIN IMMEDIATE."""
+
+    def __init__(self, db_path: Union[str, Path], **kwargs: Any):
+        super().__init__(**kwargs)
+        if str(db_path) != ":memory:":
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False, isolation_level=None, timeout=30.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SQLITE_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _transaction(self, statements: List[Tuple[str, Tuple]]) -> int:
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for query, params in statements:
+                    self._conn.execute(query, params)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return self._conn.total_changes - before
+
+    def _fetchall(self, query: str, params: Tuple = ()) -> List[Tuple]:
+        with self._lock:
+            return self._conn.execute(query, params).fetchall()
+
+    def enqueue_many(
+        self,
+        kind: str,
+        keys: Iterable[str],
+        payloads: Optional[Mapping[str, Any]] = None,
+        *,
+        requeue_finished: bool = False,
+    ) -> int:
+        payloads = payloads or {}
+        now = time.time()
+        conflict = (
+            f"""DO UPDATE SET status = '{STATUS_PENDING}', attempts = 0, next_eligible = 0,
+                position = excluded.position, payload = excluded.payload, last_error = NULL,
+                updated_at = excluded.updated_at
+                WHERE {TABLE}.status IN ('{STATUS_DONE}', '{STATUS_DEAD}')"""
+            if requeue_finished else "DO NOTHING"
+        )
+        rows = [(kind, key, _dump_payload(payloads.get(key)), position, now) for position, key in enumerate(keys)]
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    f"""
+                    INSERT INTO {TABLE} (kind, key, payload, position, updated_at)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (kind, key) {conflict}
+                    """,
+                    rows,
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return self._conn.total_changes - before
+
+    def _reclaim_statement(self, kind: str, now: float) -> Tuple[str, Tuple]:
+        return (
+            f"""
+            UPDATE {TABLE} SET
+                status = CASE WHEN attempts >= ? THEN '{STATUS_DEAD}' ELSE '{STATUS_FAILED}' END,
+                lease_owner = NULL, lease_token = NULL, lease_expires = NULL,
+                next_eligible = ?, last_error = 'lease expired', updated_at = ?
+            WHERE kind = ? AND status = '{STATUS_LEASED}' AND lease_expires <= ?
+            """,
+            (self.max_attempts, now, now, kind, now),
+        )
+
+    def reclaim_expired(self, kind: str) -> int:
+        return self._transaction([self._reclaim_statement(kind, time.time())])
+
+    def claim(
+        self, kind: str, worker: str, *, limit: int = 1, lease_seconds: Optional[float] = None
+    ) -> List[Lease]:
+        lease_seconds = self.lease_seconds if lease_seconds is None else lease_seconds
+        token = uuid.uuid4().hex
+        with self._lock:
+            now = time.time()
+            expires = now + lease_seconds
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(*self._reclaim_statement(kind, now))
+                rows = self._conn.execute(
+                    f"""
+                    SELECT key, payload, attempts FROM {TABLE}
+                    WHERE kind = ? AND status IN ('{STATUS_PENDING}', '{STATUS_FAILED}') AND next_eligible <= ?
+                    ORDER BY next_eligible, position
+                    LIMIT ?
+                    """,
+                    (kind, now, limit),
+                ).fetchall()
+                self._conn.executemany(
+                    f"""
+                    UPDATE {TABLE} SET status = '{STATUS_LEASED}', lease_owner = ?, lease_token = ?,
+                        lease_expires = ?, attempts = attempts + 1, updated_at = ?
+                    WHERE kind = ? AND key = ?
+                    """,
+                    [(worker, token, expires, now, kind, key) for key, _payload, _attempts in rows],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [
+            Lease(kind, key, _load_payload(payload), token, attempts + 1, expires)
+            for key, payload, attempts in rows
+        ]
+
+    def _update_lease(self, lease: Lease, assignments: str, params: Tuple) -> bool:
+        changed = self._transaction([(
+            f"""
+            UPDATE {TABLE} SET {assignments}
+            WHERE kind = ? AND key = ? AND status = '{STATUS_LEASED}' AND lease_token = ?
+            """,
+            params + (lease.kind, lease.key, lease.token),
+        )])
+        return changed == 1
+
+    def renew(self, lease: Lease, seconds: Optional[float] = None) -> bool:
+        now = time.time()
+        seconds = self.lease_seconds if seconds is None else seconds
+        return self._update_lease(lease, "lease_expires = ?, updated_at = ?", (now + seconds, now))
+
+    def complete(self, lease: Lease) -> bool:
+        return self._update_lease(
+            lease,
+            f"status = '{STATUS_DONE}', lease_owner = NULL, lease_token = NULL, lease_expires = NULL, "
+            "last_error = NULL, updated_at = ?",
+            (time.time(),),
+        )
+
+    def fail(self, lease: Lease, error: str, *, retry_in: Optional[float] = None) -> bool:
+        now = time.time()
+        status = STATUS_DEAD if lease.attempts >= self.max_attempts else STATUS_FAILED
+        delay = self._retry_in(lease.attempts) if retry_in is None else retry_in
+        return self._update_lease(
+            lease,
+            "status = ?, lease_owner = NULL, lease_token = NULL, lease_expires = NULL, "
+            "next_eligible = ?, last_error = ?, updated_at = ?",
+            (status, now + delay, error, now),
+        )
+
+    def release(self, lease: Lease, *, delay: float = 0.0, reason: str = "") -> bool:
+        now = time.time()
+        return self._update_lease(
+            lease,
+            f"status = '{STATUS_PENDING}', attempts = MAX(attempts - 1, 0), lease_owner = NULL, "
+            "lease_token = NULL, lease_expires = NULL, next_eligible = ?, last_error = ?, updated_at = ?",
+            (now + delay, reason or None, now),
+        )
+
+    def counts(self, kind: str, key_prefix: str = "") -> Dict[str, int]:
+        rows = self._fetchall(
+            f"SELECT status, COUNT(*) FROM {TABLE} WHERE kind = ? AND substr(key, 1, ?) = ? GROUP BY status",
+            (kind, len(key_prefix), key_prefix),
+        )
+        return {status: count for status, count in rows}
+
+    def next_due(self, kind: str) -> Optional[float]:
+        rows = self._fetchall(
+            f"""
+            SELECT MIN(CASE WHEN status = '{STATUS_LEASED}' THEN lease_expires ELSE next_eligible END)
+            FROM {TABLE}
+            WHERE kind = ? AND status NOT IN ('{STATUS_DONE}', '{STATUS_DEAD}')
+            """,
+            (kind,),
+        )
+        due = rows[0][0]
+        return None if due is None else max(0.0, due - time.time())
+
+
+class PostgresWorkQueue(WorkQueue):
+    """Work queue in a Postgres table; claims use FOR UPDATE SKIP LOCKED. Needs psycopg2."""
+
+    def __init__(self, dsn: str, **kwargs: Any):
+        super().__init__(**kwargs)
+        import psycopg2
+
+        self._conn = psycopg2.connect(dsn)
+        with self._conn, self._conn.cursor() as cursor:
+            cursor.execute(_POSTGRES_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _execute(self, query: str, params: Tuple = ()) -> Tuple[int, List[Tuple]]:
+        """Run one statement in its own transaction; returns (rowcount, rows returned)."""
+        with self._lock, self._conn, self._conn.cursor() as cursor:
+            cursor.execute(query, params)
+            rows = cursor.fetchall() if cursor.description is not None else []
+            return cursor.rowcount, rows
+
+    def enqueue_many(
+        self,
+        kind: str,
+        keys: Iterable[str],
+        payloads: Optional[Mapping[str, Any]] = None,
+        *,
+        requeue_finished: bool = False,
+    ) -> int:
+        from psycopg2.extras import execute_values
+
+        payloads = payloads or {}
+        conflict = (
+            f"""DO UPDATE SET status = '{STATUS_PENDING}', attempts = 0, next_eligible = 0,
+                position = EXCLUDED.position, payload = EXCLUDED.payload, last_error = NULL,
+                updated_at = EXCLUDED.updated_at
+                WHERE {TABLE}.status IN ('{STATUS_DONE}', '{STATUS_DEAD}')"""
+            if requeue_finished else "DO NOTHING"
+        )
+        rows = [(kind, key, _dump_payload(payloads.get(key)), position) for position, key in enumerate(keys)]
+        if not rows:
+            return 0
+        with self._lock, self._conn, self._conn.cursor() as cursor:
+            inserted = execute_values(
+                cursor,
+                f"""
+                INSERT INTO {TABLE} (kind, key, payload, position, updated_at)
+                VALUES %s
+                ON CONFLICT (kind, key) {conflict}
+                RETURNING 1
+                """,
+                rows,
+                template=f"(%s, %s, %s, %s, {_PG_NOW})",
+                fetch=True,
+            )
+            return len(inserted)
+
+    def reclaim_expired(self, kind: str) -> int:
+        changed, _rows = self._execute(
+            f"""
+            UPDATE {TABLE} SET
+                status = CASE WHEN attempts >= %s THEN '{STATUS_DEAD}' ELSE '{STATUS_FAILED}' END,
+                lease_owner = NULL, lease_token = NULL, lease_expires = NULL,
+                next_eligible = {_PG_NOW}, last_error = 'lease expired', updated_at = {_PG_NOW}
+            WHERE (kind, key) IN (
+                SELECT kind, key FROM {TABLE}
+                WHERE kind = %s AND status = '{STATUS_LEASED}' AND lease_expires <= {_PG_NOW}
+                FOR UPDATE SKIP LOCKED
+            )
+            """,
+            (self.max_attempts, kind),
+        )
+        return changed
+
+    def claim(
+        self, kind: str, worker: str, *, limit: int = 1, lease_seconds: Optional[float] = None
+    ) -> List[Lease]:
+        lease_seconds = self.lease_seconds if lease_seconds is None else lease_seconds
+        token = uuid.uuid4().hex
+        self.reclaim_expired(kind)
+        _changed, rows = self._execute(
+            f"""
+            WITH picked AS (
+                SELECT kind, key FROM {TABLE}
+                WHERE kind = %s AND status IN ('{STATUS_PENDING}', '{STATUS_FAILED}')
+                    AND next_eligible <= {_PG_NOW}
+                ORDER BY next_eligible, position
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            UPDATE {TABLE} AS queue SET
+                status = '{STATUS_LEASED}', lease_owner = %s, lease_token = %s,
+                lease_expires = {_PG_NOW} + %s, attempts = queue.attempts + 1, updated_at = {_PG_NOW}
+            FROM picked
+            WHERE queue.kind = picked.kind AND queue.key = picked.key
+            RETURNING queue.key, queue.payload, queue.attempts, queue.lease_expires
+            """,
+            (kind, limit, worker, token, lease_seconds),
+        )
+        return [
+            Lease(kind, key, _load_payload(payload), token, attempts, expires)
+            for key, payload, attempts, expires in rows
+        ]
+
+    def _update_lease(self, lease: Lease, assignments: str, params: Tuple) -> bool:
+        changed, _rows = self._execute(
+            f"""
+            UPDATE {TABLE} SET {assignments}, updated_at = {_PG_NOW}
+            WHERE kind = %s AND key = %s AND status = '{STATUS_LEASED}' AND lease_token = %s
+            """,
+            params + (lease.kind, lease.key, lease.token),
+        )
+        return changed == 1
+
+    def renew(self, lease: Lease, seconds: Optional[float] = None) -> bool:
+        seconds = self.lease_seconds if seconds is None else seconds
+        return self._update_lease(lease, f"lease_expires = {_PG_NOW} + %s", (seconds,))
+
+    def complete(self, lease: Lease) -> bool:
+        return self._update_lease(
+            lease,
+            f"status = '{STATUS_DONE}', lease_owner = NULL, lease_token = NULL, lease_expires = NULL, "
+            "last_error = NULL",
+            (),
+        )
+
+    def fail(self, lease: Lease, error: str, *, retry_in: Optional[float] = None) -> bool:
+        status = STATUS_DEAD if lease.attempts >= self.max_attempts else STATUS_FAILED
+        delay = self._retry_in(lease.attempts) if retry_in is None else retry_in
+        return self._update_lease(
+            lease,
+            "status = %s, lease_owner = NULL, lease_token = NULL, lease_expires = NULL, "
+            f"next_eligible = {_PG_NOW} + %s, last_error = %s",
+            (status, delay, error),
+        )
+
+    def release(self, lease: Lease, *, delay: float = 0.0, reason: str = "") -> bool:
+        return self._update_lease(
+            lease,
+            f"status = '{STATUS_PENDING}', attempts = GREATEST(attempts - 1, 0), lease_owner = NULL, "
+            f"lease_token = NULL, lease_expires = NULL, next_eligible = {_PG_NOW} + %s, last_error = %s",
+            (delay, reason or None),
+        )
+
+    def counts(self, kind: str, key_prefix: str = "") -> Dict[str, int]:
+        _changed, rows = self._execute(
+            f"SELECT status, COUNT(*) FROM {TABLE} WHERE kind = %s AND left(key, %s) = %s GROUP BY status",
+            (kind, len(key_prefix), key_prefix),
+        )
+        return {status: count for status, count in rows}
+
+    def next_due(self, kind: str) -> Optional[float]:
+        _changed, rows = self._execute(
+            f"""
+            SELECT MIN(CASE WHEN status = '{STATUS_LEASED}' THEN lease_expires ELSE next_eligible END) - {_PG_NOW}
+            FROM {TABLE}
+            WHERE kind = %s AND status NOT IN ('{STATUS_DONE}', '{STATUS_DEAD}')
+            """,
+            (kind,),
+        )
+        due = rows[0][0]
+        return None if due is None else max(0.0, float(due))
+
+
+def open_work_queue(url: str, **kwargs: Any) -> WorkQueue:
+    """A Postgres queue for `postgres://` / `postgresql://` URLs, else SQLite (`sqlite:///path` or a path)."""
+    if url.startswith(("postgres://", "postgresql://")):
+        return PostgresWorkQueue(url, **kwargs)
+    if url.startswith("sqlite:///"):
+        url = url[len("sqlite:///"):]
+    return SqliteWorkQueue(url, **kwargs)
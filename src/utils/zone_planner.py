@@ -0,0 +1,170 @@
+"""
+Coverage planner for the Uber Eats feed probes in 01_zones.json.
+
+A feed page loaded at a location lists the stores that deliver there, up to
+what one page shows. The planner models a probe as seeing the `capacity`
+nearest known restaurants within `radius_km`, proposes candidate probes from
+an adaptive grid (cells split while they hold more restaurants than one page
+can show), and greedily keeps the candidates that add the most restaurants not
+seen by earlier probes. Each probe is encoded as the base64 `pl=` parameter of
+the feed URL.
+"""
+import base64
+import heapq
+import json
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+
+import numpy as np
+
+from utils.geo_utils import KM_PER_DEGREE, SpatialIndex
+
+FEED_URL = "https://www.ubereats.com/cl-en/feed?diningMode=DELIVERY&pl={pl}"
+DEFAULT_RADIUS_KM = 3.0
+DEFAULT_CAPACITY = 150
+DEFAULT_MIN_CELL_KM = 0.5
+DEFAULT_MIN_NEW = 5
+
+
+@dataclass
+class Probe:
+    latitude: float
+    longitude: float
+    expected_new: int
+    expected_seen: int
+
+    def feed_url(self, address: Optional[str] = None) -> str:
+        # Centroids carry float noise; 7 decimals (~1 cm) is what the feed's own pl values use.
+        return FEED_URL.format(pl=encode_pl(round(self.latitude, 7), round(self.longitude, 7), address=address))
+
+
+def encode_pl(latitude: float, longitude: float, *, address: Optional[str] = None, reference: str = "") -> str:
+    """
+    Encode a location the way the feed's `pl=` parameter does: compact JSON,
+    percent-encoded like JavaScript's encodeURIComponent, then base64.
+    Coordinates are written with Python's shortest float repr, which matches
+    JavaScript's, so a decoded payload re-encodes to the same `pl` (including
+    values such as -70.66478769999999); they are not rounded here.
+    """
+    payload = {
+        "address": address or f"{latitude:.6f}, {longitude:.6f}",
+        "reference": reference,
+        "referenceType": "google_places",
+        "latitude": latitude,
+        "longitude": longitude,
+    }
+    encoded = quote(json.dumps(payload, ensure_ascii=False, separators=(",", ":")), safe="!~*'()")
+    return base64.b64encode(encoded.encode("ascii")).decode("ascii")
+
+
+def decode_pl(pl: str) -> Dict[str, Any]:
+    return json.loads(unquote(base64.b64decode(pl).decode("ascii")))
+
+
+def location_from_url(url_base: str) -> Optional[Tuple[float, float]]:
+    """(latitude, longitude) encoded in a feed URL, or None if it has no `pl=`."""
+    values = parse_qs(urlsplit(url_base).query).get("pl")
+    if not values:
+        return None
+    try:
+        payload = decode_pl(values[0])
+        return float(payload["latitude"]), float(payload["longitude"])
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def _grid_candidates(
+    lat: np.ndarray,
+    lon: np.ndarray,
+    *,
+    cell_km: float,
+    capacity: int,
+    min_cell_km: float,
+) -> List[Tuple[float, float]]:
+    """
+    Centroids of the leaves of an adaptive grid. Cells start `cell_km` wide and
+    split in four while they hold more than `capacity` points.
+    """
+    candidates: List[Tuple[float, float]] = []
+    if not len(lat):
+        return candidates
+    cos_lat = max(float(np.cos(np.radians(lat.mean()))), 1e-6)
+    y = (lat - lat.min()) * KM_PER_DEGREE
+    x = (lon - lon.min()) * KM_PER_DEGREE * cos_lat
+
+    rows = np.floor(y / cell_km).astype(np.int64)
+    cols = np.floor(x / cell_km).astype(np.int64)
+    cells = cols * (int(rows.max()) + 1) + rows
+    order = np.argsort(cells, kind="stable")
+    boundaries = np.flatnonzero(np.diff(cells[order])) + 1
+    stack = [(members, cell_km) for members in np.split(order, boundaries)]
+
+    while stack:
+        members, size = stack.pop()
+        if len(members) > capacity and size / 2 >= min_cell_km:
+            half = size / 2
+            sub_rows = np.floor(y[members] / half).astype(np.int64)
+            sub_cols = np.floor(x[members] / half).astype(np.int64)
+            quadrant = (sub_rows % 2) * 2 + (sub_cols % 2)
+            for value in range(4):
+                selected = members[quadrant == value]
+                if len(selected):
+                    stack.append((selected, half))
+            continue
+        candidates.append((float(lat[members].mean()), float(lon[members].mean())))
+    return candidates
+
+
+def plan_probes(
+    latitudes: Sequence[float],
+    longitudes: Sequence[float],
+    *,
+    radius_km: float = DEFAULT_RADIUS_KM,
+    capacity: int = DEFAULT_CAPACITY,
+    min_cell_km: float = DEFAULT_MIN_CELL_KM,
+    min_new: int = DEFAULT_MIN_NEW,
+    max_probes: Optional[int] = None,
+) -> Tuple[List[Probe], int]:
+    """
+    Choose probe locations that cover the known restaurants with as few page
+    loads as possible. Returns the probes in the order they were picked (most
+    new restaurants first) and the number of restaurants with coordinates.
+    Selection stops when the next probe would add fewer than `min_new`.
+    """
+    index = SpatialIndex(latitudes, longitudes, cell_km=max(radius_km / 2, min_cell_km))
+    total = len(index)
+    lat = np.asarray(latitudes, dtype=np.float64)
+    lon = np.asarray(longitudes, dtype=np.float64)
+    valid = np.isfinite(lat) & np.isfinite(lon)
+
+    candidates = _grid_candidates(
+        lat[valid],
+        lon[valid],
+        cell_km=2 * radius_km,
+        capacity=capacity,
+        min_cell_km=min_cell_km,
+    )
+    seen_by: List[np.ndarray] = []
+    for cand_lat, cand_lon in candidates:
+        positions, distances = index.nearest(cand_lat, cand_lon, k=capacity)
+        seen_by.append(positions[distances <= radius_km])
+
+    # Lazy greedy: gains only shrink as coverage grows, so a stale heap entry
+    # is an upper bound and only the top needs re-evaluating.
+    covered = np.zeros(len(lat), dtype=bool)
+    heap = [(-len(seen), position) for position, seen in enumerate(seen_by)]
+    heapq.heapify(heap)
+    probes: List[Probe] = []
+    while heap and (max_probes is None or len(probes) < max_probes):
+        _, position = heapq.heappop(heap)
+        gain = int(np.count_nonzero(~covered[seen_by[position]]))
+        if gain < min_new:
+            continue
+        if heap and gain < -heap[0][0]:
+            heapq.heappush(heap, (-gain, position))
+            continue
+        covered[seen_by[position]] = True
+        cand_lat, cand_lon = candidates[position]
+        probes.append(Probe(cand_lat, cand_lon, expected_new=gain, expected_seen=len(seen_by[position])))
+    return probes, total
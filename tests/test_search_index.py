@@ -0,0 +1,70 @@
+"""
+Tests for utils.search_index: interrupted updates and search limits.
+
+    python -m pytest tests
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BASE_DIR / "src"))
+
+from utils.search_index import SearchIndex  # noqa: E402
+
+
+def make_documents(count, restaurant="Pizzería Napoli"):
+    return [
+        {"food": f"Pizza Napolitana {number}", "category": "Pizzas", "restaurant": restaurant,
+         "service": "Uber Eats", "zone": "Providencia", "price": str(5000 + number)}
+        for number in range(count)
+    ]
+
+
+def failing_after(documents, count):
+    for number, document in enumerate(documents):
+        if number == count:
+            raise RuntimeError("input row could not be read")
+        yield document
+
+
+def segment_dirs(path):
+    return sorted(entry.name for entry in path.iterdir() if entry.is_dir())
+
+
+def test_interrupted_update_leaves_no_segments_and_next_update_succeeds(tmp_path):
+    with SearchIndex(tmp_path) as index:
+        index.update(make_documents(3, "Antes"))
+        before = segment_dirs(tmp_path)
+
+        # Two segments are written before the input fails.
+        with pytest.raises(RuntimeError):
+            index.update(failing_after(make_documents(5), 4), segment_docs=2)
+        assert segment_dirs(tmp_path) == before
+        assert index.stats()["documents"] == 3
+
+        stats = index.update(make_documents(5))
+        assert stats.added == 5
+        assert index.search("napolitana").total == 8
+
+
+def test_update_skips_segment_names_left_by_a_killed_writer(tmp_path):
+    with SearchIndex(tmp_path) as index:
+        index.update(make_documents(2, "Antes"))
+        # A process killed mid-update cannot clean up; its directory is still on disk.
+        next_name = f"seg-{index._manifest['next_segment']:06d}"
+        (tmp_path / next_name).mkdir()
+
+        stats = index.update(make_documents(3))
+        assert stats.added == 3
+        assert next_name not in {entry["name"] for entry in index._manifest["segments"]}
+        assert index.search("napolitana").total == 5
+
+
+@pytest.mark.parametrize("limit", [0, -1])
+def test_search_rejects_limits_below_one(tmp_path, limit):
+    with SearchIndex(tmp_path) as index:
+        index.update(make_documents(5))
+        with pytest.raises(ValueError):
+            index.search("pizza", limit=limit)
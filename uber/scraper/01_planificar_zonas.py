@@ -0,0 +1,163 @@
+import os
+import sys
+import csv
+import json
+import argparse
+import numpy as np
+
+# ==============================================================================
+# DEFINICIÓN DE RUTAS
+# ==============================================================================
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ZONES_FILE = os.path.join(BASE_DIR, "01_zones.json")
+CATEGORIES_FILE = os.path.join(BASE_DIR, "02_category_uber.json")
+PLANNED_ZONES_FILE = os.path.join(BASE_DIR, "01_zones_planificadas.json")
+RESTAURANTS_CSV = os.path.join(BASE_DIR, '..', '..', 'supabase_update', 'restaurants.csv')
+SRC_DIR = os.path.join(BASE_DIR, '..', '..', 'src')
+
+# Utilidades compartidas (src/utils)
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+from utils.geo_utils import calculate_distance  # noqa: E402
+from utils.zone_planner import (  # noqa: E402
+    DEFAULT_CAPACITY,
+    DEFAULT_MIN_CELL_KM,
+    DEFAULT_MIN_NEW,
+    DEFAULT_RADIUS_KM,
+    location_from_url,
+    plan_probes,
+)
+
+# Solo las filas de Uber Eats: las de Rappi/PedidosYa repiten las mismas coordenadas.
+SERVICIO = "Uber Eats"
+
+# ==============================================================================
+# FUNCIONES
+# ==============================================================================
+
+def cargar_coordenadas(csv_path):
+    """Coordenadas únicas de los restaurantes ya conocidos."""
+    coords = []
+    with open(csv_path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            if row.get('service') != SERVICIO:
+                continue
+            try:
+                coords.append((float(row['latitude']), float(row['longitude'])))
+            except (KeyError, TypeError, ValueError):
+                continue
+    if not coords:
+        return np.empty((0, 2))
+    return np.unique(np.round(np.array(coords), 6), axis=0)
+
+def cargar_comunas(filepath):
+    """(nombre, lat, lon) de cada comuna de 01_zones.json, para nombrar las sondas."""
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            zones = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Advertencia: No se pudo leer {filepath}: {e}")
+        return []
+    comunas = []
+    for zone in zones:
+        location = location_from_url(zone.get('url_base') or '')
+        if location:
+            comunas.append((zone['commune_name'], location[0], location[1]))
+    return comunas
+
+def contar_categorias(filepath):
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            return max(len(json.load(f).get("category_uber", [])), 1)
+    except (OSError, ValueError):
+        return 1
+
+def nombrar_sondas(probes, comunas):
+    """'<comuna más cercana> #n' para cada sonda."""
+    contadores = {}
+    nombres = []
+    for probe in probes:
+        if comunas:
+            distancias = calculate_distance(
+                probe.latitude, probe.longitude,
+                [c[1] for c in comunas], [c[2] for c in comunas],
+            )
+            comuna = comunas[int(np.argmin(distancias))][0]
+        else:
+            comuna = "Sonda"
+        contadores[comuna] = contadores.get(comuna, 0) + 1
+        nombres.append(f"{comuna} #{contadores[comuna]}")
+    return nombres
+
+def construir_zonas(probes, nombres):
+    zonas = []
+    for probe, nombre in zip(probes, nombres):
+        zonas.append({
+            "commune_name": nombre,
+            "typical_street": f"{probe.latitude:.6f}, {probe.longitude:.6f}",
+            "url_base": probe.feed_url(),
+            "scraped": 0,
+            "last scraped": "date",
+            "expected_new": probe.expected_new,
+        })
+    return zonas
+
+# ==============================================================================
+# FUNCIÓN PRINCIPAL
+# ==============================================================================
+
+def main(args):
+    coords = cargar_coordenadas(args.restaurants)
+    if not len(coords):
+        print(f"No hay restaurantes con coordenadas en {args.restaurants}. Abortando.")
+        return
+    print(f"Planificando sobre {len(coords)} restaurantes con coordenadas...")
+
+    probes, total = plan_probes(
+        coords[:, 0], coords[:, 1],
+        radius_km=args.radius_km,
+        capacity=args.capacity,
+        min_cell_km=args.min_cell_km,
+        min_new=args.min_new,
+        max_probes=args.max_probes,
+    )
+    comunas = cargar_comunas(ZONES_FILE)
+    zonas = construir_zonas(probes, nombrar_sondas(probes, comunas))
+
+    cubiertos = sum(probe.expected_new for probe in probes)
+    categorias = contar_categorias(CATEGORIES_FILE)
+    cargas = len(probes) * categorias
+    print(f"Sondas: {len(probes)} (antes {len(comunas)} comunas).")
+    print(f"Cobertura estimada: {cubiertos}/{total} restaurantes ({cubiertos / total:.1%}).")
+    print(f"Cargas de página: {cargas} ({len(probes)} sondas × {categorias} categorías), "
+          f"~{cubiertos / max(cargas, 1):.1f} restaurantes nuevos por carga.")
+    for zona in zonas[:10]:
+        print(f"  {zona['commune_name']:<28} +{zona['expected_new']} nuevos")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(zonas, f, indent=4, ensure_ascii=False)
+    print(f"Zonas guardadas en '{args.output}'. Usar con: 03_extraer_restaurantes.py --zones {args.output}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Planifica puntos de sondeo del feed que cubran los restaurantes conocidos.")
+    parser.add_argument("--restaurants", default=RESTAURANTS_CSV,
+                        help="restaurants.csv con latitud/longitud (salida de la limpieza).")
+    parser.add_argument("--output", default=PLANNED_ZONES_FILE,
+                        help="Archivo de zonas a generar (mismo formato que 01_zones.json).")
+    parser.add_argument("--radius-km", type=float, default=DEFAULT_RADIUS_KM,
+                        help="Radio de entrega que se asume para cada sonda.")
+    parser.add_argument("--capacity", type=int, default=DEFAULT_CAPACITY,
+                        help="Restaurantes que muestra una carga del feed.")
+    parser.add_argument("--min-cell-km", type=float, default=DEFAULT_MIN_CELL_KM,
+                        help="Tamaño mínimo de celda de la grilla adaptativa.")
+    parser.add_argument("--min-new", type=int, default=DEFAULT_MIN_NEW,
+                        help="No agregar sondas que aporten menos restaurantes nuevos que esto.")
+    parser.add_argument("--max-probes", type=int, default=None,
+                        help="Máximo de sondas.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -2,9 +2,19 @@ import os
 import csv
 import json
 import time
+import sys
 import random
+import queue
+import argparse
 import datetime
+import threading
+import shutil
+import tempfile
+import functools
+from collections import deque
+from urllib.parse import urlsplit
 from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
 from webdriver_manager.chrome import ChromeDriverManager
@@ -25,14 +35,111 @@ JSON_FILE_OUTPUT = os.path.join(DATA_DIR, "restaurantes.json")
 CSV_FILE_OUTPUT = os.path.join(DATA_DIR, "restaurantes.csv")
 UBER_BASE_URL = "https.www.ubereats.com"
 SELECTOR_TARJETA_RESTAURANTE = "a[data-testid='store-card']"
+SRC_DIR = os.path.join(BASE_DIR, '..', '..', 'src')
+
+# Utilidades compartidas (src/utils)
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+from utils import metrics  # noqa: E402
+from utils.archive import ResponseArchive  # noqa: E402
+from utils.frontier import STATUS_FAILED as FRONTIER_FAILED, Frontier  # noqa: E402
+from utils.rate_control import BLOCK_STATUS_CODES, DEFAULT_MAX_COOLDOWN, AimdRateController, RetryQueue  # noqa: E402
+from utils.sinks import CsvSink, JsonlSink, SinkGroup  # noqa: E402
+from utils.store_registry import StoreRegistry  # noqa: E402
+from utils.work_queue import STATUS_DONE, default_worker_id, open_work_queue  # noqa: E402
+
+# --- Estado del crawl (compartido con 04_extraer_comida_restaurante.py) ---
+# 'zone': una fila por comuna (veces completada y última vez).
+# 'listing': una fila por zona×categoría, para retomar una zona a medias.
+FRONTIER_DB = os.path.join(DATA_DIR, "frontier.sqlite3")
+ZONE_KIND = "zone"
+LISTING_KIND = "listing"
+
+# --- Restaurantes ya vistos (deduplicación entre categorías y zonas) ---
+# Clave: ruta normalizada del href de la tarjeta. Cada restaurante se escribe
+# una sola vez; las categorías y zonas donde reaparece se acumulan en el registro.
+STORES_DB = os.path.join(DATA_DIR, "stores.sqlite3")
+
+# --- Archivo de páginas (para --replay sin red) ---
+ARCHIVE_DIR = os.path.join(DATA_DIR, "archive")
+ARCHIVE_KIND = "listing"
+REPLAY_OUTPUT_DIR = os.path.join(DATA_DIR, "replay", "listados")
+
+# --- Métricas por etapa (fetch, scroll, parse, write...) ---
+# 03_extraer_restaurantes.prom (textfile de Prometheus) y .jsonl (eventos).
+METRICS_DIR = os.path.join(DATA_DIR, "metrics")
+
+# --- Ritmo adaptativo (AIMD, compartido con 04_extraer_comida_restaurante.py) ---
+# Reemplaza la pausa fija de 5-15 s entre categorías: se parte en ~1 página
+# cada 10 s y cada página sana sube el ritmo hasta PAGES_PER_SECOND_MAX. Un
+# 403/429/503 en el documento lo divide por 2 y pausa el host (Retry-After o
+# 30 s, duplicando con cada bloqueo seguido). Con --workers el ritmo es por
+# host y lo comparten todos los navegadores.
+PAGES_PER_SECOND_INITIAL = 0.1
+PAGES_PER_SECOND_MAX = 0.5
+RATE_INCREASE = 0.01
+# Una categoría bloqueada vuelve a la cola hasta N veces en la misma ejecución;
+# después queda pendiente (la zona no se marca completa) para la próxima.
+MAX_BLOCK_RETRIES = 2
+
+# --- Pool de drivers (--workers) ---
+DEFAULT_WORKERS = 1
+PAGES_PER_DRIVER = 25        # Reciclar el navegador después de N páginas
+MAX_JOB_ATTEMPTS = 2         # Reintentos de un trabajo si el navegador se cae
+
+# --- Cola compartida entre máquinas (--queue) ---
+# Trabajos zona×categoría en una cola con leases: postgresql://... (la base de
+# upload_supabase.py) o un archivo SQLite para probar en local. Si un worker
+# muere, su trabajo se retoma cuando vence el lease. El ritmo adaptativo es
+# por máquina; cada una escribe sus propias salidas.
+# El lease se renueva antes y después de la espera del host y de la página, y
+# dura más que la pausa más larga del controlador más una página lenta.
+QUEUE_URL = os.getenv("CRAWL_QUEUE_URL")
+QUEUE_LEASE_SECONDS = int(DEFAULT_MAX_COOLDOWN) + 600
+QUEUE_MAX_WAIT_SECONDS = 120
+
+# --- Scroll adaptativo ---
+# Se hace scroll hasta que el número de tarjetas deja de crecer durante
+# SCROLL_QUIET_WINDOW segundos (o se alcanza SCROLL_MAX_SECONDS).
+SCROLL_QUIET_WINDOW = 1.5
+SCROLL_POLL_INTERVAL = 0.25
+SCROLL_MAX_SECONDS = 20
+
+# --- Modo liviano (--lean) ---
+# Solo leemos los anchors de las tarjetas y su h3: bloqueamos imágenes,
+# media, fuentes, tiles de mapas y analítica vía DevTools.
+LEAN_BLOCKED_URLS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.avif", "*.svg", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf",
+    "*.mp4", "*.webm", "*.mp3", "*.m3u8",
+    "*maps.googleapis.com*", "*maps.gstatic.com*", "*api.mapbox.com*",
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*",
+    "*facebook.net*", "*connect.facebook.com*", "*hotjar.com*", "*segment.io*",
+    "*bat.bing.com*", "*tiktok.com*", "*recaptcha*",
+]
 
 
 # ==============================================================================
 # FUNCIONES DE CARGA DE DATOS
 # ==============================================================================
 
-def load_and_sort_zones(filepath):
-    """Carga y ordena las zonas por prioridad."""
+def parse_last_scraped(zone):
+    """Timestamp de 'last scraped' en 01_zones.json (0 si no hay fecha)."""
+    last_scraped_date = zone.get('last scraped')
+    if last_scraped_date == 'date' or not last_scraped_date:
+        return 0
+    try:
+        return datetime.datetime.fromisoformat(last_scraped_date).timestamp()
+    except (ValueError, TypeError):
+        return 0
+
+def load_and_sort_zones(filepath, frontier):
+    """
+    Carga las zonas y las ordena por prioridad según el frontier
+    (menos veces scrapeada primero, luego la más antigua).
+    Los contadores de 01_zones.json solo se usan para sembrar el frontier.
+    """
     try:
         with open(filepath, 'r', encoding='utf-8') as f:
             zones = json.load(f)
@@ -40,18 +147,22 @@ def load_and_sort_zones(filepath):
         print(f"Error fatal: No se pudo cargar {filepath}: {e}")
         return []
 
-    def sort_key(zone):
-        last_scraped_date = zone.get('last scraped')
-        if last_scraped_date == 'date' or not last_scraped_date:
-            timestamp = 0 
-        else:
-            try:
-                timestamp = datetime.datetime.fromisoformat(last_scraped_date).timestamp()
-            except (ValueError, TypeError):
-                timestamp = 0
-        return (zone.get('scraped', 0), timestamp)
+    for zone in zones:
+        frontier.seed(
+            ZONE_KIND,
+            zone['commune_name'],
+            successes=zone.get('scraped', 0),
+            last_fetch=parse_last_scraped(zone) or None,
+        )
+
+    prioridad = {}
+    for position, (commune_name, successes, _last_fetch) in enumerate(frontier.by_priority(ZONE_KIND)):
+        prioridad[commune_name] = position
+        for zone in zones:
+            if zone['commune_name'] == commune_name:
+                zone['scraped'] = successes
 
-    zones.sort(key=sort_key)
+    zones.sort(key=lambda zone: prioridad.get(zone['commune_name'], 0))
     print(f"Se cargaron y ordenaron {len(zones)} zonas.")
     return zones
 
@@ -72,61 +183,164 @@ def load_categories(filepath):
 # FUNCIONES DE GUARDADO (Modo Append)
 # ==============================================================================
 
-def guardar_restaurantes_csv(nuevos_restaurantes, csv_filename):
-    os.makedirs(os.path.dirname(csv_filename), exist_ok=True)
-    
-    csv_headers = [
-        'name', 'service', 'latitude', 'longitude', 
-        'address', 'zone', 'service_link', 'image'
+# 'categories'/'zones' solo van en el JSONL
+RESTAURANTES_CSV_HEADERS = [
+    'name', 'service', 'latitude', 'longitude',
+    'address', 'zone', 'service_link', 'image'
+]
+
+def abrir_salidas(jsonl_filename=JSON_FILE_OUTPUT, csv_filename=CSV_FILE_OUTPUT):
+    """
+    Archivos de salida abiertos durante toda la ejecución, con buffer.
+    Las categorías y zonas se marcan en el frontier recién cuando sus
+    restaurantes quedaron en disco (fsync en cada checkpoint).
+    """
+    return SinkGroup({
+        "jsonl": JsonlSink(jsonl_filename),
+        "csv": CsvSink(csv_filename, RESTAURANTES_CSV_HEADERS),
+    })
+
+def listing_key(commune_name, category_name):
+    return f"{commune_name}|{category_name}"
+
+def categorias_pendientes(frontier, commune_name, categories):
+    """
+    Categorías de la zona que no se han completado desde la última vez que se
+    cerró la zona, más las que fallaron y aún tienen intentos ('failed'; las
+    'dead' esperan a la próxima vuelta de la zona).
+    """
+    zone_last = frontier.last_fetch(ZONE_KIND, commune_name) or 0
+    pendientes = []
+    for category_name in categories:
+        key = listing_key(commune_name, category_name)
+        hecha = (frontier.last_fetch(LISTING_KIND, key) or 0) > zone_last
+        if not hecha or frontier.status(LISTING_KIND, key) == FRONTIER_FAILED:
+            pendientes.append(category_name)
+    return pendientes
+
+def registrar_restaurantes(registry, restaurants_found, commune_name, category_name):
+    """
+    Pasa los restaurantes de una página por el registro y devuelve solo los
+    nuevos, con la categoría y zona donde se vieron por primera vez.
+    """
+    nuevos = registry.observe(restaurants_found, category=category_name, zone=commune_name)
+    repetidos = len(restaurants_found) - len(nuevos)
+    metrics.count("restaurants_new", len(nuevos))
+    metrics.count("restaurants_duplicate", repetidos)
+    if repetidos:
+        print(f"  [Dedup] {repetidos} restaurantes ya vistos, {len(nuevos)} nuevos.")
+    return [
+        {**restaurante, "categories": [category_name], "zones": [commune_name]}
+        for restaurante in nuevos
     ]
-    
-    archivo_existe = os.path.isfile(csv_filename)
-    try:
-        with open(csv_filename, 'a', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=csv_headers, restval=None)
-            if not archivo_existe:
-                writer.writeheader()
-            writer.writerows(nuevos_restaurantes)
-        print(f"  [Guardado CSV] Se añadieron {len(nuevos_restaurantes)} nuevos restaurantes a '{csv_filename}'")
-    except Exception as e:
-        print(f"  [Error Guardado CSV]: {e}")
 
-def guardar_restaurantes_jsonl(nuevos_restaurantes, jsonl_filename):
-    os.makedirs(os.path.dirname(jsonl_filename), exist_ok=True)
-    
+def guardar_categoria(frontier, registry, salidas, commune_name, category_name, restaurants_found):
+    """
+    Guarda los restaurantes nuevos de una categoría y la marca como completada
+    en el frontier cuando son durables. Devuelve cuántos eran nuevos.
+    """
+    nuevos = registrar_restaurantes(registry, restaurants_found, commune_name, category_name)
+    if nuevos:
+        with metrics.stage("write"):
+            salidas.write("jsonl", nuevos)
+            salidas.write("csv", nuevos)
+        print(f"  [Guardado] {len(nuevos)} restaurantes nuevos en buffer.")
+    salidas.after_durable(lambda: frontier.mark_done(LISTING_KIND, listing_key(commune_name, category_name)))
+    return len(nuevos)
+
+def migrar_restaurantes_existentes(registry, jsonl_filename):
+    """
+    La primera vez, carga en el registro los restaurantes de un
+    restaurantes.json anterior (que puede tener duplicados).
+    """
+    if len(registry) or not os.path.isfile(jsonl_filename):
+        return
+    leidos = 0
     try:
-        # Abrir en modo 'append'
-        with open(jsonl_filename, 'a', encoding='utf-8') as f:
-            for restaurante in nuevos_restaurantes:
-                # Convertir el dict de Python a un string JSON
-                json_line = json.dumps(restaurante, ensure_ascii=False)
-                # Escribir esa línea en el archivo, seguida de un salto de línea
-                f.write(json_line + '\n')
-                
-        print(f"  [Guardado JSONL] Se añadieron {len(nuevos_restaurantes)} nuevos restaurantes a '{jsonl_filename}'")
-        
+        with open(jsonl_filename, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                restaurante = json.loads(line)
+                leidos += 1
+                categorias = restaurante.pop("categories", None) or [None]
+                zonas = restaurante.pop("zones", None) or [restaurante.get("zone")]
+                for categoria in categorias:
+                    for zona in zonas:
+                        registry.observe([restaurante], category=categoria, zone=zona)
+        print(f"Se migraron {leidos} filas de '{jsonl_filename}' al registro ({len(registry)} restaurantes únicos).")
     except Exception as e:
-        print(f"  [Error Guardado JSONL]: {e}")
+        print(f"Error al migrar {jsonl_filename}: {e}. Se continúa con el registro actual.")
 
-def save_updated_zones(zones_data, filepath):
-    """Guarda la lista de zonas con los contadores actualizados."""
+def reemplazar_archivo(filename, escribir):
+    """Escribe `filename` en un temporal y lo reemplaza de forma atómica."""
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=os.path.dirname(filename), suffix=".tmp")
     try:
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(zones_data, f, indent=2, ensure_ascii=False)
-        print(f"  [Guardado Zonas] Se actualizó el contador en {filepath}")
-    except Exception as e:
-        print(f"  [ERROR] No se pudo guardar el archivo de zonas actualizado: {e}")
+        with os.fdopen(fd, 'w', newline='', encoding='utf-8') as f:
+            escribir(f)
+        os.replace(tmp_name, filename)
+    except BaseException:
+        if os.path.exists(tmp_name):
+            os.unlink(tmp_name)
+        raise
+
+def exportar_restaurantes(registry, jsonl_filename=JSON_FILE_OUTPUT, csv_filename=CSV_FILE_OUTPUT):
+    """
+    Reescribe restaurantes.json/.csv desde el registro: una fila por
+    restaurante, con todas las categorías y zonas donde apareció.
+    """
+    registros = [store.merged() for store in registry.iter_stores()]
+
+    def escribir_jsonl(f):
+        for restaurante in registros:
+            f.write(json.dumps(restaurante, ensure_ascii=False) + '\n')
+
+    def escribir_csv(f):
+        writer = csv.DictWriter(f, fieldnames=RESTAURANTES_CSV_HEADERS, restval=None, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(registros)
+
+    reemplazar_archivo(jsonl_filename, escribir_jsonl)
+    reemplazar_archivo(csv_filename, escribir_csv)
+    print(f"[Export] {len(registros)} restaurantes únicos en '{jsonl_filename}' y '{csv_filename}'.")
 
 # ==============================================================================
 # FUNCIÓN PARA CREAR EL DRIVER
 # ==============================================================================
 
-def create_driver():
-    """Configura e inicia una nueva instancia del driver de Chrome."""
-    print("Iniciando nueva sesión de driver...")
+@functools.lru_cache(maxsize=1)
+def resolve_driver_path():
+    """
+    Resuelve el binario de chromedriver una sola vez por proceso.
+    Se puede fijar con la variable de entorno CHROMEDRIVER_PATH para evitar
+    también la consulta de red de ChromeDriverManager.
+    """
+    env_path = os.getenv("CHROMEDRIVER_PATH")
+    if env_path:
+        return env_path
+    return ChromeDriverManager().install()
+
+def create_driver(headless=False, lean=False):
+    """
+    Configura e inicia una nueva instancia del driver de Chrome.
+    Con lean=True el navegador corre headless, con estrategia de carga 'eager'
+    y bloquea recursos que no usamos. El log de performance queda siempre
+    activo: de ahí salen el tráfico por página y el status del documento.
+    """
+    print(f"Iniciando nueva sesión de driver{' (liviano)' if lean else ''}...")
     USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/118.0.0.0 Safari/537.36"
     chrome_options = Options()
-    # chrome_options.add_argument("--headless")
+    if lean:
+        headless = True
+        chrome_options.page_load_strategy = 'eager'
+        chrome_options.add_experimental_option(
+            "prefs", {"profile.managed_default_content_settings.images": 2}
+        )
+    chrome_options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+    if headless:
+        chrome_options.add_argument("--headless=new")
     chrome_options.add_argument("--no-sandbox")
     chrome_options.add_argument("--disable-dev-shm-usage")
     chrome_options.add_argument("--window-size=1920,1080")
@@ -134,83 +348,325 @@ def create_driver():
     chrome_options.add_argument('--disable-blink-features=AutomationControlled')
     
     try:
-        driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=chrome_options)
+        driver = webdriver.Chrome(service=Service(resolve_driver_path()), options=chrome_options)
+        if lean:
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": LEAN_BLOCKED_URLS})
         return driver
     except Exception as e:
         print(f"Error fatal al iniciar el driver: {e}")
         return None
 
+def medir_trafico(driver):
+    """
+    Lee (y vacía) el log de performance del driver y resume el tráfico desde
+    la última lectura: requests, bytes transferidos, requests bloqueadas y el
+    status y cabeceras del primer documento recibido (None si no hubo).
+    Devuelve None si el driver no registra tráfico.
+    """
+    try:
+        entries = driver.get_log("performance")
+    except Exception:
+        return None
+
+    requests_sent = 0
+    bytes_received = 0
+    blocked = 0
+    document_status = None
+    document_headers = {}
+    for entry in entries:
+        try:
+            message = json.loads(entry["message"])["message"]
+        except (KeyError, ValueError):
+            continue
+        method = message.get("method")
+        params = message.get("params", {})
+        if method == "Network.requestWillBeSent":
+            requests_sent += 1
+        elif method == "Network.loadingFinished":
+            bytes_received += params.get("encodedDataLength", 0)
+        elif method == "Network.loadingFailed" and params.get("blockedReason"):
+            blocked += 1
+        elif method == "Network.responseReceived" and params.get("type") == "Document" and document_status is None:
+            response = params.get("response", {})
+            document_status = response.get("status")
+            document_headers = response.get("headers", {})
+    return {
+        "requests": requests_sent, "bytes": int(bytes_received), "blocked": blocked,
+        "status": int(document_status) if document_status is not None else None, "headers": document_headers,
+    }
+
+def sumar_trafico(*mediciones):
+    """Suma varias lecturas de medir_trafico() (ignorando las None)."""
+    mediciones = [m for m in mediciones if m is not None]
+    if not mediciones:
+        return None
+    return {key: sum(m[key] for m in mediciones) for key in ("requests", "bytes", "blocked")}
+
+def driver_vivo(driver):
+    """Indica si el navegador sigue respondiendo."""
+    try:
+        driver.current_url
+        return True
+    except WebDriverException:
+        return False
+
+def cerrar_driver(driver):
+    try:
+        driver.quit()
+    except Exception as e:
+        print(f"  [Advertencia] No se pudo cerrar el driver: {e}")
+
 # ==============================================================================
 # FUNCIÓN DE SCRAPING
 # ==============================================================================
 
-def scrape_restaurants_from_url(driver, category_url, category_name, commune_name):
+class BloqueoError(Exception):
+    """El documento de la categoría vino con 403/429/503; `pausa` es lo que el controlador pausó el host."""
+
+    def __init__(self, status, pausa):
+        super().__init__(f"Bloqueado por el servidor ({status})")
+        self.status = status
+        self.pausa = pausa
+
+class LeasePerdido(Exception):
+    """El lease del trabajo venció mientras se esperaba al host; ahora es de otro worker."""
+
+def crear_controlador():
+    return AimdRateController(
+        initial_rate=PAGES_PER_SECOND_INITIAL,
+        max_rate=PAGES_PER_SECOND_MAX,
+        increase=RATE_INCREASE,
+    )
+
+def contar_tarjetas(driver):
+    return driver.execute_script(
+        "return document.querySelectorAll(arguments[0]).length;", SELECTOR_TARJETA_RESTAURANTE
+    )
+
+def scroll_hasta_estable(driver, quiet_window=SCROLL_QUIET_WINDOW,
+                         poll_interval=SCROLL_POLL_INTERVAL, max_seconds=SCROLL_MAX_SECONDS):
+    """
+    Hace scroll hasta el final mientras aparezcan tarjetas nuevas.
+    Termina apenas el conteo no crece durante `quiet_window` segundos.
+    Devuelve (tarjetas, scrolls, segundos).
+    """
+    started = time.time()
+    count = contar_tarjetas(driver)
+    last_growth = started
+    scrolls = 0
+    while True:
+        driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+        scrolls += 1
+        time.sleep(poll_interval)
+
+        now = time.time()
+        new_count = contar_tarjetas(driver)
+        if new_count > count:
+            count = new_count
+            last_growth = now
+        elif now - last_growth >= quiet_window:
+            break
+        if now - started >= max_seconds:
+            print(f"  [Advertencia] Scroll cortado tras {max_seconds}s con {count} tarjetas.")
+            break
+    return count, scrolls, time.time() - started
+
+def extraer_restaurantes_de_html(html, commune_name):
+    """Extrae los restaurantes de las tarjetas de una página de categoría."""
+    results = []
+    soup = BeautifulSoup(html, "html.parser")
+    restaurant_cards = soup.find_all("a", {"data-testid": "store-card"})
+    print(f"  Se encontraron {len(restaurant_cards)} restaurantes.")
+    metrics.count("cards", len(restaurant_cards))
+
+    for card in restaurant_cards:
+        h3_tag = card.find("h3")
+        href = card.get("href")
+
+        if href and h3_tag:
+            restaurant_url = UBER_BASE_URL + href
+            restaurant_name = h3_tag.text.strip()
+            
+            results.append({
+                "name": restaurant_name,
+                "service": "Uber Eats",
+                "latitude": None,
+                "longitude": None,
+                "address": None,
+                "zone": commune_name,
+                "service_link": restaurant_url,
+                "image": None
+            })
+    return results
+
+def scrape_restaurants_from_url(driver, category_url, category_name, commune_name, archive=None, controlador=None,
+                                renovar=None):
     """
     Navega a una URL de categoría y extrae los restaurantes.
-    Reutiliza el mismo driver.
+    Reutiliza el mismo driver. Si se entrega `archive`, la página
+    renderizada se guarda comprimida para poder reprocesarla sin red.
+    Con `controlador` espera el turno del host antes de navegar y le informa
+    el status del documento; un bloqueo lanza BloqueoError. Cualquier otro
+    error se propaga para que la categoría quede como fallida, no como hecha.
+    `renovar` (modo cola) extiende el lease antes y después de la espera y al
+    terminar la página; si devuelve False tras la espera se lanza LeasePerdido.
     """
     results = []
+    host = urlsplit(category_url).netloc
+    if renovar is not None:
+        renovar()
+    if controlador is not None:
+        with metrics.stage("pause"):
+            controlador.wait(host)
+    if renovar is not None and not renovar():
+        raise LeasePerdido(category_url)
     try:
         print(f"  Navegando a categoría: {category_name}...")
-        driver.get(category_url)
-        
-        WebDriverWait(driver, 15).until(
-            EC.visibility_of_element_located((By.CSS_SELECTOR, SELECTOR_TARJETA_RESTAURANTE))
-        )
+        medir_trafico(driver)  # Descartar el tráfico de la página anterior
+        started = time.time()
+        with metrics.stage("fetch"):
+            driver.get(category_url)
+            documento = medir_trafico(driver)
+            status = documento["status"] if documento is not None else None
+            if controlador is not None and status is not None:
+                pausa = controlador.record(host, status, documento["headers"])
+                if status in BLOCK_STATUS_CODES:
+                    raise BloqueoError(status, pausa)
+            WebDriverWait(driver, 15).until(
+                EC.visibility_of_element_located((By.CSS_SELECTOR, SELECTOR_TARJETA_RESTAURANTE))
+            )
         print("  Contenido cargado.")
         
-        scroll_height = driver.execute_script("return document.body.scrollHeight")
-        driver.execute_script(f"window.scrollTo(0, {scroll_height / 3});")
-        time.sleep(random.uniform(0.6, 1.4))
-        driver.execute_script(f"window.scrollTo(0, {scroll_height / 1.5});")
-        time.sleep(random.uniform(1.5, 3.5))
+        with metrics.stage("scroll"):
+            cards_loaded, scrolls, scroll_seconds = scroll_hasta_estable(driver)
+        print(
+            f"  [Carga] {cards_loaded} tarjetas tras {scrolls} scrolls "
+            f"(scroll {scroll_seconds:.1f}s, página {time.time() - started:.1f}s)"
+        )
 
         html = driver.page_source
-        soup = BeautifulSoup(html, "html.parser")
-        restaurant_cards = soup.find_all("a", {"data-testid": "store-card"})
-        print(f"  Se encontraron {len(restaurant_cards)} restaurantes.")
+        if archive is not None:
+            with metrics.stage("archive"):
+                archive.put(
+                    ARCHIVE_KIND, category_url, html,
+                    meta={"commune_name": commune_name, "category_name": category_name},
+                )
 
-        for card in restaurant_cards:
-            h3_tag = card.find("h3")
-            href = card.get("href")
+        trafico = sumar_trafico(documento, medir_trafico(driver))
+        if trafico is not None:
+            print(
+                f"  [Red] {trafico['requests']} requests, {trafico['bytes'] / 1024:.0f} KB, "
+                f"{trafico['blocked']} bloqueadas"
+            )
+            metrics.count("network_requests", trafico['requests'])
+            metrics.count("network_bytes", trafico['bytes'])
+            metrics.count("network_requests_blocked", trafico['blocked'])
 
-            if href and h3_tag:
-                restaurant_url = UBER_BASE_URL + href
-                restaurant_name = h3_tag.text.strip()
-                
-                results.append({
-                    "name": restaurant_name,
-                    "service": "Uber Eats",
-                    "latitude": None,
-                    "longitude": None,
-                    "address": None,
-                    "zone": commune_name,
-                    "service_link": restaurant_url,
-                    "image": None
-                })
+        with metrics.stage("parse"):
+            results = extraer_restaurantes_de_html(html, commune_name)
+        metrics.count("pages")
+        metrics.event(
+            "page", zone=commune_name, category=category_name, cards=cards_loaded,
+            restaurants=len(results), seconds=round(time.time() - started, 3),
+        )
+        if controlador is not None and status is None:
+            controlador.on_success(host)  # Sin log de performance: la página cargó
+        if renovar is not None:
+            renovar()
         
+    except BloqueoError as e:
+        print(f"  [BLOQUEO DETECTADO] {e.status} en {category_name}; host en pausa {e.pausa:.0f}s.")
+        metrics.count("blocks", code=e.status)
+        metrics.event("block", zone=commune_name, category=category_name, status=e.status)
+        raise
     except Exception as e:
         print(f"  [ERROR] Falló el scraping para {category_name}: {e}")
-        with open("checkpoint_error.html", "w", encoding="utf-8") as f:
-            f.write(driver.page_source)
+        metrics.count("page_errors")
+        metrics.event("page_error", zone=commune_name, category=category_name, error=str(e))
+        try:
+            page_source = driver.page_source
+        except WebDriverException:
+            page_source = None  # El driver se cayó: no hay página que guardar
+        if page_source is not None:
+            with open("checkpoint_error.html", "w", encoding="utf-8") as f:
+                f.write(page_source)
             print("  Se guardó 'checkpoint_error.html' para depuración.")
-            
+        raise
+
     return results
 
+# ==============================================================================
+# REPROCESAMIENTO SIN RED (--replay)
+# ==============================================================================
+
+def rango_del_dia(fecha):
+    """(desde, hasta) en timestamps locales para una fecha 'YYYY-MM-DD' (o (None, None))."""
+    if not fecha:
+        return None, None
+    inicio = datetime.datetime.fromisoformat(fecha)
+    fin = inicio + datetime.timedelta(days=1)
+    return inicio.timestamp(), fin.timestamp()
+
+def replay_listados(fecha=None, output_dir=REPLAY_OUTPUT_DIR):
+    """
+    Re-extrae los restaurantes de las páginas de categoría archivadas
+    (la versión más reciente de cada URL, opcionalmente solo de un día),
+    sin navegador ni frontier. La salida va a `output_dir`.
+    """
+    print(f"--- Reprocesando listados archivados{f' del {fecha}' if fecha else ''} ---")
+    since, until = rango_del_dia(fecha)
+
+    # La salida del replay se regenera completa en cada ejecución
+    shutil.rmtree(output_dir, ignore_errors=True)
+    json_filename = os.path.join(output_dir, "restaurantes.json")
+    csv_filename = os.path.join(output_dir, "restaurantes.csv")
+
+    paginas = 0
+    total = 0
+    started = time.time()
+    # Registro en memoria: el replay deduplica igual que el scraper, sin tocar data/stores.sqlite3
+    with ResponseArchive(ARCHIVE_DIR) as archive, StoreRegistry(":memory:") as registry:
+        for response in archive.iter_latest(ARCHIVE_KIND, since=since, until=until):
+            paginas += 1
+            commune_name = response.meta.get("commune_name")
+            category_name = response.meta.get("category_name")
+            with metrics.stage("parse"):
+                restaurantes = extraer_restaurantes_de_html(response.text(), commune_name)
+            total += len(registrar_restaurantes(registry, restaurantes, commune_name, category_name))
+        exportar_restaurantes(registry, json_filename, csv_filename)
+
+    print(f"\n--- Replay terminado: {paginas} páginas, {total} restaurantes únicos en {time.time() - started:.1f}s -> '{output_dir}' ---")
+
 # ==============================================================================
 # FUNCIÓN PRINCIPAL (El Controlador)
 # ==============================================================================
 
-def main():
+def main(lean=False, zones_file=ZONES_FILE):
     print("--- Iniciando Proceso de Scraping de Restaurantes ---")
     
-    zones_to_scrape = load_and_sort_zones(ZONES_FILE)
+    with Frontier(FRONTIER_DB) as frontier, ResponseArchive(ARCHIVE_DIR) as archive, \
+            StoreRegistry(STORES_DB) as registry:
+        migrar_restaurantes_existentes(registry, JSON_FILE_OUTPUT)
+        try:
+            # Las salidas se cierran (checkpoint final) antes de reescribirlas en el export
+            with abrir_salidas() as salidas:
+                scrape_zones(frontier, archive, registry, salidas, lean=lean, zones_file=zones_file)
+        finally:
+            exportar_restaurantes(registry)
+
+    print("\n--- Proceso de Scraping Terminado ---")
+
+def scrape_zones(frontier, archive, registry, salidas, lean=False, zones_file=ZONES_FILE):
+    """Recorre las zonas una a una con un driver por zona."""
+    zones_to_scrape = load_and_sort_zones(zones_file, frontier)
     categories_to_scrape = load_categories(CATEGORIES_FILE)
     
     if not zones_to_scrape or not categories_to_scrape:
         print("Faltan Zonas o Categorías. Abortando.")
         return
     
+    controlador = crear_controlador()
     for zone_data in zones_to_scrape:
         commune_name = zone_data['commune_name']
         url_base = zone_data['url_base']
@@ -222,35 +678,57 @@ def main():
         # --- [FIN DEL CAMBIO] ---
             
         print(f"\n--- Procesando Zona: {commune_name} (Contador: {zone_data.get('scraped', 0)}) ---")
+
+        # Retomar la zona si una ejecución anterior quedó a medias
+        pendientes = categorias_pendientes(frontier, commune_name, categories_to_scrape)
+        if len(pendientes) < len(categories_to_scrape):
+            print(f"  Retomando zona: faltan {len(pendientes)} de {len(categories_to_scrape)} categorías.")
         
         driver = None
-        restaurants_scraped_this_zone = []
+        restaurants_scraped_this_zone = 0
+        zona_completa = True
             
         try:
-            driver = create_driver()
+            driver = create_driver(lean=lean)
             if not driver:
                 print(f"No se pudo iniciar el driver para {commune_name}. Saltando zona.")
                 continue 
             
-            for category_name in categories_to_scrape:
+            cola = deque(pendientes)
+            reintentos = RetryQueue(MAX_BLOCK_RETRIES)
+            while True:
+                category_name = siguiente_categoria(cola, reintentos)
+                if category_name is None:
+                    break
                 scrape_url = f"{url_base}&scq={category_name}"
                 
-                restaurants_found = scrape_restaurants_from_url(
-                    driver, scrape_url, category_name, commune_name
-                )
-                
-                if restaurants_found:
-                    restaurants_scraped_this_zone.extend(restaurants_found)
+                try:
+                    restaurants_found = scrape_restaurants_from_url(
+                        driver, scrape_url, category_name, commune_name, archive, controlador
+                    )
+                except BloqueoError as e:
+                    if not reintentos.push(category_name, e.pausa):
+                        print(f"  Sin reintentos para {category_name}; queda pendiente para la próxima ejecución.")
+                        zona_completa = False
+                    continue
+                except Exception as e:
+                    # Queda 'failed' en el frontier y se reintenta en la próxima ejecución
+                    frontier.mark_failed(LISTING_KIND, listing_key(commune_name, category_name), str(e))
+                    zona_completa = False
+                    if not driver_vivo(driver):
+                        print(f"  Driver caído en {commune_name}; el resto de la zona queda para la próxima ejecución.")
+                        break
+                    continue
                 
-                time.sleep(random.uniform(5, 15))
+                # Guardado incremental por categoría
+                restaurants_scraped_this_zone += guardar_categoria(
+                    frontier, registry, salidas, commune_name, category_name, restaurants_found
+                )
 
+            if zona_completa:
+                salidas.after_durable(lambda zona=commune_name: frontier.mark_done(ZONE_KIND, zona))
             if restaurants_scraped_this_zone:
-                print(f"  Guardando {len(restaurants_scraped_this_zone)} restaurantes de {commune_name}...")
-                guardar_restaurantes_jsonl(restaurants_scraped_this_zone, JSON_FILE_OUTPUT)
-                guardar_restaurantes_csv(restaurants_scraped_this_zone, CSV_FILE_OUTPUT)
-                
-                zone_data['scraped'] = zone_data.get('scraped', 0) + 1
-                zone_data['last scraped'] = datetime.datetime.now().isoformat()
+                print(f"  Se guardaron {restaurants_scraped_this_zone} restaurantes de {commune_name}.")
             else:
                 print(f"  No se encontraron nuevos restaurantes en {commune_name}.")
 
@@ -262,13 +740,471 @@ def main():
                 print("Cerrando driver de la zona...")
                 driver.quit()
 
-            save_updated_zones(zones_to_scrape, ZONES_FILE)
-
             print("  Pausa larga entre comunas...")
-            time.sleep(random.uniform(30, 60))
+            with metrics.stage("zone_pause"):
+                time.sleep(random.uniform(30, 60))
+
+    metrics.event("rate_control", hosts=controlador.snapshot())
+
+def siguiente_categoria(cola, reintentos):
+    """
+    Próxima categoría de la zona: primero los reintentos que ya cumplieron su
+    pausa, después la cola. Si solo quedan reintentos, espera al primero.
+    Devuelve None cuando no queda nada.
+    """
+    category_name = reintentos.pop_ready()
+    if category_name is not None:
+        return category_name
+    if cola:
+        return cola.popleft()
+    espera = reintentos.next_delay()
+    if espera is None:
+        return None
+    print(f"  Quedan {len(reintentos)} categorías bloqueadas por reintentar; esperando {espera:.0f}s...")
+    with metrics.stage("block_pause"):
+        time.sleep(espera)
+    return reintentos.pop_ready()
+
+
+# ==============================================================================
+# POOL DE DRIVERS (Modo Paralelo)
+# ==============================================================================
+
+class EstadoZonas:
+    """
+    Guarda el resultado de cada trabajo zona×categoría y cierra la zona en el
+    frontier cuando terminan todas sus categorías. Compartido entre los workers,
+    junto con el controlador de ritmo y la cola de categorías bloqueadas.
+    """
+
+    def __init__(self, frontier, registry, salidas, pendientes_por_zona, zonas):
+        self.frontier = frontier
+        self.registry = registry
+        self.salidas = salidas
+        self.lock = threading.Lock()
+        self.pendientes = dict(pendientes_por_zona)
+        self.zonas = {zone_data['commune_name']: zone_data for zone_data in zonas}
+        self.incompletas = set()
+        self.controlador = crear_controlador()
+        self.reintentos = RetryQueue(MAX_BLOCK_RETRIES)
+        self.en_curso = 0
+
+    def siguiente_trabajo(self, jobs):
+        """
+        Próximo trabajo (zona, categoría, intento): primero los reintentos que
+        ya cumplieron su pausa, después la cola. Mientras queden reintentos o
+        trabajos en curso (que pueden bloquearse) espera; None cuando no queda nada.
+        """
+        while True:
+            with self.lock:
+                clave = self.reintentos.pop_ready()
+                if clave is not None:
+                    self.en_curso += 1
+                    commune_name, category_name = clave
+                    return self.zonas[commune_name], category_name, 0
+                try:
+                    trabajo = jobs.get_nowait()
+                except queue.Empty:
+                    trabajo = None
+                if trabajo is not None:
+                    self.en_curso += 1
+                    return trabajo
+                espera = self.reintentos.next_delay()
+                if espera is None and self.en_curso == 0:
+                    return None
+            time.sleep(1.0 if espera is None else min(espera, 1.0))
+
+    def terminar(self):
+        """Libera el trabajo tomado con siguiente_trabajo() (ya registrado, reencolado o descartado)."""
+        with self.lock:
+            self.en_curso -= 1
+
+    def registrar(self, zone_data, category_name, restaurants_found):
+        commune_name = zone_data['commune_name']
+        with self.lock:
+            guardar_categoria(self.frontier, self.registry, self.salidas, commune_name, category_name, restaurants_found)
+            self._cerrar_categoria(commune_name)
+
+    def fallido(self, zone_data, category_name, error):
+        """Deja la categoría 'failed' en el frontier (se reintenta en la próxima ejecución) y la zona incompleta."""
+        commune_name = zone_data['commune_name']
+        with self.lock:
+            self.frontier.mark_failed(LISTING_KIND, listing_key(commune_name, category_name), error)
+            print(f"  {commune_name}/{category_name} falló; queda pendiente para la próxima ejecución.")
+            self.incompletas.add(commune_name)
+            self._cerrar_categoria(commune_name)
+
+    def bloqueado(self, zone_data, category_name, pausa):
+        """Reencola una categoría bloqueada; sin reintentos, la zona queda incompleta."""
+        commune_name = zone_data['commune_name']
+        with self.lock:
+            if self.reintentos.push((commune_name, category_name), pausa):
+                return
+            print(f"  Sin reintentos para {commune_name}/{category_name}; queda pendiente para la próxima ejecución.")
+            self.incompletas.add(commune_name)
+            self._cerrar_categoria(commune_name)
+
+    def _cerrar_categoria(self, commune_name):
+        self.pendientes[commune_name] -= 1
+        if self.pendientes[commune_name] > 0:
+            return
+        if commune_name in self.incompletas:
+            print(f"  Zona terminada con categorías bloqueadas: {commune_name}")
+            return
+        self.salidas.after_durable(lambda: self.frontier.mark_done(ZONE_KIND, commune_name))
+        print(f"  Zona completada: {commune_name}")
+
+def worker_de_zonas(worker_id, jobs, estado, archive, pages_per_driver, headless, lean=False):
+    """
+    Un navegador de larga vida que consume trabajos (zona, categoría, intento).
+    Se recicla después de `pages_per_driver` páginas o si se cae.
+    """
+    driver = None
+    pages = 0
+    try:
+        while True:
+            trabajo = estado.siguiente_trabajo(jobs)
+            if trabajo is None:
+                return
+            zone_data, category_name, attempt = trabajo
+            try:
+                if driver is not None and pages >= pages_per_driver:
+                    print(f"[Worker {worker_id}] Reciclando driver tras {pages} páginas...")
+                    cerrar_driver(driver)
+                    driver = None
+                if driver is None:
+                    driver = create_driver(headless=headless, lean=lean)
+                    pages = 0
+                    if not driver:
+                        print(f"[Worker {worker_id}] No se pudo iniciar el driver. Terminando worker.")
+                        jobs.put((zone_data, category_name, attempt))
+                        return
+
+                commune_name = zone_data['commune_name']
+                scrape_url = f"{zone_data['url_base']}&scq={category_name}"
+                error = None
+                try:
+                    restaurants_found = scrape_restaurants_from_url(
+                        driver, scrape_url, category_name, commune_name, archive, estado.controlador
+                    )
+                except BloqueoError as e:
+                    pages += 1
+                    estado.bloqueado(zone_data, category_name, e.pausa)
+                    continue
+                except Exception as e:
+                    print(f"[Worker {worker_id}] Falló {commune_name}/{category_name}: {e}")
+                    error = str(e)
+                pages += 1
+
+                if not driver_vivo(driver):
+                    print(f"[Worker {worker_id}] Driver caído. Se reinicia en el siguiente trabajo.")
+                    cerrar_driver(driver)
+                    driver = None
+                    error = error or "driver caído"
+                if error is not None:
+                    if attempt + 1 < MAX_JOB_ATTEMPTS:
+                        jobs.put((zone_data, category_name, attempt + 1))
+                    else:
+                        estado.fallido(zone_data, category_name, error)
+                    continue
+
+                estado.registrar(zone_data, category_name, restaurants_found)
+            finally:
+                estado.terminar()
+    finally:
+        if driver:
+            print(f"[Worker {worker_id}] Cerrando driver...")
+            cerrar_driver(driver)
+
+def main_pool(workers, pages_per_driver=PAGES_PER_DRIVER, headless=True, lean=False, zones_file=ZONES_FILE):
+    """
+    Recorre todos los trabajos zona×categoría con `workers` navegadores
+    en paralelo. Cada zona se guarda en cuanto terminan sus categorías.
+    """
+    print(f"--- Iniciando Proceso de Scraping de Restaurantes (Pool de {workers} drivers) ---")
+
+    with Frontier(FRONTIER_DB) as frontier, ResponseArchive(ARCHIVE_DIR) as archive, \
+            StoreRegistry(STORES_DB) as registry:
+        migrar_restaurantes_existentes(registry, JSON_FILE_OUTPUT)
+        try:
+            with abrir_salidas() as salidas:
+                scrape_zones_pool(frontier, archive, registry, salidas, workers, pages_per_driver, headless, lean, zones_file)
+        finally:
+            exportar_restaurantes(registry)
 
     print("\n--- Proceso de Scraping Terminado ---")
 
+def scrape_zones_pool(frontier, archive, registry, salidas, workers, pages_per_driver, headless, lean, zones_file=ZONES_FILE):
+    zones_to_scrape = load_and_sort_zones(zones_file, frontier)
+    categories_to_scrape = load_categories(CATEGORIES_FILE)
+
+    if not zones_to_scrape or not categories_to_scrape:
+        print("Faltan Zonas o Categorías. Abortando.")
+        return
+
+    jobs = queue.Queue()
+    pendientes_por_zona = {}
+    zonas_encoladas = []
+    for zone_data in zones_to_scrape:
+        url_base = zone_data['url_base']
+        if not url_base or url_base.strip() == "":
+            print(f"--- Saltando Zona: {zone_data['commune_name']} (URL base está vacía) ---")
+            continue
+        pendientes = categorias_pendientes(frontier, zone_data['commune_name'], categories_to_scrape)
+        if not pendientes:
+            frontier.mark_done(ZONE_KIND, zone_data['commune_name'])
+            continue
+        pendientes_por_zona[zone_data['commune_name']] = len(pendientes)
+        zonas_encoladas.append(zone_data)
+        for category_name in pendientes:
+            jobs.put((zone_data, category_name, 0))
+    print(f"Se encolaron {jobs.qsize()} trabajos ({len(pendientes_por_zona)} zonas × hasta {len(categories_to_scrape)} categorías).")
+
+    # Resolver chromedriver una vez antes de lanzar los hilos
+    resolve_driver_path()
+
+    estado = EstadoZonas(frontier, registry, salidas, pendientes_por_zona, zonas_encoladas)
+    threads = [
+        threading.Thread(
+            target=worker_de_zonas,
+            args=(worker_id, jobs, estado, archive, pages_per_driver, headless, lean),
+            name=f"driver-worker-{worker_id}",
+        )
+        for worker_id in range(1, workers + 1)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    metrics.event("rate_control", hosts=estado.controlador.snapshot())
+
+# ==============================================================================
+# COLA COMPARTIDA ENTRE MÁQUINAS (--queue)
+# ==============================================================================
+
+def main_cola(queue_url, seed=False, workers=1, pages_per_driver=PAGES_PER_DRIVER, headless=True, lean=False,
+              zones_file=ZONES_FILE, worker_id=None):
+    """
+    Toma trabajos zona×categoría de una cola compartida con `workers`
+    navegadores, para sumar máquinas a un mismo recorrido. Con `seed`
+    primero encola una vuelta nueva con las zonas y categorías locales.
+    """
+    worker_id = worker_id or default_worker_id()
+    print(f"--- Iniciando Proceso de Scraping de Restaurantes (Cola compartida, {workers} drivers, worker {worker_id}) ---")
+
+    with open_work_queue(queue_url, lease_seconds=QUEUE_LEASE_SECONDS) as cola, Frontier(FRONTIER_DB) as frontier, \
+            ResponseArchive(ARCHIVE_DIR) as archive, StoreRegistry(STORES_DB) as registry:
+        migrar_restaurantes_existentes(registry, JSON_FILE_OUTPUT)
+        if seed:
+            sembrar_cola(cola, frontier, zones_file)
+        try:
+            with abrir_salidas() as salidas:
+                estado = EstadoCola(cola, frontier, registry, salidas)
+                threads = [
+                    threading.Thread(
+                        target=worker_de_cola,
+                        args=(f"{worker_id}/{n}", estado, archive, pages_per_driver, headless, lean),
+                        name=f"queue-worker-{n}",
+                    )
+                    for n in range(1, workers + 1)
+                ]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                metrics.event("rate_control", hosts=estado.controlador.snapshot())
+        finally:
+            exportar_restaurantes(registry)
+        print(f"Estado de la cola: {cola.counts(LISTING_KIND)}")
+
+    print("\n--- Proceso de Scraping Terminado ---")
+
+def sembrar_cola(cola, frontier, zones_file=ZONES_FILE):
+    """
+    Encola una vuelta nueva: cada zona×categoría pendiente según el frontier
+    local, en el orden de prioridad de las zonas. Los trabajos terminados en
+    la cola vuelven a quedar pendientes; los que están en curso no se tocan.
+    """
+    zones_to_scrape = load_and_sort_zones(zones_file, frontier)
+    categories_to_scrape = load_categories(CATEGORIES_FILE)
+    keys = []
+    payloads = {}
+    for zone_data in zones_to_scrape:
+        commune_name = zone_data['commune_name']
+        if not zone_data['url_base'] or zone_data['url_base'].strip() == "":
+            continue
+        for category_name in categorias_pendientes(frontier, commune_name, categories_to_scrape):
+            key = listing_key(commune_name, category_name)
+            keys.append(key)
+            payloads[key] = {
+                "commune_name": commune_name, "url_base": zone_data['url_base'], "category_name": category_name,
+            }
+    added = cola.enqueue_many(LISTING_KIND, keys, payloads, requeue_finished=True)
+    print(f"Se encolaron {added} de {len(keys)} trabajos. Estado de la cola: {cola.counts(LISTING_KIND)}")
+
+class EstadoCola:
+    """Cola, frontier, registro y salidas compartidos por los workers de una máquina."""
+
+    def __init__(self, cola, frontier, registry, salidas):
+        self.cola = cola
+        self.frontier = frontier
+        self.registry = registry
+        self.salidas = salidas
+        self.lock = threading.Lock()
+        self.controlador = crear_controlador()
+        self.por_completar = {}  # key -> lease guardado que espera el próximo checkpoint
+
+    def renovar(self, lease):
+        """
+        Extiende el lease del trabajo en curso y los de los trabajos que
+        esperan el checkpoint para completarse. Devuelve si el primero sigue
+        siendo nuestro.
+        """
+        with self.lock:
+            pendientes = list(self.por_completar.values())
+        for pendiente in pendientes:
+            self.cola.renew(pendiente)
+        return self.cola.renew(lease)
+
+    def registrar(self, lease, restaurants_found):
+        """Guarda la categoría; cuando es durable la completa en la cola (y la zona, si era la última)."""
+        commune_name = lease.payload['commune_name']
+        category_name = lease.payload['category_name']
+        with self.lock:
+            guardar_categoria(self.frontier, self.registry, self.salidas, commune_name, category_name, restaurants_found)
+            self.por_completar[lease.key] = lease
+            self.salidas.after_durable(lambda: self._completar(lease, commune_name))
+
+    def fallido(self, lease, error):
+        """Devuelve el trabajo a la cola (cuenta como intento) y lo deja 'failed' en el frontier local."""
+        self.cola.fail(lease, error, retry_in=0)
+        self.frontier.mark_failed(LISTING_KIND, lease.key, error)
+
+    def _completar(self, lease, commune_name):
+        self.por_completar.pop(lease.key, None)
+        if not self.cola.complete(lease):
+            print(f"  [Cola] El lease de {lease.key} había vencido; otro worker lo retomó.")
+            metrics.count("leases_lost")
+            metrics.event("lease_lost", key=lease.key, stage="complete")
+            return
+        # La zona se cierra con todas sus categorías hechas (una 'dead' la deja para la próxima vuelta)
+        if set(self.cola.counts(LISTING_KIND, listing_key(commune_name, ""))) == {STATUS_DONE}:
+            self.frontier.mark_done(ZONE_KIND, commune_name)
+            print(f"  Zona completada: {commune_name}")
+
+def worker_de_cola(worker_id, estado, archive, pages_per_driver, headless, lean=False):
+    """
+    Un navegador de larga vida que toma trabajos de la cola compartida hasta
+    que no queda nada que tomar en QUEUE_MAX_WAIT_SECONDS. Se recicla como en
+    worker_de_zonas().
+    """
+    cola = estado.cola
+    driver = None
+    pages = 0
+    try:
+        while True:
+            leases = cola.claim(LISTING_KIND, worker_id, lease_seconds=QUEUE_LEASE_SECONDS)
+            if not leases:
+                espera = cola.next_due(LISTING_KIND)
+                if espera is None or espera > QUEUE_MAX_WAIT_SECONDS:
+                    return
+                with metrics.stage("queue_wait"):
+                    time.sleep(max(espera, 1.0))
+                continue
+            lease = leases[0]
+
+            if driver is not None and pages >= pages_per_driver:
+                print(f"[Worker {worker_id}] Reciclando driver tras {pages} páginas...")
+                cerrar_driver(driver)
+                driver = None
+            if driver is None:
+                driver = create_driver(headless=headless, lean=lean)
+                pages = 0
+                if not driver:
+                    print(f"[Worker {worker_id}] No se pudo iniciar el driver. Terminando worker.")
+                    cola.release(lease)
+                    return
+
+            commune_name = lease.payload['commune_name']
+            category_name = lease.payload['category_name']
+            scrape_url = f"{lease.payload['url_base']}&scq={category_name}"
+            try:
+                restaurants_found = scrape_restaurants_from_url(
+                    driver, scrape_url, category_name, commune_name, archive, estado.controlador,
+                    renovar=lambda: estado.renovar(lease),
+                )
+            except LeasePerdido:
+                # Otro worker ya lo tomó: no se pide la página ni se toca el trabajo
+                print(f"[Worker {worker_id}] El lease de {lease.key} venció esperando al host; se omite.")
+                metrics.count("leases_lost")
+                metrics.event("lease_lost", key=lease.key, stage="wait")
+                continue
+            except BloqueoError as e:
+                pages += 1
+                # Cuenta como intento: una categoría que siempre se bloquea termina como 'dead'
+                cola.fail(lease, f"bloqueado {e.status}", retry_in=e.pausa)
+                continue
+            except Exception as e:
+                print(f"[Worker {worker_id}] Falló {commune_name}/{category_name}: {e}")
+                error = str(e)
+            else:
+                error = None
+            pages += 1
+
+            if not driver_vivo(driver):
+                print(f"[Worker {worker_id}] Driver caído. Se reinicia en el siguiente trabajo.")
+                cerrar_driver(driver)
+                driver = None
+                error = error or "driver caído"
+            if error is not None:
+                estado.fallido(lease, error)
+                continue
+
+            estado.registrar(lease, restaurants_found)
+    finally:
+        if driver:
+            print(f"[Worker {worker_id}] Cerrando driver...")
+            cerrar_driver(driver)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Scraping de listados de restaurantes de Uber Eats.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="Navegadores en paralelo. Con 1 se usa el recorrido serial por zona (con --queue, navegadores por máquina).")
+    parser.add_argument("--pages-per-driver", type=int, default=PAGES_PER_DRIVER,
+                        help="Páginas antes de reciclar cada navegador (solo con --workers > 1).")
+    parser.add_argument("--show-browser", action="store_true",
+                        help="No usar headless en el modo pool ni con --queue.")
+    parser.add_argument("--lean", action="store_true",
+                        help="Modo liviano: headless, carga 'eager', sin imágenes/fuentes/analítica y con conteo de tráfico.")
+    parser.add_argument("--zones", default=ZONES_FILE,
+                        help="Archivo de zonas (p. ej. el generado por 01_planificar_zonas.py).")
+    parser.add_argument("--queue", default=QUEUE_URL,
+                        help="Cola compartida (postgresql://... o archivo SQLite) de donde tomar los trabajos "
+                             "zona×categoría; por defecto $CRAWL_QUEUE_URL. Usa --workers navegadores.")
+    parser.add_argument("--seed-queue", action="store_true",
+                        help="Con --queue, encolar antes una vuelta nueva con las zonas y categorías locales.")
+    parser.add_argument("--worker-id", default=None,
+                        help="Nombre del worker en la cola (por defecto host:pid).")
+    parser.add_argument("--replay", action="store_true",
+                        help="Reprocesar las páginas archivadas sin navegador (salida en data/replay/listados/).")
+    parser.add_argument("--replay-date", default=None,
+                        help="Con --replay, usar solo lo descargado ese día (YYYY-MM-DD).")
+    return parser.parse_args()
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    args = parse_args()
+    metrics.configure("03_extraer_restaurantes", METRICS_DIR)
+    try:
+        if args.replay:
+            replay_listados(args.replay_date)
+        elif args.queue:
+            main_cola(args.queue, args.seed_queue, args.workers, args.pages_per_driver, headless=not args.show_browser,
+                      lean=args.lean, zones_file=args.zones, worker_id=args.worker_id)
+        elif args.workers > 1:
+            main_pool(args.workers, args.pages_per_driver, headless=not args.show_browser, lean=args.lean,
+                      zones_file=args.zones)
+        else:
+            main(lean=args.lean, zones_file=args.zones)
+    finally:
+        print(metrics.summary())
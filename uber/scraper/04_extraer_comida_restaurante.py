@@ -3,9 +3,15 @@ import csv
 import json
 import time
 import random
+import shutil
+import datetime
 import sys
+import hashlib
+import asyncio
+import argparse
 import requests
-from bs4 import BeautifulSoup
+from collections import deque
+from urllib.parse import urlsplit
 
 # ==============================================================================
 # DEFINICIÓN DE RUTAS
@@ -13,16 +19,48 @@ from bs4 import BeautifulSoup
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.join(BASE_DIR, '..', 'data')
+SRC_DIR = os.path.join(BASE_DIR, '..', '..', 'src')
+
+# Utilidades compartidas (src/utils)
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+from utils import metrics  # noqa: E402
+from utils.archive import ResponseArchive  # noqa: E402
+from utils.async_fetch import fetch_all  # noqa: E402
+from utils.frontier import Frontier  # noqa: E402
+from utils.html_utils import parse_html  # noqa: E402
+from utils.rate_control import DEFAULT_MAX_COOLDOWN, AimdRateController, RetryQueue  # noqa: E402
+from utils.work_queue import default_worker_id, open_work_queue  # noqa: E402
+from utils.sinks import CsvSink, JsonlSink, SinkGroup  # noqa: E402
 
 # --- Archivo de Entrada (Tu nuevo archivo de links) ---
 # Asume un CSV con una columna llamada 'service_link'
 RESTAURANTES_LINKS_CSV = os.path.join(DATA_DIR, "service_links.csv")
 
-# --- Archivos de Salida (en modo 'append') ---
+# --- Archivos de Salida (en modo 'append', con buffer; ver abrir_salidas) ---
 # (Usamos .jsonl para un guardado 'append' eficiente)
 PRODUCTOS_JSONL_OUTPUT = os.path.join(DATA_DIR, "productos_completo.jsonl") 
 PRODUCTOS_CSV_OUTPUT = os.path.join(DATA_DIR, "productos.csv")
-LINKS_CACHE_FILE = os.path.join(DATA_DIR, "scraped_menu_links.txt") # Cache de links scrapeados
+LINKS_CACHE_FILE = os.path.join(DATA_DIR, "scraped_menu_links.txt") # Cache antiguo (solo para migrar)
+
+# --- Salida columnar opcional (--parquet, requiere pyarrow) ---
+# Datasets particionados por crawl_date/zone: 'productos' (una fila por ítem)
+# y 'menus' (una fila por restaurante, con geo y dirección).
+PARQUET_DIR = os.path.join(DATA_DIR, "parquet")
+
+# --- Estado del crawl (compartido con 03_extraer_restaurantes.py) ---
+FRONTIER_DB = os.path.join(DATA_DIR, "frontier.sqlite3")
+FRONTIER_KIND = "menu"
+
+# --- Archivo de respuestas HTTP (para --replay sin red) ---
+ARCHIVE_DIR = os.path.join(DATA_DIR, "archive")
+ARCHIVE_KIND = "menu"
+REPLAY_OUTPUT_DIR = os.path.join(DATA_DIR, "replay", "menus")
+
+# --- Métricas por etapa (fetch, parse, flatten, write...) ---
+# 04_extraer_comida_restaurante.prom (textfile de Prometheus) y .jsonl (eventos).
+METRICS_DIR = os.path.join(DATA_DIR, "metrics")
 
 # ==============================================================================
 # ESTRATEGIA "HUMANA"
@@ -36,69 +74,216 @@ USER_AGENTS = [
     "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Safari/605.1.15"
 ]
 
+# --- Ritmo adaptativo (AIMD, compartido con 03_extraer_restaurantes.py) ---
+# Se parte en ~1 request cada 3.3 s (la pausa fija anterior era de 2.5-4 s).
+# Cada respuesta sana sube el ritmo en RATE_INCREASE req/s hasta el máximo
+# (--host-rps); un 403/429/503 lo divide por 2 y pausa el host lo que diga
+# Retry-After (o 30 s, duplicando con cada bloqueo seguido).
+INITIAL_REQUESTS_PER_SECOND = 0.3
+HOST_REQUESTS_PER_SECOND = 1.0
+RATE_INCREASE = 0.02
+# Un link bloqueado vuelve a la cola hasta N veces en la misma ejecución;
+# después se difiere en el frontier BLOCK_PAUSE_SECONDS.
+MAX_BLOCK_RETRIES = 3
+BLOCK_PAUSE_SECONDS = 300
+
+# --- Modo concurrente (--async) ---
+# Requests en vuelo a la vez (el ritmo por host lo pone el controlador AIMD).
+ASYNC_CONCURRENCY = 8
+
+# --- Cola compartida entre máquinas (--queue) ---
+# postgresql://... (la base de upload_supabase.py) o un archivo SQLite para
+# probar en local. Cada worker toma un link a la vez con un lease de
+# QUEUE_LEASE_SECONDS; si muere, otro worker lo retoma cuando vence el lease.
+# El lease se renueva antes y después de la espera del host y de la descarga,
+# y dura más que la pausa más larga del controlador más el checkpoint.
+# Un worker termina cuando no queda nada que tomar en QUEUE_MAX_WAIT_SECONDS.
+QUEUE_URL = os.getenv("CRAWL_QUEUE_URL")
+QUEUE_LEASE_SECONDS = int(DEFAULT_MAX_COOLDOWN) + 300
+QUEUE_MAX_WAIT_SECONDS = 120
+
+# --- Modo refresco (--refresh) ---
+# Vuelve a pedir menús ya scrapeados hace más de N horas con cabeceras
+# condicionales; solo se reescriben los que cambiaron.
+REFRESH_AGE_HOURS = 20
+
+def crear_controlador(host_rps=HOST_REQUESTS_PER_SECOND):
+    return AimdRateController(
+        initial_rate=min(INITIAL_REQUESTS_PER_SECOND, host_rps),
+        max_rate=host_rps,
+        increase=RATE_INCREASE,
+    )
+
+def host_de(link):
+    return urlsplit(url_completa(link)).netloc
+
+def construir_headers():
+    """Cabeceras rotativas para simular un navegador real."""
+    return {
+        'User-Agent': random.choice(USER_AGENTS),
+        'Accept-Language': 'es-CL,es;q=0.9',
+        'Referer': 'https.www.ubereats.com/' # Simular que venimos de la home
+    }
+
 # ==============================================================================
 # FUNCIÓN DE SCRAPING DE MENÚ
 # ==============================================================================
 
-def scrape_menu_restaurante(restaurant_url, headers):
+def url_completa(restaurant_url):
+    """Convierte un link relativo de Uber Eats en una URL absoluta."""
+    if restaurant_url.startswith("/"):
+        return "https://www.ubereats.com" + restaurant_url
+    return restaurant_url
+
+def extraer_json_ld(html, full_url):
     """
-    Scrapea un restaurante usando requests y devuelve el JSON-LD completo.
+    Extrae el bloque JSON-LD de la página de un restaurante.
+    Devuelve None si no existe. Lanza json.JSONDecodeError si es inválido.
     """
-    if restaurant_url.startswith("/"):
-        full_url = "https://www.ubereats.com" + restaurant_url
-    else:
-        full_url = restaurant_url
+    # Escaneo rápido del <script> sin construir el árbol completo
+    # (parse_html cae a BeautifulSoup si la página está mal formada)
+    script_text = parse_html(html)
+
+    if not script_text:
+        print(f"  [Advertencia] No se encontró JSON-LD en {full_url}", file=sys.stderr)
+        return None
+
+    data = json.loads(script_text)
+    data['restaurant_url'] = full_url
+    return data
+
+class BloqueoError(ConnectionRefusedError):
+    """
+    El servidor respondió 403/429/503; guarda el status y las cabeceras
+    (Retry-After). procesar_link() agrega el host y la pausa que aplicó.
+    """
+
+    def __init__(self, status, headers=None):
+        super().__init__(f"Bloqueado por el servidor ({status})")
+        self.status = status
+        self.headers = headers or {}
+        self.host = None
+        self.pausa = None
+
+class LeasePerdido(Exception):
+    """El lease del link venció mientras se esperaba al host; ahora es de otro worker."""
+
+def descargar_menu(restaurant_url, headers, archive=None):
+    """
+    Descarga la página de un restaurante y extrae su JSON-LD.
+    Devuelve (status, data, response_headers); data es None si no hubo menú
+    (incluido un 304 Not Modified). Si se entrega `archive`, la página se
+    guarda comprimida antes de extraer nada.
+    """
+    full_url = url_completa(restaurant_url)
     
     try:
-        response = requests.get(full_url, headers=headers, timeout=10)
+        with metrics.stage("fetch"):
+            response = requests.get(full_url, headers=headers, timeout=10)
+        metrics.count("http_status", code=response.status_code)
+        if response.status_code == 304:
+            return 304, None, response.headers
         response.raise_for_status() 
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        script_tag = soup.find('script', type='application/ld+json')
-        
-        if not script_tag:
-            print(f"  [Advertencia] No se encontró JSON-LD en {full_url}", file=sys.stderr)
-            return None
-
-        data = json.loads(script_tag.string)
-        data['restaurant_url'] = full_url 
-        return data
+        if archive is not None:
+            with metrics.stage("archive"):
+                archive.put(ARCHIVE_KIND, full_url, response.text, status=response.status_code)
+        with metrics.stage("parse"):
+            restaurant_data = extraer_json_ld(response.text, full_url)
+        return response.status_code, restaurant_data, response.headers
 
     except requests.exceptions.HTTPError as e:
         # Detectar si nos bloquearon
         if e.response.status_code in [403, 429, 503]:
             print(f"  [ERROR BLOQUEO] {e.response.status_code} en {full_url}. El servidor nos está bloqueando.")
+            metrics.count("blocks", code=e.response.status_code)
+            metrics.event("block", url=full_url, status=e.response.status_code)
             # Lanzar un error especial para que el 'main' lo atrape
-            raise ConnectionRefusedError("Bloqueado por el servidor") 
+            raise BloqueoError(e.response.status_code, e.response.headers)
         print(f"  [Error HTTP] {e} al scrapear {full_url}", file=sys.stderr)
-        return None
+        return e.response.status_code, None, {}
     except requests.exceptions.RequestException as e:
         print(f"  [Error] {e} al scrapear {full_url}", file=sys.stderr)
-        return None
+        metrics.count("fetch_errors", error=type(e).__name__)
+        return None, None, {}
     except json.JSONDecodeError:
         print(f"  [Error] No se pudo decodificar el JSON de {full_url}", file=sys.stderr)
-        return None
+        metrics.count("parse_errors")
+        return response.status_code, None, {}
+
+def scrape_menu_restaurante(restaurant_url, headers):
+    """
+    Scrapea un restaurante usando requests y devuelve el JSON-LD completo.
+    """
+    _status, data, _response_headers = descargar_menu(restaurant_url, headers)
+    return data
 
 # ==============================================================================
-# FUNCIONES DE GUARDADO (Modo Append)
+# RE-CRAWL CONDICIONAL
 # ==============================================================================
 
-def guardar_datos_csv(nuevos_datos_restaurantes, csv_filename):
+def headers_condicionales(frontier, link):
+    """If-None-Match / If-Modified-Since a partir de lo guardado en el frontier."""
+    validadores = frontier.validators(FRONTIER_KIND, link)
+    headers = {}
+    if validadores["etag"]:
+        headers['If-None-Match'] = validadores["etag"]
+    if validadores["last_modified"]:
+        headers['If-Modified-Since'] = validadores["last_modified"]
+    return headers
+
+def validadores_de_respuesta(response_headers):
+    lower = {key.lower(): value for key, value in (response_headers or {}).items()}
+    return lower.get('etag'), lower.get('last-modified')
+
+def hash_menu(restaurant_data):
+    """Hash estable del JSON-LD (independiente del orden de las llaves)."""
+    canonical = json.dumps(restaurant_data, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+def registrar_menu(link, status, restaurant_data, response_headers, frontier, salidas):
     """
-    Toma el JSON-LD de UN restaurante, lo aplana en productos,
-    y los AÑADE al archivo CSV.
+    Decide qué hacer con una respuesta exitosa: si el servidor respondió 304 o
+    el hash del JSON-LD no cambió, solo se actualiza el frontier; si no, se
+    guarda el menú y el link se marca como hecho cuando el menú es durable.
+    Devuelve True si se escribió algo.
     """
-    os.makedirs(os.path.dirname(csv_filename), exist_ok=True)
-    
-    # Columnas del CSV (para Supabase)
-    csv_headers = [
-        'name', 'description', 'price', 'store_name', 
-        'category_name', 'category_uber', 'restaurante_url'
-    ]
+    etag, last_modified = validadores_de_respuesta(response_headers)
+    if status == 304:
+        print("  [Sin cambios] 304 Not Modified.")
+        metrics.count("menus_unchanged", reason="304")
+        frontier.mark_done(FRONTIER_KIND, link, etag=etag, last_modified=last_modified)
+        return False
+
+    content_hash = hash_menu(restaurant_data)
+    if content_hash == frontier.validators(FRONTIER_KIND, link)["content_hash"]:
+        print("  [Sin cambios] El JSON-LD es idéntico al último guardado.")
+        metrics.count("menus_unchanged", reason="hash")
+        frontier.mark_done(FRONTIER_KIND, link, etag=etag, last_modified=last_modified)
+        return False
+
+    guardar_menu(restaurant_data, salidas)
+    salidas.after_durable(lambda: frontier.mark_done(
+        FRONTIER_KIND, link, etag=etag, last_modified=last_modified, content_hash=content_hash
+    ))
+    return True
+
+# ==============================================================================
+# FUNCIONES DE GUARDADO (Modo Append)
+# ==============================================================================
 
+# Columnas del CSV (para Supabase)
+PRODUCTOS_CSV_HEADERS = [
+    'name', 'description', 'price', 'store_name',
+    'category_name', 'category_uber', 'restaurante_url'
+]
+
+def aplanar_productos(nuevos_datos_restaurantes):
+    """
+    Toma JSON-LDs de restaurantes y los aplana en filas de productos
+    (una por ítem de menú) con las columnas de PRODUCTOS_CSV_HEADERS.
+    """
     productos_para_csv = []
     
-    # 'nuevos_datos_restaurantes' es una lista con UN solo JSON-LD
     for data in nuevos_datos_restaurantes: 
         if not data: continue
             
@@ -121,42 +306,50 @@ def guardar_datos_csv(nuevos_datos_restaurantes, csv_filename):
                             'restaurante_url': restaurante_url
                         }
                         productos_para_csv.append(fila_producto)
-    
-    if not productos_para_csv:
-        print("  No se encontraron productos en este JSON-LD.")
-        return
-
-    archivo_existe = os.path.isfile(csv_filename)
-    try:
-        with open(csv_filename, 'a', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=csv_headers, restval=None)
-            if not archivo_existe:
-                writer.writeheader()
-            writer.writerows(productos_para_csv)
-        print(f"  [Guardado CSV] Se añadieron {len(productos_para_csv)} nuevos productos a '{csv_filename}'")
-    except Exception as e:
-        print(f"  [Error Guardado CSV]: {e}", file=sys.stderr)
+    return productos_para_csv
 
-def guardar_datos_jsonl(nuevos_datos_restaurantes, jsonl_filename):
+def abrir_salidas(jsonl_filename=None, csv_filename=None, parquet_dir=None):
     """
-    Toma la lista de NUEVOS JSONs de restaurantes y los AÑADE
-    como nuevas líneas al archivo .jsonl (JSON Lines).
+    Abre (una sola vez por ejecución) los archivos de salida con buffer.
+    Los links se marcan como scrapeados en el frontier recién cuando sus
+    datos quedaron en disco (fsync en cada checkpoint). Con `parquet_dir`
+    se escriben además los datasets Parquet de productos y menús.
     """
-    os.makedirs(os.path.dirname(jsonl_filename), exist_ok=True)
-    try:
-        # 'a' (append) es la clave de la eficiencia
-        with open(jsonl_filename, 'a', encoding='utf-8') as f:
-            for restaurante_data in nuevos_datos_restaurantes:
-                if restaurante_data:
-                    # Convertir el dict a un string JSON y escribirlo
-                    json_line = json.dumps(restaurante_data, ensure_ascii=False)
-                    f.write(json_line + '\n')
-        print(f"  [Guardado JSONL] Se añadió {len(nuevos_datos_restaurantes)} menú a '{jsonl_filename}'")
-    except Exception as e:
-        print(f"  [Error Guardado JSONL]: {e}", file=sys.stderr)
+    sinks = {
+        "jsonl": JsonlSink(jsonl_filename or PRODUCTOS_JSONL_OUTPUT),
+        "csv": CsvSink(csv_filename or PRODUCTOS_CSV_OUTPUT, PRODUCTOS_CSV_HEADERS),
+    }
+    if parquet_dir:
+        from utils.columnar import MENU_SCHEMA, PRODUCT_SCHEMA, ParquetSink
+        sinks["productos_parquet"] = ParquetSink(os.path.join(parquet_dir, "productos"), PRODUCT_SCHEMA)
+        sinks["menus_parquet"] = ParquetSink(os.path.join(parquet_dir, "menus"), MENU_SCHEMA)
+    return SinkGroup(sinks)
+
+def fila_menu(restaurant_data, crawl_date):
+    """Fila de 'menus' (Parquet): lo que la limpieza necesita además de los productos."""
+    geo = restaurant_data.get('geo') or {}
+    address = restaurant_data.get('address') or {}
+
+    def a_float(value):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return None
+
+    return {
+        'store_name': restaurant_data.get('name'),
+        'restaurante_url': restaurant_data.get('restaurant_url'),
+        'latitude': a_float(geo.get('latitude')),
+        'longitude': a_float(geo.get('longitude')),
+        'street_address': address.get('streetAddress'),
+        'locality': address.get('addressLocality'),
+        'region': address.get('addressRegion'),
+        'crawl_date': crawl_date,
+        'zone': address.get('addressLocality') or address.get('addressRegion'),
+    }
 
 # ==============================================================================
-# FUNCIONES DE CARGA Y CACHE
+# FUNCIONES DE CARGA Y FRONTIER
 # ==============================================================================
 
 def load_restaurant_links(filepath):
@@ -178,91 +371,464 @@ def load_restaurant_links(filepath):
         print(f"Error al leer {filepath}: {e}. Asegúrate que tenga la columna 'service_link'.")
         return []
 
-def load_scraped_links_cache(filepath):
-    """Carga los links de menús que ya scrapeamos para no repetirlos."""
-    os.makedirs(os.path.dirname(filepath), exist_ok=True)
-    if not os.path.isfile(filepath):
-        return set()
+def migrar_cache_de_links(frontier, filepath):
+    """
+    Importa el cache antiguo (scraped_menu_links.txt) al frontier la primera vez.
+    Los links marcados con '_FAILED' quedan como fallidos para reintentarse.
+    """
+    if not frontier.is_empty(FRONTIER_KIND) or not os.path.isfile(filepath):
+        return
+    done = 0
+    failed = 0
     try:
         with open(filepath, 'r', encoding='utf-8') as f:
-            links = set(line.strip() for line in f if line.strip())
-        print(f"Se cargaron {len(links)} links de menús ya scrapeados desde el cache.")
-        return links
+            for line in f:
+                link = line.strip()
+                if not link:
+                    continue
+                if link.endswith("_FAILED"):
+                    frontier.mark_failed(FRONTIER_KIND, link[:-len("_FAILED")], "migrado desde el cache", retry_in=0)
+                    failed += 1
+                else:
+                    frontier.mark_done(FRONTIER_KIND, link)
+                    done += 1
+        print(f"Se migraron {done} links scrapeados y {failed} fallidos desde '{filepath}' al frontier.")
     except Exception as e:
-        print(f"Error al cargar cache de links: {e}. Empezando con cache vacío.")
-        return set()
-
-def save_link_to_cache(link, filepath):
-    """Añade un link al archivo cache en modo 'append'."""
-    try:
-        with open(filepath, 'a', encoding='utf-8') as f:
-            f.write(link + '\n')
-    except Exception as e:
-        print(f"  [Error Cache] No se pudo guardar {link} en el cache: {e}")
+        print(f"Error al migrar cache de links: {e}. Se continúa con el frontier actual.")
 
 # ==============================================================================
 # FUNCIÓN PRINCIPAL (El Orquestador)
 # ==============================================================================
 
-def main():
+def cargar_links_pendientes(frontier, refresh_age_hours=None):
+    """
+    Registra los links de entrada en el frontier y devuelve, barajados,
+    los que están pendientes o listos para reintentar. En modo refresco
+    incluye también los ya scrapeados hace más de `refresh_age_hours` horas.
+    """
+    migrar_cache_de_links(frontier, LINKS_CACHE_FILE)
+
+    # 1. Cargar datos (los links ya conocidos se ignoran)
+    added = frontier.add_many(FRONTIER_KIND, load_restaurant_links(RESTAURANTES_LINKS_CSV))
+    print(f"Se agregaron {added} links nuevos al frontier. Estado: {frontier.counts(FRONTIER_KIND)}")
+    
+    # 2. Consulta indexada de links pendientes
+    if refresh_age_hours is None:
+        links_to_scrape = frontier.eligible(FRONTIER_KIND)
+    else:
+        links_to_scrape = frontier.refreshable(FRONTIER_KIND, refresh_age_hours * 3600)
+    
+    # 3. Aleatoriedad (Shuffle)
+    random.shuffle(links_to_scrape)
+    return links_to_scrape
+
+def guardar_menu(restaurant_data, salidas):
+    """Escribe el menú (JSONL) y sus productos aplanados (CSV y Parquet) en las salidas abiertas."""
+    with metrics.stage("flatten"):
+        productos = aplanar_productos([restaurant_data])
+    metrics.count("menus")
+    metrics.count("items", len(productos))
+    with metrics.stage("write"):
+        salidas.write("jsonl", [restaurant_data])
+        if "menus_parquet" in salidas.sinks:
+            menu = fila_menu(restaurant_data, datetime.date.today().isoformat())
+            salidas.write("menus_parquet", [menu])
+            salidas.write("productos_parquet", [
+                {**producto, 'crawl_date': menu['crawl_date'], 'zone': menu['zone']} for producto in productos
+            ])
+        if productos:
+            salidas.write("csv", productos)
+    if not productos:
+        print("  No se encontraron productos en este JSON-LD.")
+        return
+    print(f"  [Guardado] 1 menú y {len(productos)} productos en buffer.")
+
+def main(refresh_age_hours=None, parquet=False, host_rps=HOST_REQUESTS_PER_SECOND):
     print("--- Iniciando Proceso de Scraping de Menús (Modo Humano) ---")
     
-    # 1. Cargar datos
-    all_links = load_restaurant_links(RESTAURANTES_LINKS_CSV)
-    scraped_links = load_scraped_links_cache(LINKS_CACHE_FILE)
+    # abrir_salidas() va al final: se cierra primero y su checkpoint final
+    # todavía puede marcar links en el frontier
+    with Frontier(FRONTIER_DB) as frontier, ResponseArchive(ARCHIVE_DIR) as archive, \
+            abrir_salidas(parquet_dir=PARQUET_DIR if parquet else None) as salidas:
+        scrape_links(frontier, archive, salidas, refresh_age_hours, host_rps)
+
+    print("\n--- Proceso de Scraping de Menús Terminado ---")
+
+def siguiente_link(pendientes, reintentos):
+    """
+    Próximo link a pedir: primero los reintentos que ya cumplieron su pausa,
+    después los pendientes. Si solo quedan reintentos, espera al primero.
+    Devuelve (link, es_reintento) o (None, False) cuando no queda nada.
+    """
+    link = reintentos.pop_ready()
+    if link is not None:
+        return link, True
+    if pendientes:
+        return pendientes.popleft(), False
+    espera = reintentos.next_delay()
+    if espera is None:
+        return None, False
+    print(f"\nQuedan {len(reintentos)} links bloqueados por reintentar; esperando {espera:.0f}s...")
+    with metrics.stage("block_pause"):
+        time.sleep(espera)
+    return reintentos.pop_ready(), True
+
+def procesar_link(link, frontier, archive, salidas, controlador, renovar=None):
+    """
+    Pide un link al ritmo del controlador y registra el resultado en el
+    frontier. Devuelve True si hubo menú (o 304). Un bloqueo lanza BloqueoError
+    con el host y la pausa que le aplicó el controlador. `renovar` (modo cola)
+    extiende el lease antes y después de la espera y de la descarga; si
+    devuelve False tras la espera se lanza LeasePerdido sin pedir el link.
+    """
+    # 4. Ritmo adaptativo (AIMD): espera el turno del host
+    host = host_de(link)
+    if renovar is not None:
+        renovar()
+    with metrics.stage("pause"):
+        espera = controlador.wait(host)
+    if renovar is not None and not renovar():
+        raise LeasePerdido(link)
+    print(f"Pausa de {espera:.1f}s (ritmo actual {controlador.rate(host):.2f} req/s)")
+    
+    # 5. Cabeceras (Headers) Rotativas (+ condicionales si ya lo tenemos)
+    headers = construir_headers()
+    headers.update(headers_condicionales(frontier, link))
     
-    # 2. Filtrar links que ya tenemos
-    links_to_scrape = [link for link in all_links if link not in scraped_links]
+    try:
+        # 6. Ejecutar el scraping
+        status, restaurant_data, response_headers = descargar_menu(link, headers, archive)
+    except BloqueoError as e:
+        e.host = host
+        e.pausa = controlador.record(host, e.status, e.headers)
+        raise
+    controlador.record(host, status, response_headers)
+    if renovar is not None:
+        renovar()  # Cubre el tiempo hasta el checkpoint que lo completa
+    
+    if restaurant_data or status == 304:
+        # 7. Guardar incrementalmente (si cambió) y 8. Marcar como scrapeado
+        registrar_menu(link, status, restaurant_data, response_headers, frontier, salidas)
+        return True
+    frontier.mark_failed(FRONTIER_KIND, link, "sin JSON-LD o error HTTP")
+    return False
+
+def scrape_links(frontier, archive, salidas, refresh_age_hours=None, host_rps=HOST_REQUESTS_PER_SECOND):
+    """Bucle serial sobre los links pendientes del frontier, con ritmo adaptativo."""
+    links_to_scrape = cargar_links_pendientes(frontier, refresh_age_hours)
     
     if not links_to_scrape:
         print("¡No hay links nuevos que scrapear! Todo está al día.")
         return
 
-    # 3. Aleatoriedad (Shuffle)
-    random.shuffle(links_to_scrape)
     print(f"Se van a scrapear {len(links_to_scrape)} menús nuevos (en orden aleatorio).")
     
     total_links = len(links_to_scrape)
+    pendientes = deque(links_to_scrape)
+    reintentos = RetryQueue(MAX_BLOCK_RETRIES)
+    controlador = crear_controlador(host_rps)
+    procesados = 0
     
-    for i, link in enumerate(links_to_scrape):
-        
-        print(f"\n--- Procesando {i+1} de {total_links}: {link} ---")
-        
-        # 4. Ritmo (Pauses Aleatorias)
-        sleep_time = random.uniform(2.5, 4.0) # Pausa entre 2.5 y 4 segundos
-        print(f"Pausando por {sleep_time:.1f} segundos...")
-        time.sleep(sleep_time)
-        
-        # 5. Cabeceras (Headers) Rotativas
-        headers = {
-            'User-Agent': random.choice(USER_AGENTS),
-            'Accept-Language': 'es-CL,es;q=0.9',
-            'Referer': 'https.www.ubereats.com/' # Simular que venimos de la home
-        }
+    while True:
+        link, es_reintento = siguiente_link(pendientes, reintentos)
+        if link is None:
+            break
+        if es_reintento:
+            print(f"\n--- Reintento {reintentos.attempts(link)} de {MAX_BLOCK_RETRIES}: {link} ---")
+        else:
+            procesados += 1
+            print(f"\n--- Procesando {procesados} de {total_links}: {link} ---")
         
         try:
-            # 6. Ejecutar el scraping
-            restaurant_data = scrape_menu_restaurante(link, headers)
-            
-            if restaurant_data:
-                # 7. Guardar incrementalmente
-                guardar_datos_jsonl([restaurant_data], PRODUCTOS_JSONL_OUTPUT)
-                guardar_datos_csv([restaurant_data], PRODUCTOS_CSV_OUTPUT)
-                
-                # 8. Marcar como scrapeado
-                save_link_to_cache(link, LINKS_CACHE_FILE)
-            
-        except ConnectionRefusedError:
-            # 9. Resistencia a Fallos (Back-off)
-            print("[BLOQUEO DETECTADO] Pausa larga de 5 minutos...")
-            time.sleep(300) # Esperar 5 minutos
-            print("Continuando con el siguiente link (se reintentará este link en la próxima ejecución)...")
+            procesar_link(link, frontier, archive, salidas, controlador)
+        except BloqueoError as e:
+            # 9. Resistencia a Fallos: bajar el ritmo y reintentar el link más tarde
+            if reintentos.push(link, e.pausa):
+                print(f"[BLOQUEO DETECTADO] Ritmo reducido a {controlador.rate(e.host):.2f} req/s; "
+                      f"host en pausa {e.pausa:.0f}s. El link vuelve a la cola.")
+            else:
+                frontier.defer(FRONTIER_KIND, link, BLOCK_PAUSE_SECONDS, f"bloqueado {e.status}")
+                print(f"[BLOQUEO DETECTADO] Sin reintentos para {link}; se reintentará en la próxima ejecución.")
         except Exception as e:
             print(f"  [ERROR FATAL] Ocurrió un error inesperado con {link}: {e}")
-            # Guardar el link fallido para reintentar luego
-            save_link_to_cache(link + "_FAILED", LINKS_CACHE_FILE)
+            metrics.count("link_errors")
+            metrics.event("link_error", url=link, error=str(e))
+            # Registrar el fallo para reintentar luego (con back-off)
+            frontier.mark_failed(FRONTIER_KIND, link, str(e))
+    
+    metrics.event("rate_control", hosts=controlador.snapshot())
+
+# ==============================================================================
+# COLA COMPARTIDA ENTRE MÁQUINAS (--queue)
+# ==============================================================================
+
+def main_cola(queue_url, seed=False, refresh_age_hours=None, parquet=False, host_rps=HOST_REQUESTS_PER_SECOND,
+              worker_id=None):
+    """
+    Igual que main(), pero los links salen de una cola compartida con leases,
+    así que se pueden sumar workers en otras máquinas. Con `seed` primero se
+    encolan los links pendientes según el frontier local. Cada máquina escribe
+    sus propias salidas.
+    """
+    worker_id = worker_id or default_worker_id()
+    print(f"--- Iniciando Proceso de Scraping de Menús (Cola compartida, worker {worker_id}) ---")
+
+    with open_work_queue(queue_url, lease_seconds=QUEUE_LEASE_SECONDS) as cola, Frontier(FRONTIER_DB) as frontier, \
+            ResponseArchive(ARCHIVE_DIR) as archive, \
+            abrir_salidas(parquet_dir=PARQUET_DIR if parquet else None) as salidas:
+        if seed:
+            sembrar_cola(cola, frontier, refresh_age_hours)
+        scrape_links_cola(cola, frontier, archive, salidas, worker_id, host_rps)
 
     print("\n--- Proceso de Scraping de Menús Terminado ---")
 
+def sembrar_cola(cola, frontier, refresh_age_hours=None):
+    """Encola los links pendientes (en modo refresco, también los ya terminados en la cola)."""
+    links = cargar_links_pendientes(frontier, refresh_age_hours)
+    added = cola.enqueue_many(FRONTIER_KIND, links, requeue_finished=refresh_age_hours is not None)
+    print(f"Se encolaron {added} de {len(links)} links. Estado de la cola: {cola.counts(FRONTIER_KIND)}")
+
+def scrape_links_cola(cola, frontier, archive, salidas, worker_id, host_rps=HOST_REQUESTS_PER_SECOND):
+    """
+    Toma links de la cola de a uno y los procesa como el bucle serial. Un
+    link se completa en la cola recién cuando su menú es durable; hasta
+    entonces su lease se sigue renovando junto con el del link en curso. Un
+    bloqueo lo devuelve a la cola (como intento fallido) con la pausa del
+    host, para que lo tome quien esté libre cuando termine.
+    """
+    controlador = crear_controlador(host_rps)
+    por_completar = {}  # link -> lease guardado que espera el próximo checkpoint
+    procesados = 0
+
+    def renovar(lease):
+        for pendiente in list(por_completar.values()):
+            cola.renew(pendiente)
+        return cola.renew(lease)
+
+    def completar(lease):
+        por_completar.pop(lease.key, None)
+        if not cola.complete(lease):
+            # Otro worker lo retomó: su resultado manda en la cola
+            print(f"  [Cola] El lease de {lease.key} había vencido; otro worker lo retomó.")
+            metrics.count("leases_lost")
+            metrics.event("lease_lost", url=lease.key, stage="complete")
+
+    while True:
+        leases = cola.claim(FRONTIER_KIND, worker_id, lease_seconds=QUEUE_LEASE_SECONDS)
+        if not leases:
+            espera = cola.next_due(FRONTIER_KIND)
+            if espera is None or espera > QUEUE_MAX_WAIT_SECONDS:
+                break
+            with metrics.stage("queue_wait"):
+                time.sleep(max(espera, 1.0))
+            continue
+
+        lease = leases[0]
+        link = lease.key
+        procesados += 1
+        print(f"\n--- Procesando {procesados} (intento {lease.attempts}): {link} ---")
+        try:
+            if procesar_link(link, frontier, archive, salidas, controlador, renovar=lambda: renovar(lease)):
+                por_completar[link] = lease
+                salidas.after_durable(lambda lease=lease: completar(lease))
+            else:
+                cola.fail(lease, "sin JSON-LD o error HTTP")
+        except LeasePerdido:
+            print(f"  [Cola] El lease de {link} venció esperando al host; se omite.")
+            metrics.count("leases_lost")
+            metrics.event("lease_lost", url=link, stage="wait")
+        except BloqueoError as e:
+            print(f"[BLOQUEO DETECTADO] Ritmo reducido a {controlador.rate(e.host):.2f} req/s; "
+                  f"el link vuelve a la cola por {e.pausa:.0f}s.")
+            # Cuenta como intento: un link que siempre se bloquea termina como 'dead'
+            cola.fail(lease, f"bloqueado {e.status}", retry_in=e.pausa)
+        except Exception as e:
+            print(f"  [ERROR FATAL] Ocurrió un error inesperado con {link}: {e}")
+            metrics.count("link_errors")
+            metrics.event("link_error", url=link, error=str(e))
+            frontier.mark_failed(FRONTIER_KIND, link, str(e))
+            cola.fail(lease, str(e))
+
+    print(f"\nNo quedan links por tomar. Estado de la cola: {cola.counts(FRONTIER_KIND)}")
+    metrics.event("rate_control", hosts=controlador.snapshot())
+
+# ==============================================================================
+# FUNCIÓN PRINCIPAL CONCURRENTE (--async)
+# ==============================================================================
+
+async def main_async(concurrency=ASYNC_CONCURRENCY, host_rps=HOST_REQUESTS_PER_SECOND, refresh_age_hours=None,
+                     parquet=False):
+    """
+    Igual que main(), pero con varias requests en vuelo sobre una sesión
+    keep-alive compartida. El controlador AIMD reparte el ritmo por host
+    entre todas las requests en vuelo.
+    """
+    print(f"--- Iniciando Proceso de Scraping de Menús (Concurrente x{concurrency}, hasta {host_rps} req/s por host) ---")
+    
+    with Frontier(FRONTIER_DB) as frontier, ResponseArchive(ARCHIVE_DIR) as archive, \
+            abrir_salidas(parquet_dir=PARQUET_DIR if parquet else None) as salidas:
+        await scrape_links_async(frontier, archive, salidas, concurrency, host_rps, refresh_age_hours)
+
+    print("\n--- Proceso de Scraping de Menús Terminado ---")
+
+async def scrape_links_async(frontier, archive, salidas, concurrency, host_rps, refresh_age_hours=None):
+    """Versión concurrente de scrape_links()."""
+    links_to_scrape = cargar_links_pendientes(frontier, refresh_age_hours)
+    
+    if not links_to_scrape:
+        print("¡No hay links nuevos que scrapear! Todo está al día.")
+        return
+
+    print(f"Se van a scrapear {len(links_to_scrape)} menús nuevos (en orden aleatorio).")
+
+    # La URL absoluta es la que vuelve en cada resultado; el cache guarda el link original
+    link_por_url = {url_completa(link): link for link in links_to_scrape}
+    controlador = crear_controlador(host_rps)
+    total_links = len(link_por_url)
+    
+    procesados = 0
+    async for result in fetch_all(
+        list(link_por_url),
+        headers_factory=construir_headers,
+        extra_headers=lambda url: headers_condicionales(frontier, link_por_url[url]),
+        concurrency=concurrency,
+        budget=controlador,
+        retry_queue=RetryQueue(MAX_BLOCK_RETRIES),
+    ):
+        procesados += 1
+        link = link_por_url[result.url]
+        print(f"\n--- Procesado {procesados} de {total_links}: {link} ({result.status}) ---")
+        metrics.observe("fetch", result.elapsed)
+        if result.status is not None:
+            metrics.count("http_status", code=result.status)
+
+        if result.blocked:
+            # fetch_all ya lo reintentó MAX_BLOCK_RETRIES veces; queda para la próxima ejecución
+            print(f"  [ERROR BLOQUEO] {result.status} en {result.url} tras {MAX_BLOCK_RETRIES} reintentos. Se reintentará en la próxima ejecución.")
+            metrics.count("blocks", code=result.status)
+            metrics.event("block", url=result.url, status=result.status)
+            frontier.defer(FRONTIER_KIND, link, BLOCK_PAUSE_SECONDS, f"bloqueado {result.status}")
+            continue
+        if result.error:
+            print(f"  [Error] {result.error} al scrapear {result.url}", file=sys.stderr)
+            metrics.count("fetch_errors", error=result.error.split(":", 1)[0])
+            frontier.mark_failed(FRONTIER_KIND, link, result.error)
+            continue
+        if result.status == 304:
+            registrar_menu(link, 304, None, result.headers, frontier, salidas)
+            continue
+        if not result.ok:
+            print(f"  [Error HTTP] {result.status} al scrapear {result.url}", file=sys.stderr)
+            frontier.mark_failed(FRONTIER_KIND, link, f"HTTP {result.status}")
+            continue
+
+        try:
+            with metrics.stage("archive"):
+                archive.put(ARCHIVE_KIND, result.url, result.text, status=result.status)
+            with metrics.stage("parse"):
+                restaurant_data = extraer_json_ld(result.text, result.url)
+            if restaurant_data:
+                registrar_menu(link, result.status, restaurant_data, result.headers, frontier, salidas)
+            else:
+                frontier.mark_failed(FRONTIER_KIND, link, "sin JSON-LD")
+        except json.JSONDecodeError:
+            print(f"  [Error] No se pudo decodificar el JSON de {result.url}", file=sys.stderr)
+            metrics.count("parse_errors")
+            frontier.mark_failed(FRONTIER_KIND, link, "JSON-LD inválido")
+        except Exception as e:
+            print(f"  [ERROR FATAL] Ocurrió un error inesperado con {link}: {e}")
+            metrics.count("link_errors")
+            metrics.event("link_error", url=link, error=str(e))
+            frontier.mark_failed(FRONTIER_KIND, link, str(e))
+
+    metrics.event("rate_control", hosts=controlador.snapshot())
+
+# ==============================================================================
+# REPROCESAMIENTO SIN RED (--replay)
+# ==============================================================================
+
+def rango_del_dia(fecha):
+    """(desde, hasta) en timestamps locales para una fecha 'YYYY-MM-DD' (o (None, None))."""
+    if not fecha:
+        return None, None
+    inicio = datetime.datetime.fromisoformat(fecha)
+    fin = inicio + datetime.timedelta(days=1)
+    return inicio.timestamp(), fin.timestamp()
+
+def replay_menus(fecha=None, output_dir=REPLAY_OUTPUT_DIR, parquet=False):
+    """
+    Corre extracción, aplanado y guardado sobre las páginas archivadas
+    (la versión más reciente de cada URL, opcionalmente solo de un día),
+    sin tocar la red ni el frontier. La salida va a `output_dir`.
+    """
+    print(f"--- Reprocesando menús archivados{f' del {fecha}' if fecha else ''} ---")
+    since, until = rango_del_dia(fecha)
+
+    # La salida del replay se regenera completa en cada ejecución
+    shutil.rmtree(output_dir, ignore_errors=True)
+    jsonl_filename = os.path.join(output_dir, "productos_completo.jsonl")
+    csv_filename = os.path.join(output_dir, "productos.csv")
+
+    procesados = 0
+    sin_menu = 0
+    started = time.time()
+    parquet_dir = os.path.join(output_dir, "parquet") if parquet else None
+    with ResponseArchive(ARCHIVE_DIR) as archive, abrir_salidas(jsonl_filename, csv_filename, parquet_dir) as salidas:
+        for response in archive.iter_latest(ARCHIVE_KIND, since=since, until=until):
+            procesados += 1
+            try:
+                with metrics.stage("parse"):
+                    restaurant_data = extraer_json_ld(response.text(), response.url)
+            except json.JSONDecodeError:
+                print(f"  [Error] No se pudo decodificar el JSON de {response.url}", file=sys.stderr)
+                restaurant_data = None
+            if restaurant_data:
+                guardar_menu(restaurant_data, salidas)
+            else:
+                sin_menu += 1
+
+    print(f"\n--- Replay terminado: {procesados} páginas ({sin_menu} sin menú) en {time.time() - started:.1f}s -> '{output_dir}' ---")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Scraping de menús de Uber Eats (JSON-LD).")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="Usar el motor concurrente en vez del bucle serial.")
+    parser.add_argument("--concurrency", type=int, default=ASYNC_CONCURRENCY,
+                        help="Requests en vuelo a la vez (solo con --async).")
+    parser.add_argument("--host-rps", type=float, default=HOST_REQUESTS_PER_SECOND,
+                        help="Ritmo máximo (req/s por host) al que puede subir el controlador adaptativo.")
+    parser.add_argument("--queue", default=QUEUE_URL,
+                        help="Cola compartida (postgresql://... o archivo SQLite) de donde tomar los links; "
+                             "por defecto $CRAWL_QUEUE_URL. No se combina con --async.")
+    parser.add_argument("--seed-queue", action="store_true",
+                        help="Con --queue, encolar antes los links pendientes del frontier local.")
+    parser.add_argument("--worker-id", default=None,
+                        help="Nombre del worker en la cola (por defecto host:pid).")
+    parser.add_argument("--refresh", action="store_true",
+                        help="Volver a pedir también los menús ya scrapeados (con cabeceras condicionales).")
+    parser.add_argument("--refresh-age-hours", type=float, default=REFRESH_AGE_HOURS,
+                        help="Antigüedad mínima de un menú para refrescarlo (solo con --refresh).")
+    parser.add_argument("--parquet", action="store_true",
+                        help="Escribir también productos y menús en Parquet (data/parquet/, requiere pyarrow).")
+    parser.add_argument("--replay", action="store_true",
+                        help="Reprocesar las páginas archivadas sin red (salida en data/replay/menus/).")
+    parser.add_argument("--replay-date", default=None,
+                        help="Con --replay, usar solo lo descargado ese día (YYYY-MM-DD).")
+    return parser.parse_args()
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    args = parse_args()
+    refresh_age_hours = args.refresh_age_hours if args.refresh else None
+    metrics.configure("04_extraer_comida_restaurante", METRICS_DIR)
+    try:
+        if args.replay:
+            replay_menus(args.replay_date, parquet=args.parquet)
+        elif args.queue:
+            main_cola(args.queue, args.seed_queue, refresh_age_hours, parquet=args.parquet, host_rps=args.host_rps,
+                      worker_id=args.worker_id)
+        elif args.use_async:
+            asyncio.run(main_async(args.concurrency, args.host_rps, refresh_age_hours, parquet=args.parquet))
+        else:
+            main(refresh_age_hours, parquet=args.parquet, host_rps=args.host_rps)
+    finally:
+        print(metrics.summary())